@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""Cold start benchmark for the command line interface.
+
+Measures the time to import lyricsmaster and to run 'lyricsmaster --help' in a fresh interpreter, and checks that
+the heavy dependencies are not imported by them.
+
+    $ python benchmarks/import_time.py [runs]
+
+"""
+
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ('bs4', 'lxml', 'urllib3', 'gevent', 'stem', 'lyricsmaster.providers')
+
+SNIPPETS = {
+    'import lyricsmaster': 'import lyricsmaster',
+    'lyricsmaster --help': 'import sys; sys.argv = ["lyricsmaster", "--help"]\n'
+                           'from lyricsmaster.cli import main\n'
+                           'try:\n    main()\nexcept SystemExit:\n    pass',
+    'import lyricsmaster.providers': 'import lyricsmaster.providers',
+}
+
+
+def run(code, runs):
+    """
+    Runs the supplied code in fresh interpreters and returns the best wall time.
+
+    :param code: string.
+    :param runs: integer.
+    :return: float.
+        Seconds.
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', code], stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def loaded_heavy_modules(code):
+    """
+    Lists the heavy modules imported by the supplied code.
+
+    :param code: string.
+    :return: list.
+    """
+    check = code + '\nimport sys\nprint("heavy:" + ",".join(m for m in {0!r} if m in sys.modules))'.format(
+        HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', check]).decode('utf-8').splitlines()
+    heavy = [line[len('heavy:'):] for line in output if line.startswith('heavy:')][-1]
+    return [module for module in heavy.split(',') if module]
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline = run('pass', runs)
+    for name, code in SNIPPETS.items():
+        print('{0:<32} {1:7.1f} ms (interpreter startup excluded)  heavy modules: {2}'.format(
+            name, (run(code, runs) - baseline) * 1000, ', '.join(loaded_heavy_modules(code)) or 'none'))
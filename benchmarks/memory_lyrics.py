@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""Memory benchmark for the lyrics storage of Song objects.
+
+Builds a Discography of 100k songs with and without lyrics compression and reports the memory held by the songs.
+
+    $ python benchmarks/memory_lyrics.py [number_of_songs]
+
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+
+from lyricsmaster.models import Song, Album, Discography
+
+WORDS = ('baby', 'love', 'money', 'night', 'street', 'dream', 'never', 'again', 'back', 'in', 'the', 'days',
+         'remember', 'we', 'used', 'to', 'ride', 'all', 'yeah', 'brooklyn', 'gonna', 'make', 'it', 'real')
+
+
+def make_lyrics(rng):
+    """
+    Generates lyrics of a typical size (around 2kB) with a repeated chorus.
+
+    :param rng: random.Random object.
+    :return: string.
+    """
+    verse = lambda: '\n'.join(' '.join(rng.choice(WORDS) for _ in range(8)) for _ in range(8))
+    chorus = '\n'.join(' '.join(rng.choice(WORDS) for _ in range(6)) for _ in range(4))
+    return '\n\n'.join((verse(), chorus, verse(), chorus, verse(), chorus))
+
+
+def build_discography(number_of_songs, lyrics, compression=None):
+    """
+    Builds a Discography holding the supplied number of songs, 20 songs per album.
+
+    :param number_of_songs: integer.
+    :param lyrics: list.
+        Utf-8 encoded lyrics to cycle through.
+    :param compression: integer.
+        Zlib compression level of the lyrics, or None.
+    :return: models.Discography object.
+    """
+    albums = []
+    for i in range(0, number_of_songs, 20):
+        title = 'Album {0}'.format(i // 20)
+        # Decoding creates a new lyrics object for each song, as parsing the downloaded pages does.
+        songs = [Song('Song {0}'.format(j), title, 'Artist', lyrics[j % len(lyrics)].decode('utf-8'), 'Writer',
+                      compression)
+                 for j in range(i, min(i + 20, number_of_songs))]
+        albums.append(Album(title, 'Artist', songs))
+    return Discography('Artist', albums)
+
+
+def measure(number_of_songs, lyrics, compression):
+    """
+    Measures the memory allocated to build the discography and the time to read back all the lyrics.
+
+    :return: tuple(integer, float).
+        Allocated bytes and read time in seconds.
+    """
+    tracemalloc.start()
+    discography = build_discography(number_of_songs, lyrics, compression)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for album in discography:
+        for song in album:
+            song.lyrics
+    return allocated, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    number_of_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(0)
+    lyrics = [make_lyrics(rng).encode('utf-8') for _ in range(1000)]
+    for compression in (None, 1, 6):
+        allocated, read_time = measure(number_of_songs, lyrics, compression)
+        print('compression={0!s:<5} songs={1} memory={2:8.1f} MB read all lyrics={3:.2f}s'.format(
+            compression, number_of_songs, allocated / 2 ** 20, read_time))
@@ -6,12 +6,28 @@ __author__ = """SekouD"""
 __email__ = 'sekoud.python@gmail.com'
 __version__ = '2.8.1'
 
-from .providers import LyricWiki, AzLyrics, Genius, MusixMatch, Lyrics007
-from .utils import TorController
-
-CURRENT_PROVIDERS = {'lyricwiki': LyricWiki,
-                     'azlyrics': AzLyrics,
-                     'genius': Genius,
-                     'musixmatch': MusixMatch,
-                     'lyrics007': Lyrics007,
-                     }
+from importlib import import_module
+
+from .registry import ProviderRegistry
+
+CURRENT_PROVIDERS = ProviderRegistry()
+
+# The providers and the Tor controller pull in bs4, lxml, urllib3, gevent and stem.
+# They are only imported when they are first accessed.
+_lazy_attributes = {'LyricWiki': 'providers',
+                    'AzLyrics': 'providers',
+                    'Genius': 'providers',
+                    'MusixMatch': 'providers',
+                    'Lyrics007': 'providers',
+                    'TorController': 'utils',
+                    }
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        return getattr(import_module('.' + _lazy_attributes[name], __name__), name)
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_attributes))
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+"""Raw page archive.
+
+Providers given a WarcWriter archive every page they download in a WARC file, along with metadata records telling
+which song, album and artist each lyrics page belongs to. When a provider's extraction hooks are fixed, the lyrics
+can then be extracted again from the archive without downloading anything::
+
+    from lyricsmaster.archive import WarcWriter, reextract
+
+    with WarcWriter('2pac.warc.gz') as archive:
+        LyricWiki(archive=archive).get_lyrics('2Pac')
+    for discography in reextract('2pac.warc.gz'):
+        discography.save()
+
+Each record is compressed in its own gzip member, as usual for .warc.gz files.
+
+"""
+
+import gzip
+import json
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from itertools import islice
+from multiprocessing import Pool
+
+WARC_VERSION = b'WARC/1.0'
+# Headers of the archived responses which do not describe the stored body, as it is decoded.
+_skipped_headers = ('content-encoding', 'transfer-encoding', 'content-length')
+
+
+class WarcRecord(object):
+    """
+    Record of a WARC file.
+
+    :param headers: dict.
+        WARC headers.
+    :param block: bytes.
+        Content of the record.
+    """
+    __slots__ = ('headers', 'block')
+
+    def __init__(self, headers, block):
+        self.headers = headers
+        self.block = block
+
+    def __repr__(self):
+        return '{0}.{1}({2}, {3})'.format(__name__, self.__class__.__name__, self.type, self.target_uri)
+
+    @property
+    def type(self):
+        """
+        Type of the record, e.g. 'response' or 'metadata'.
+
+        :return: string.
+        """
+        return self.headers.get('WARC-Type')
+
+    @property
+    def target_uri(self):
+        """
+        Url of the archived page.
+
+        :return: string or None.
+        """
+        return self.headers.get('WARC-Target-URI')
+
+    def http_response(self):
+        """
+        Splits the block of a response record into the status and body of the archived response.
+
+        :return: tuple(integer, bytes).
+        """
+        head, _, body = self.block.partition(b'\r\n\r\n')
+        status = int(head.split(b'\r\n', 1)[0].split()[1])
+        return status, body
+
+
+class WarcWriter(object):
+    """
+    Writes the pages downloaded by providers into a WARC file.
+    Records are appended, so an archive can span several crawls.
+
+    :param path: string.
+        Path of the .warc.gz file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        if not self.file.tell():
+            self._write_record('warcinfo', None, 'application/warc-fields',
+                               b'software: lyricsmaster\r\nformat: WARC File Format 1.0\r\n')
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_record(self, record_type, url, content_type, block, extra_headers=()):
+        """
+        Appends a record to the archive.
+
+        :param record_type: string.
+        :param url: string or None.
+            Target url of the record.
+        :param content_type: string.
+        :param block: bytes.
+        :param extra_headers: iterable.
+            Other (name, value) headers.
+        """
+        headers = [('WARC-Type', record_type),
+                   ('WARC-Record-ID', '<urn:uuid:{0}>'.format(uuid.uuid4())),
+                   ('WARC-Date', datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'))]
+        if url:
+            headers.append(('WARC-Target-URI', url))
+        headers.extend(extra_headers)
+        headers.extend([('Content-Type', content_type), ('Content-Length', str(len(block)))])
+        record = b'\r\n'.join([WARC_VERSION] + ['{0}: {1}'.format(*header).encode('utf-8') for header in headers])
+        self.file.write(gzip.compress(record + b'\r\n\r\n' + block + b'\r\n\r\n'))
+        self.file.flush()
+
+    def write_response(self, url, status, headers, body, truncated=False):
+        """
+        Archives a downloaded page.
+
+        :param url: string.
+        :param status: integer.
+            Http status of the response.
+        :param headers: dict.
+            Http headers of the response.
+        :param body: bytes.
+            Decoded body of the response.
+        :param truncated: bool.
+            Whether the download was stopped before the end of the page.
+        """
+        lines = ['HTTP/1.1 {0}'.format(status)]
+        lines.extend('{0}: {1}'.format(name, value) for name, value in headers.items()
+                     if name.lower() not in _skipped_headers)
+        lines.append('Content-Length: {0}'.format(len(body)))
+        block = '\r\n'.join(lines).encode('utf-8') + b'\r\n\r\n' + body
+        extra_headers = [('WARC-Truncated', 'length')] if truncated else []
+        self._write_record('response', url, 'application/http; msgtype=response', block, extra_headers)
+
+    def write_metadata(self, url, metadata):
+        """
+        Archives metadata about a page, e.g. the song of a lyrics page.
+
+        :param url: string.
+            Url of the page.
+        :param metadata: dict.
+        """
+        self._write_record('metadata', url, 'application/json', json.dumps(metadata).encode('utf-8'))
+
+    def close(self):
+        """
+        Closes the archive file.
+
+        """
+        self.file.close()
+
+
+def iter_records(path):
+    """
+    Reads the records of a WARC file.
+
+    :param path: string.
+        Path of a .warc.gz file.
+    :return: iterator.
+        WarcRecord objects.
+    """
+    with gzip.open(path, 'rb') as file:
+        while True:
+            line = file.readline()
+            if not line:
+                return
+            if not line.strip():
+                continue
+            headers = {}
+            for line in iter(file.readline, b'\r\n'):
+                name, _, value = line.decode('utf-8').partition(':')
+                headers[name.strip()] = value.strip()
+            block = file.read(int(headers['Content-Length']))
+            yield WarcRecord(headers, block)
+
+
+def read_songs(path):
+    """
+    Reads the song metadata of a WARC file written by a WarcWriter, without keeping the archived pages in memory.
+
+    :param path: string.
+        Path of a .warc.gz file.
+    :return: tuple(list, dict).
+        Song metadata, in the order they were archived, and position in the file of the last archived response of
+        each url.
+    """
+    songs = []
+    last_responses = {}
+    for position, record in enumerate(iter_records(path)):
+        if record.type == 'response':
+            last_responses[record.target_uri] = position
+        elif record.type == 'metadata':
+            metadata = json.loads(record.block.decode('utf-8'))
+            metadata['url'] = record.target_uri
+            songs.append(metadata)
+    return songs, last_responses
+
+
+def iter_responses(path, positions):
+    """
+    Reads the archived responses at the supplied positions of a WARC file, one at a time.
+
+    :param path: string.
+        Path of a .warc.gz file.
+    :param positions: set.
+        Positions of the records in the file, as returned by read_songs().
+    :return: iterator.
+        (position, url, status, body) tuples, in file order.
+    """
+    for position, record in enumerate(iter_records(path)):
+        if position in positions:
+            status, body = record.http_response()
+            yield position, record.target_uri, status, body
+
+
+# Providers of the extraction processes, by name.
+_providers = {}
+
+
+def _extract(task):
+    """
+    Extracts the lyrics and writers of an archived lyrics page with the hooks of the supplied provider.
+    Runs in the extraction processes.
+
+    :param task: tuple(string, bytes).
+        Provider name and raw lyrics page.
+    :return: tuple(string, string) or None.
+        Lyrics and writers. None if the page has no lyrics.
+    """
+    provider_name, raw_html = task
+    if provider_name not in _providers:
+        from . import CURRENT_PROVIDERS
+        _providers[provider_name] = CURRENT_PROVIDERS[provider_name]()
+    provider = _providers[provider_name]
+    lyrics_page = provider._parse(raw_html)
+    if not provider._has_lyrics(lyrics_page):
+        return None
+    lyrics = provider.extract_lyrics(lyrics_page)
+    if lyrics is None:
+        return None
+    return lyrics, provider.extract_writers(lyrics_page)
+
+
+def _batches(iterable, size):
+    """
+    Splits an iterable in lists of at most 'size' items.
+
+    :param iterable: iterable.
+    :param size: integer.
+    :return: iterator.
+        Lists of items.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _build_discography(artist, songs, extracted):
+    """
+    Builds the discography of an artist from its archived songs and their extracted lyrics.
+
+    :param artist: string.
+    :param songs: list.
+        Song metadata of the artist, in the order they were archived.
+    :param extracted: dict.
+        Maps the urls of the lyrics pages to their (lyrics, writers), or None if the page has no lyrics.
+    :return: models.Discography object or None.
+        None if none of the songs has lyrics.
+    """
+    from .models import Song, Album, Discography
+
+    albums = OrderedDict()
+    song_objects = {}
+    for song in songs:
+        if not extracted.get(song['url']):
+            continue
+        if song['album'] not in albums:
+            albums[song['album']] = Album(song['album'], artist, [], song.get('release_date', 'Unknown'))
+        if song['url'] not in song_objects:
+            lyrics, writers = extracted[song['url']]
+            song_objects[song['url']] = Song(song['title'], song['album'], artist, lyrics, writers)
+        # Songs listed on several albums are shared by the albums, as in a crawl.
+        if song_objects[song['url']] not in albums[song['album']].songs:
+            albums[song['album']].songs.append(song_objects[song['url']])
+    return Discography(artist, list(albums.values())) if albums else None
+
+
+def reextract(path, provider=None, processes=None, batch_size=256):
+    """
+    Extracts the lyrics of the songs archived in a WARC file again, without network traffic.
+    The archive is streamed: the lyrics pages are read 'batch_size' at a time and parsed in parallel by 'processes'
+    processes, and each discography is returned as soon as the last page of its artist is parsed.
+
+    :param path: string.
+        Path of a .warc.gz file written by a WarcWriter.
+    :param provider: string.
+        Name of the provider whose extraction hooks are used. Defaults to the provider which archived each song.
+    :param processes: integer.
+        Number of extraction processes. Defaults to the number of cores. With 1, pages are parsed in this process.
+    :param batch_size: integer.
+        Number of pages read from the archive and parsed at a time.
+    :return: iterator.
+        models.Discography objects, one per artist, in the order the last page of their artist was archived.
+    """
+    songs, last_responses = read_songs(path)
+    artists = OrderedDict()
+    providers = {}
+    for song in songs:
+        if song['url'] in last_responses:
+            artists.setdefault(song['artist'], []).append(song)
+            providers.setdefault(song['url'], (provider or song['provider']).lower())
+    # Position of the last page of each artist, once parsed the discography of the artist is complete.
+    artist_ends = dict((artist, max(last_responses[song['url']] for song in artist_songs))
+                       for artist, artist_songs in artists.items())
+    # Number of artists whose discography still needs the lyrics of each url.
+    users = Counter(url for artist_songs in artists.values() for url in set(song['url'] for song in artist_songs))
+    pool = Pool(processes) if processes != 1 else None
+    try:
+        extracted = {}
+        responses = iter_responses(path, set(last_responses[url] for url in providers))
+        for batch in _batches(responses, batch_size):
+            tasks = [(providers[url], body) for position, url, status, body in batch]
+            results = pool.map(_extract, tasks, chunksize=16) if pool else map(_extract, tasks)
+            extracted.update(zip([url for position, url, status, body in batch], results))
+            finished = [artist for artist in artists if artist_ends[artist] <= batch[-1][0]]
+            for artist in finished:
+                artist_songs = artists.pop(artist)
+                discography = _build_discography(artist, artist_songs, extracted)
+                for url in set(song['url'] for song in artist_songs):
+                    users[url] -= 1
+                    if not users[url]:
+                        del extracted[url]
+                if discography is not None:
+                    yield discography
+    finally:
+        if pool is not None:
+            pool.terminate()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+"""Local artist index.
+
+Providers finding artist pages with a search request can instead look artists up in an index built from their
+A-Z artist listings. The listings are crawled once and refreshed page by page when they get old::
+
+    provider = AzLyrics()
+    index = provider.update_artist_index(ArtistIndex.load('azlyrics.json'), max_age=30 * 24 * 3600)
+    index.save('azlyrics.json')
+    provider.get_lyrics('2Pac')  # The artist url is found in the index.
+
+"""
+
+import json
+import os
+import time
+from bisect import bisect_left
+from codecs import open
+
+from .matching import TitleIndex, normalize_title
+
+
+class ArtistIndex(object):
+    """
+    Index of the artists of a provider, mapping normalized artist names to artist page urls.
+    Names are kept sorted, so exact and prefix lookups are binary searches. Fuzzy lookups use a TitleIndex.
+
+    :param listings: dict.
+        Maps the urls of the listing pages to the time they were crawled and the (name, url) of their artists.
+    :param provider: string.
+        Name of the provider whose artists are indexed. None until the index is first updated by a provider.
+    """
+    __slots__ = ('listings', 'provider', 'keys', 'artists', '_title_index')
+
+    def __init__(self, listings=None, provider=None):
+        self.listings = listings or {}
+        self.provider = provider
+        self._build()
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def _build(self):
+        """
+        Builds the sorted lookup lists from the listings.
+
+        """
+        artists = {}
+        for fetched, listing_artists in self.listings.values():
+            for name, url in listing_artists:
+                artists.setdefault(normalize_title(name), (name, url))
+        self.keys = sorted(artists)
+        self.artists = [artists[key] for key in self.keys]
+        self._title_index = None
+
+    def _find(self, key):
+        """
+        Finds the position of the supplied normalized name.
+
+        :param key: string.
+        :return: integer or None.
+        """
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return position
+        return None
+
+    def get(self, name):
+        """
+        Looks up the url of the artist page of the supplied artist.
+        Names are matched with and without a leading 'the'.
+
+        :param name: string.
+            Artist name.
+        :return: string or None.
+            Artist page url. None if the artist is not in the index.
+        """
+        key = normalize_title(name)
+        alternative_key = key[4:] if key.startswith('the ') else 'the ' + key
+        for key in (key, alternative_key):
+            position = self._find(key)
+            if position is not None:
+                return self.artists[position][1]
+        return None
+
+    def prefix(self, prefix, limit=10):
+        """
+        Lists the artists whose normalized name starts with the supplied prefix.
+
+        :param prefix: string.
+        :param limit: integer.
+            Maximum number of artists.
+        :return: list.
+            (name, url) of the artists, sorted by name.
+        """
+        key = normalize_title(prefix)
+        position = bisect_left(self.keys, key)
+        artists = []
+        while position < len(self.keys) and self.keys[position].startswith(key) and len(artists) < limit:
+            artists.append(self.artists[position])
+            position += 1
+        return artists
+
+    def search(self, name, threshold=0.8):
+        """
+        Finds the artists whose name is similar to the supplied name.
+
+        :param name: string.
+        :param threshold: float.
+            Minimum similarity between 0 and 1.
+        :return: list.
+            (name, url) of the artists, best matches first.
+        """
+        if self._title_index is None:
+            self._title_index = TitleIndex(self.artists, key=lambda artist: artist[0])
+        return self._title_index.search(name, threshold)
+
+    def is_stale(self, listing_url, max_age=None):
+        """
+        Checks if a listing page needs to be crawled.
+
+        :param listing_url: string.
+        :param max_age: float.
+            Seconds after which a listing page is crawled again. None to only crawl the missing pages.
+        :return: bool.
+        """
+        if listing_url not in self.listings:
+            return True
+        return max_age is not None and self.listings[listing_url][0] + max_age < time.time()
+
+    def update_listings(self, listings):
+        """
+        Replaces the artists of the supplied listing pages.
+
+        :param listings: dict.
+            Maps the urls of the listing pages to the (name, url) of their artists.
+        """
+        now = time.time()
+        for listing_url, artists in listings.items():
+            self.listings[listing_url] = (now, [tuple(artist) for artist in artists])
+        self._build()
+
+    def save(self, path):
+        """
+        Saves the index in a json file.
+
+        :param path: string.
+            Path of the json file.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'provider': self.provider, 'listings': self.listings}, file)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index saved in a json file. An empty index is returned if the file does not exist.
+
+        :param path: string.
+            Path of the json file.
+        :return: ArtistIndex object.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as file:
+            saved = json.load(file)
+        return cls(dict((url, (fetched, [tuple(artist) for artist in artists]))
+                        for url, (fetched, artists) in saved['listings'].items()), saved.get('provider'))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""Negative cache.
+
+Remembers the artists and lyrics pages which providers do not have, so that known misses cost no request.
+Misses expire after a time to live, as providers add artists and songs over time. The cache can be saved to a json
+file and reloaded by the next runs::
+
+    cache = NegativeCache.load('misses.json')
+    LyricWiki(negative_cache=cache).get_lyrics('2Pac')
+    cache.save('misses.json')
+
+"""
+
+import json
+import os
+import time
+from codecs import open
+
+
+class NegativeCache(object):
+    """
+    Cache of the missing artists and lyrics pages.
+
+    :param ttl: float.
+        Seconds after which a miss is checked again.
+    :param entries: dict.
+        Maps the keys of the misses, e.g. urls, to the time at which they expire.
+    """
+    __slots__ = ('ttl', 'entries')
+
+    def __init__(self, ttl=7 * 24 * 3600, entries=None):
+        self.ttl = ttl
+        self.entries = entries or {}
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        expires = self.entries.get(key)
+        if expires is None:
+            return False
+        if expires < time.time():
+            del self.entries[key]
+            return False
+        return True
+
+    def add(self, key):
+        """
+        Caches a miss.
+
+        :param key: string.
+            Key of the miss, e.g. the url of a missing page.
+        """
+        self.entries[key] = time.time() + self.ttl
+
+    def save(self, path):
+        """
+        Saves the misses which have not expired in a json file.
+
+        :param path: string.
+            Path of the json file.
+        """
+        now = time.time()
+        entries = dict((key, expires) for key, expires in self.entries.items() if expires >= now)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'ttl': self.ttl, 'entries': entries}, file)
+
+    @classmethod
+    def load(cls, path, ttl=None):
+        """
+        Loads the misses saved in a json file. An empty cache is returned if the file does not exist.
+
+        :param path: string.
+            Path of the json file.
+        :param ttl: float.
+            Time to live of the misses added from now on. Defaults to the saved one.
+        :return: NegativeCache object.
+        """
+        if not os.path.exists(path):
+            return cls() if ttl is None else cls(ttl)
+        with open(path, 'r', encoding='utf-8') as file:
+            saved = json.load(file)
+        now = time.time()
+        entries = dict((key, expires) for key, expires in saved['entries'].items() if expires >= now)
+        return cls(saved['ttl'] if ttl is None else ttl, entries)
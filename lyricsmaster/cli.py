@@ -4,52 +4,248 @@
 
 import click
 import lyricsmaster
-from .utils import TorController
 import sys
 import logging
 
 
-@click.command()
+class DefaultGroup(click.Group):
+    """
+    Group of commands running its default command when the arguments do not start with a command name,
+    so that 'lyricsmaster <artist_name>' downloads lyrics.
+
+    :param default_command: string.
+        Name of the default command.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.default_command = kwargs.pop('default_command')
+        super(DefaultGroup, self).__init__(*args, **kwargs)
+
+    def parse_args(self, ctx, args):
+        args = list(args)
+        # Skips the options of the group itself, which come before the command name.
+        options = dict((name, not param.is_flag) for param in self.params for name in param.opts)
+        position = 0
+        while position < len(args) and args[position].split('=', 1)[0] in options:
+            takes_value = options[args[position].split('=', 1)[0]] and '=' not in args[position]
+            position += 2 if takes_value else 1
+        if position < len(args) and args[position] not in self.commands \
+                and args[position] not in self.get_help_option_names(ctx):
+            args.insert(position, self.default_command)
+        return super(DefaultGroup, self).parse_args(ctx, args)
+
+
+@click.group(cls=DefaultGroup, default_command='download')
+@click.option('--profile', default=None,
+              help='Profiles the command and writes PROFILE.txt, PROFILE.prof and PROFILE.folded.', type=click.STRING)
+@click.pass_context
+def main(ctx, profile):
+    """Console script for lyricsmaster."""
+    logger = logging.getLogger(__name__.split('.')[0])
+
+    # create console handler and set level to debug
+    console_handler = logging.StreamHandler(sys.stdout)
+    error_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setLevel(logging.INFO)
+    error_handler.setLevel(logging.ERROR)
+    logger.addHandler(console_handler)
+    logger.addHandler(error_handler)
+    logger.setLevel(logging.INFO)
+
+    if profile:
+        from .profiling import Profiler
+        # The profile is written when the command is done.
+        ctx.with_resource(Profiler(profile))
+
+
+@main.command()
 @click.argument('artist_name')
 @click.option('-p', '--provider', default='LyricWiki', help='Lyrics Provider.', type=click.STRING)
+@click.option('--fallback', multiple=True,
+              help='Lyrics Provider used if the previous ones are failing. Can be repeated.', type=click.STRING)
 @click.option('-a', '--album', default=None, help='Album.', type=click.STRING)
 @click.option('-s', '--song', default=None, help='Song.', type=click.STRING)
 @click.option('-f', '--folder', default=None, help='Folder where the lyrics will be saved.', type=click.STRING)
+@click.option('--deadline', default=None,
+              help='Maximum duration of the download in seconds. The lyrics downloaded so far are saved.',
+              type=click.FLOAT)
+@click.option('--archive', default=None, help='WARC file in which the downloaded pages are archived.',
+              type=click.STRING)
+@click.option('--negative-cache', default=None,
+              help='Json file remembering the artists and songs missing from the providers.', type=click.STRING)
+@click.option('--artist-index', default=None, help='Json file of the artist index built by the index command.',
+              type=click.STRING)
+@click.option('--dead-letters', default=None,
+              help='Json file keeping the songs whose download failed, retried when their artist is downloaded again.',
+              type=click.STRING)
 @click.option('--tor', default=None, help='Tor service Ip address.', type=click.STRING)
 @click.option('--socksport', default=9050, help='Tor SocksPort.', type=click.INT)
 @click.option('--controlport', default=None, help='Tor ControlPort.', type=click.INT)
 @click.option('--controlpath', default=None, help='Tor ControlPath.', type=click.STRING)
 @click.option('--password', default='', help='Password for Tor ControlPort.', type=click.STRING)
-def main(artist_name, provider, album, song, folder, tor, socksport, controlport, controlpath, password):
-    """Console script for lyricsmaster."""
+def download(artist_name, provider, fallback, album, song, folder, deadline, archive, negative_cache, artist_index,
+             dead_letters, tor, socksport, controlport, controlpath, password):
+    """Downloads the lyrics of an artist (default command)."""
     logger = logging.getLogger(__name__.split('.')[0])
+    providers = []
+    for name in (provider,) + fallback:
+        try:
+            providers.append(lyricsmaster.CURRENT_PROVIDERS[name.lower()])
+        except KeyError:
+            logger.warning('The provider {0} is not supported'.format(name))
+            return
+    from .utils import TorController
+    if archive:
+        from .archive import WarcWriter
+        archive = WarcWriter(archive)
+    cache = None
+    if negative_cache:
+        from .cache import NegativeCache
+        cache = NegativeCache.load(negative_cache)
+    index = None
+    if artist_index:
+        from .artists import ArtistIndex
+        index = ArtistIndex.load(artist_index)
+    queue = None
+    if dead_letters:
+        from .deadletters import DeadLetterQueue
+        queue = DeadLetterQueue.load(dead_letters)
+    for provider in providers:
+        if tor:
+            if controlport:
+                provider_instance = provider(
+                    TorController(ip=tor, socksport=socksport, controlport=controlport, password=password))
+            elif controlpath:
+                provider_instance = provider(
+                    TorController(ip=tor, socksport=socksport, controlport=controlpath, password=password))
+            else:
+                provider_instance = provider(TorController(ip=tor, socksport=socksport))
+        else:
+            provider_instance = provider()
+        provider_instance.archive = archive
+        provider_instance.negative_cache = cache
+        if queue is not None:
+            provider_instance.dead_letters = queue
+        # The index only lists the artist urls of its own provider. Indexes saved without their provider are
+        # used by the main provider.
+        if index is not None and (index.provider == provider_instance.name or
+                                  (index.provider is None and provider is providers[0])):
+            provider_instance.artist_index = index
+        results = provider_instance.get_lyrics(artist_name, album=album, song=song, deadline=deadline)
+        if results:
+            results.save(folder=folder)
+        if provider_instance.is_available():
+            break
+        logger.warning('{0} is failing'.format(provider_instance.name))
+    if archive:
+        archive.close()
+    if cache is not None:
+        cache.save(negative_cache)
+    if queue is not None:
+        queue.save(dead_letters)
 
-    # create console handler and set level to debug
-    console_handler = logging.StreamHandler(sys.stdout)
-    error_handler = logging.StreamHandler(sys.stderr)
-    console_handler.setLevel(logging.INFO)
-    error_handler.setLevel(logging.ERROR)
-    logger.addHandler(console_handler)
-    logger.addHandler(error_handler)
-    logger.setLevel(logging.INFO)
+
+@main.command()
+@click.argument('provider')
+@click.argument('path')
+@click.option('--max-age', default=None, help='Days after which an artist listing page is crawled again.',
+              type=click.FLOAT)
+def index(provider, path, max_age):
+    """Builds or refreshes the artist index of a provider in a json file."""
+    logger = logging.getLogger(__name__.split('.')[0])
     try:
         provider = lyricsmaster.CURRENT_PROVIDERS[provider.lower()]
-    except KeyError as e:
+    except KeyError:
         logger.warning('The provider {0} is not supported'.format(provider))
         return
-    if tor:
-        if controlport:
-            provider_instance = provider(
-                TorController(ip=tor, socksport=socksport, controlport=controlport, password=password))
-        elif controlpath:
-            provider_instance = provider(
-                TorController(ip=tor, socksport=socksport, controlport=controlpath, password=password))
-        else:
-            provider_instance = provider(TorController(ip=tor, socksport=socksport))
-    else:
-        provider_instance = provider()
-    results = provider_instance.get_lyrics(artist_name, album=album, song=song)
-    results.save(folder=folder)
+    from .artists import ArtistIndex
+    provider_instance = provider()
+    artist_index = provider_instance.update_artist_index(ArtistIndex.load(path),
+                                                         max_age * 24 * 3600 if max_age is not None else None)
+    artist_index.save(path)
+
+
+@main.command()
+@click.argument('provider')
+@click.option('--artist', default=None, help='Only downloads the songs of this artist.', type=click.STRING)
+@click.option('-f', '--folder', default=None, help='Folder where the lyrics will be saved.', type=click.STRING)
+@click.option('--archive', default=None, help='WARC file in which the downloaded pages are archived.',
+              type=click.STRING)
+def mirror(provider, artist, folder, archive):
+    """Downloads the lyrics listed by the sitemaps of a provider."""
+    logger = logging.getLogger(__name__.split('.')[0])
+    try:
+        provider = lyricsmaster.CURRENT_PROVIDERS[provider.lower()]
+    except KeyError:
+        logger.warning('The provider {0} is not supported'.format(provider))
+        return
+    if not provider.sitemap_urls:
+        logger.warning('The provider {0} has no usable sitemap'.format(provider.name))
+        return
+    if archive:
+        from .archive import WarcWriter
+        archive = WarcWriter(archive)
+    provider_instance = provider(archive=archive)
+    # Each song is saved as soon as it is downloaded rather than once the whole sitemap is read.
+    for song in provider_instance.iter_sitemap_songs(artist):
+        song.save(folder=folder)
+    if archive:
+        archive.close()
+
+
+@main.command()
+@click.argument('archive')
+@click.option('-p', '--provider', default=None,
+              help='Lyrics Provider whose extraction is used. Defaults to the provider which archived the pages.',
+              type=click.STRING)
+@click.option('-f', '--folder', default=None, help='Folder where the lyrics will be saved.', type=click.STRING)
+@click.option('--processes', default=None, help='Number of extraction processes. Defaults to the number of cores.',
+              type=click.INT)
+def reextract(archive, provider, folder, processes):
+    """Extracts the lyrics archived in a WARC file again, without downloading them."""
+    logger = logging.getLogger(__name__.split('.')[0])
+    if provider and provider.lower() not in lyricsmaster.CURRENT_PROVIDERS:
+        logger.warning('The provider {0} is not supported'.format(provider))
+        return
+    from .archive import reextract as reextract_archive
+    for discography in reextract_archive(archive, provider, processes):
+        discography.save(folder=folder)
+        logger.info('{0} lyrics extracted from {1}'.format(discography.artist, archive))
+
+
+@main.command()
+@click.argument('path')
+@click.option('-p', '--provider', default='LyricWiki', help='Lyrics Provider.', type=click.STRING)
+@click.option('--tags', is_flag=True, help='Writes the lyrics into the tags of the audio files. Requires mutagen.')
+@click.option('--overwrite', is_flag=True, help='Looks up the tracks which already have lyrics again.')
+@click.option('--concurrency', default=4, help='Number of artists looked up at the same time.', type=click.INT)
+def scan(path, provider, tags, overwrite, concurrency):
+    """Downloads the missing lyrics of a music library."""
+    logger = logging.getLogger(__name__.split('.')[0])
+    try:
+        provider = lyricsmaster.CURRENT_PROVIDERS[provider.lower()]
+    except KeyError:
+        logger.warning('The provider {0} is not supported'.format(provider))
+        return
+    from .library import fill_library, mutagen
+    if tags and mutagen is None:
+        logger.error('Writing lyrics into tags requires mutagen: pip install lyricsmaster[tags]')
+        return
+    fill_library(path, provider(), into_tags=tags, overwrite=overwrite, concurrency=concurrency)
+
+
+@main.command()
+@click.option('--host', default='127.0.0.1', help='Address the server listens on.', type=click.STRING)
+@click.option('--port', default=8080, help='Port the server listens on.', type=click.INT)
+@click.option('--cache-size', default=1024, help='Number of lookup results kept in memory.', type=click.INT)
+@click.option('--cache-ttl', default=3600, help='Seconds after which a lookup result expires.', type=click.FLOAT)
+@click.option('--deadline', default=None,
+              help='Maximum duration of a lookup in seconds. The lyrics downloaded so far are returned.',
+              type=click.FLOAT)
+def serve(host, port, cache_size, cache_ttl, deadline):
+    """Serves lyrics lookups over HTTP/JSON."""
+    from .server import ResultCache, serve as run_server
+    run_server(host, port, cache=ResultCache(cache_size, cache_ttl), deadline=deadline)
 
 
 if __name__ == "__main__":
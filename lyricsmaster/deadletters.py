@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""Dead-letter queue.
+
+Records the songs whose download failed, e.g. on a timeout or a server error, with the reason of the failure.
+Providers retry them once the crawl is done, at a lower concurrency and with a backoff, so transient errors don't
+cost songs and don't slow the crawl down. The songs still failing can be saved to a json file and retried by the
+next runs::
+
+    dead_letters = DeadLetterQueue.load('failed.json')
+    LyricWiki(dead_letters=dead_letters).get_lyrics('2Pac')
+    dead_letters.save('failed.json')
+
+"""
+
+import json
+import os
+import time
+from codecs import open
+
+
+class DeadLetterQueue(object):
+    """
+    Queue of the songs whose download failed, by url.
+
+    :param entries: dict.
+        Maps the urls of the lyrics pages to the provider, artist, album, title, failure reason, number of failed
+        attempts and time of the last failure of their song.
+    """
+    __slots__ = ('entries',)
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def __iter__(self):
+        return iter(list(self.entries.items()))
+
+    def add(self, url, provider, song_title, artist, album_title, reason):
+        """
+        Records a failed download.
+
+        :param url: string.
+            Lyrics url.
+        :param provider: string.
+            Provider name.
+        :param song_title: string.
+        :param artist: string.
+        :param album_title: string.
+        :param reason: string.
+            Reason of the failure.
+        """
+        previous = self.entries.get(url)
+        self.entries[url] = {'provider': provider, 'artist': artist, 'album': album_title, 'title': song_title,
+                             'reason': reason, 'attempts': previous['attempts'] + 1 if previous else 1,
+                             'failed_at': time.time()}
+
+    def get(self, url):
+        """
+        Gets the failure recorded for the supplied url.
+
+        :param url: string.
+        :return: dict or None.
+        """
+        return self.entries.get(url)
+
+    def discard(self, url):
+        """
+        Forgets a failure, e.g. once the song was downloaded.
+
+        :param url: string.
+        """
+        self.entries.pop(url, None)
+
+    def save(self, path):
+        """
+        Saves the queue in a json file.
+
+        :param path: string.
+            Path of the json file.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'entries': self.entries}, file)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a queue saved in a json file. An empty queue is returned if the file does not exist.
+
+        :param path: string.
+            Path of the json file.
+        :return: DeadLetterQueue object.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(json.load(file)['entries'])
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""Music library scanner.
+
+Finds the tracks of a local music library which have no lyrics yet and downloads their lyrics in bulk. Tracks are
+grouped by artist and album, so that each artist page and album is fetched once, and the artists are looked up
+concurrently::
+
+    from lyricsmaster.library import fill_library
+
+    fill_library('/music', LyricWiki())
+
+Lyrics are written next to the audio files, in a .txt file with the same name, or into the tags of the files.
+Tags are read and written with mutagen when it is installed (pip install lyricsmaster[tags]). Without it, the
+artist, album and title are guessed from the paths, laid out as Artist/Album/01 - Title.mp3.
+
+"""
+
+import os
+import re
+import time
+from codecs import open
+from collections import Counter, OrderedDict
+
+from gevent.pool import Pool
+
+from .utils import logger
+
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
+
+AUDIO_EXTENSIONS = ('.aac', '.flac', '.m4a', '.mp3', '.ogg', '.opus', '.wav', '.wma')
+# Track numbers and separators at the start of file names, e.g. '01 - ', '1-02. ' or '03_'.
+_track_number = re.compile(r'^\d+(?:[-.]\d+)?\s*[-._)]?\s*')
+
+
+class Track(object):
+    """
+    Audio file of a music library.
+
+    :param path: string.
+        Path of the audio file.
+    :param artist: string.
+    :param album: string or None.
+        Album title. None if it is unknown.
+    :param title: string.
+    """
+    __slots__ = ('path', 'artist', 'album', 'title')
+
+    def __init__(self, path, artist, album, title):
+        self.path = path
+        self.artist = artist
+        self.album = album
+        self.title = title
+
+    def __repr__(self):
+        return '{0}.{1}({2}, {3}, {4})'.format(__name__, self.__class__.__name__, self.artist, self.album,
+                                               self.title)
+
+    @property
+    def lyrics_path(self):
+        """
+        Path of the text file holding the lyrics of the track.
+
+        :return: string.
+        """
+        return os.path.splitext(self.path)[0] + '.txt'
+
+
+def _path_tags(path, root):
+    """
+    Guesses the artist, album and title of an audio file from its path, laid out as Artist/Album/01 - Title.mp3.
+
+    :param path: string.
+    :param root: string.
+        Root folder of the library.
+    :return: tuple(string, string, string).
+        Artist, album and title. The artist and album are None if the path is too short to tell them.
+    """
+    parts = os.path.relpath(path, root).split(os.sep)
+    title = _track_number.sub('', os.path.splitext(parts[-1])[0]).strip() or os.path.splitext(parts[-1])[0]
+    artist = parts[-3] if len(parts) >= 3 else (parts[-2] if len(parts) == 2 else None)
+    album = parts[-2] if len(parts) >= 3 else None
+    return artist, album, title
+
+
+def read_track(path, root):
+    """
+    Reads the artist, album and title of an audio file from its tags, or from its path if it has no tags.
+
+    :param path: string.
+    :param root: string.
+        Root folder of the library.
+    :return: Track object or None.
+        None if the artist can't be told.
+    """
+    artist, album, title = _path_tags(path, root)
+    if mutagen is not None:
+        try:
+            tags = mutagen.File(path, easy=True)
+        except Exception as e:
+            logger.debug('Tags of {0} could not be read: {1}'.format(path, e))
+            tags = None
+        if tags is not None and tags.tags is not None:
+            artist = (tags.get('albumartist') or tags.get('artist') or [artist])[0]
+            album = (tags.get('album') or [album])[0]
+            title = (tags.get('title') or [title])[0]
+    if not artist:
+        return None
+    return Track(path, artist, album, title)
+
+
+def scan_library(root):
+    """
+    Walks a music library and reads its tracks.
+
+    :param root: string.
+        Root folder of the library.
+    :return: iterator.
+        Track objects, in path order.
+    """
+    for folder, folders, files in os.walk(root):
+        folders.sort()
+        for file_name in sorted(files):
+            if os.path.splitext(file_name)[1].lower() in AUDIO_EXTENSIONS:
+                track = read_track(os.path.join(folder, file_name), root)
+                if track is not None:
+                    yield track
+
+
+def has_lyrics(track):
+    """
+    Checks if a track already has lyrics, in a text file next to it or in its tags.
+
+    :param track: Track object.
+    :return: bool.
+    """
+    if os.path.exists(track.lyrics_path):
+        return True
+    if mutagen is not None:
+        try:
+            tags = mutagen.File(track.path)
+        except Exception:
+            return False
+        if tags is not None and tags.tags is not None:
+            return any(key.startswith('USLT') or key.lower() in ('lyrics', 'unsyncedlyrics', '\xa9lyr')
+                       for key in tags.tags.keys())
+    return False
+
+
+def write_lyrics(track, lyrics, into_tags=False):
+    """
+    Writes the lyrics of a track next to its audio file or into its tags.
+
+    :param track: Track object.
+    :param lyrics: string.
+    :param into_tags: bool.
+        Whether the lyrics are written into the tags of the audio file. Requires mutagen.
+    """
+    if not into_tags:
+        with open(track.lyrics_path, 'w', encoding='utf-8') as file:
+            file.write(lyrics)
+        return
+    if mutagen is None:
+        raise RuntimeError('Writing lyrics into tags requires mutagen: pip install lyricsmaster[tags]')
+    audio = mutagen.File(track.path)
+    if audio is None:
+        raise ValueError('{0} is not a supported audio file'.format(track.path))
+    if audio.tags is None:
+        audio.add_tags()
+    if audio.__class__.__name__ in ('MP3', 'AIFF', 'WAVE'):
+        from mutagen.id3 import USLT
+        audio.tags.add(USLT(encoding=3, lang='eng', desc='', text=lyrics))
+    elif audio.__class__.__name__ == 'MP4':
+        audio.tags['\xa9lyr'] = lyrics
+    else:
+        audio.tags['LYRICS'] = lyrics
+    audio.save()
+
+
+def group_tracks(tracks):
+    """
+    Groups tracks by artist and album.
+
+    :param tracks: iterable.
+        Track objects.
+    :return: collections.OrderedDict.
+        Maps the artists to dicts mapping their album titles, or None, to the tracks of the albums.
+    """
+    artists = OrderedDict()
+    for track in tracks:
+        artists.setdefault(track.artist, OrderedDict()).setdefault(track.album, []).append(track)
+    return artists
+
+
+def fill_library(root, provider, into_tags=False, overwrite=False, concurrency=4):
+    """
+    Downloads the lyrics of the tracks of a music library which have none.
+    The artists are looked up 'concurrency' at a time and the progress is logged after each artist.
+
+    :param root: string.
+        Root folder of the library.
+    :param provider: LyricsProvider object.
+    :param into_tags: bool.
+        Whether the lyrics are written into the tags of the audio files rather than in text files.
+    :param overwrite: bool.
+        Whether the tracks which already have lyrics are looked up again.
+    :param concurrency: integer.
+        Number of artists looked up at the same time.
+    :return: collections.Counter.
+        Numbers of 'tracks' scanned, tracks 'skipped' as they have lyrics, lyrics 'found' and 'missing', artists
+        whose lookup failed ('failed_artists') and 'seconds' taken.
+    """
+    start = time.time()
+    stats = Counter()
+    tracks = []
+    for track in scan_library(root):
+        stats['tracks'] += 1
+        if not overwrite and has_lyrics(track):
+            stats['skipped'] += 1
+        else:
+            tracks.append(track)
+    artists = group_tracks(tracks)
+    logger.info('{0} tracks of {1} artists without lyrics found in {2}'.format(len(tracks), len(artists), root))
+
+    def fill_artist(artist, albums):
+        titles = OrderedDict((album_title, [track.title for track in album_tracks])
+                             for album_title, album_tracks in albums.items())
+        try:
+            songs = provider.get_library_lyrics(artist, titles)
+        except Exception as e:
+            # The tracks of the artist are counted as missing and the other artists are still looked up.
+            logger.warning('Lyrics of {0} could not be downloaded: {1!r}'.format(artist, e))
+            stats['failed_artists'] += 1
+            songs = {}
+        for album_title, album_tracks in albums.items():
+            for track in album_tracks:
+                song = songs.get((album_title, track.title))
+                if song is None or not song.lyrics:
+                    stats['missing'] += 1
+                    continue
+                try:
+                    write_lyrics(track, song.lyrics, into_tags)
+                except Exception as e:
+                    logger.warning('Lyrics of {0} could not be written: {1}'.format(track.path, e))
+                    stats['missing'] += 1
+                else:
+                    stats['found'] += 1
+        done = stats['found'] + stats['missing']
+        logger.info('{0}: {1}/{2} tracks done, {3} lyrics found ({4:.1f} tracks/s)'.format(
+            artist, done, len(tracks), stats['found'], done / max(time.time() - start, 1e-6)))
+
+    pool = Pool(concurrency)
+    for artist, albums in artists.items():
+        pool.spawn(fill_artist, artist, albums)
+    pool.join(raise_error=True)
+    stats['seconds'] = time.time() - start
+    logger.info('{0} tracks scanned, {1} lyrics found, {2} missing in {3:.1f}s ({4:.1f} tracks/s)'.format(
+        stats['tracks'], stats['found'], stats['missing'], stats['seconds'],
+        len(tracks) / max(stats['seconds'], 1e-6)))
+    return stats
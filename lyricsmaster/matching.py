@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""Title matching.
+
+Normalizes album and song titles and finds the items matching a user supplied title.
+
+"""
+
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+# '(feat. X)', '[ft. X]', '(with X)' anywhere in the title and a trailing 'feat. X'.
+_featuring_groups = re.compile(r'[(\[]\s*(?:feat|ft|featuring|with)\b[^)\]]*[)\]]', re.IGNORECASE)
+_featuring_suffix = re.compile(r'\s(?:feat|ft|featuring)\b.*$', re.IGNORECASE)
+_non_alnum = re.compile(r'[\W_]+', re.UNICODE)
+# Roman numerals of at least two letters, plus 'v' and 'x'. A lone 'i' is more likely the pronoun.
+_roman_numeral = re.compile(r'^(?=[mdclxvi]{2,}$|[vx]$)m{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$')
+_roman_values = {'i': 1, 'v': 5, 'x': 10, 'l': 50, 'c': 100, 'd': 500, 'm': 1000}
+
+
+def normalize_title(title):
+    """
+    Normalizes a title for comparison.
+    Accents are folded, featured artists and punctuation are removed and the title is lowercased.
+
+    :param title: string.
+        Album or song title.
+    :return: string.
+        Normalized title, words separated by single spaces.
+    """
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(c for c in title if not unicodedata.combining(c))
+    title = _featuring_groups.sub(' ', title)
+    title = _featuring_suffix.sub('', title)
+    title = title.replace('&', ' and ')
+    title = _non_alnum.sub(' ', title.lower())
+    return title.strip()
+
+
+def title_numbers(title):
+    """
+    Reads the numbers of a normalized title, in digits or roman numerals, e.g. the volume of a series.
+
+    :param title: string.
+        Normalized title.
+    :return: frozenset.
+        Integer values of the numbers.
+    """
+    numbers = set()
+    for word in title.split():
+        if word.isdigit():
+            numbers.add(int(word))
+        elif _roman_numeral.match(word):
+            values = [_roman_values[letter] for letter in word]
+            numbers.add(sum(-value if value < next_value else value
+                            for value, next_value in zip(values, values[1:] + [0])))
+    return frozenset(numbers)
+
+
+class TitleIndex(object):
+    """
+    Index of album or song titles.
+    Titles are normalized once when the index is built. Searching returns the exact matches if there are any, else
+    the titles containing all the words of the query, else the titles similar enough to the query whose numbers are
+    the same as the query's, so that 'Vol. 1' does not match 'Vol. 2'.
+
+    :param items: iterable.
+        Items to index.
+    :param key: function.
+        Returns the title of an item. Defaults to the item itself.
+    """
+    __slots__ = ('titles', 'items', 'words', 'numbers')
+
+    def __init__(self, items, key=None):
+        self.titles = []
+        self.items = []
+        self.words = {}
+        self.numbers = []
+        for item in items:
+            title = normalize_title(key(item) if key else item)
+            for word in set(title.split()):
+                self.words.setdefault(word, set()).add(len(self.items))
+            self.titles.append(title)
+            self.numbers.append(title_numbers(title))
+            self.items.append(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, len(self))
+
+    def score(self, title, position):
+        """
+        Scores how well the indexed title at the supplied position matches the normalized title.
+
+        :param title: string.
+            Normalized title.
+        :param position: integer.
+            Position of the indexed title.
+        :return: float.
+            Score between 0 and 1.
+        """
+        indexed_title = self.titles[position]
+        if indexed_title == title:
+            return 1.0
+        if title and ' {0} '.format(title) in ' {0} '.format(indexed_title):
+            return 0.95
+        return SequenceMatcher(None, title, indexed_title).ratio()
+
+    def search(self, title, threshold=0.8):
+        """
+        Finds the items matching the supplied title.
+
+        :param title: string.
+            Title to look for.
+        :param threshold: float.
+            Minimum score between 0 and 1 for an item to match.
+        :return: list.
+            Matching items of the best tier, best matches first.
+        """
+        title = normalize_title(title)
+        words = title.split()
+        candidates = set.intersection(*[self.words.get(word, set()) for word in words]) if words else set()
+        matches = [(self.score(title, position), position) for position in candidates]
+        exact_matches = [match for match in matches if match[0] == 1.0]
+        if exact_matches:
+            return self._ranked(exact_matches, threshold)
+        if any(match[0] >= threshold for match in matches):
+            return self._ranked(matches, threshold)
+        numbers = title_numbers(title)
+        matches = []
+        for position in range(len(self.titles)):
+            if position in candidates or self.numbers[position] != numbers:
+                continue
+            # Cheap upper bound on the similarity before computing it.
+            matcher = SequenceMatcher(None, title, self.titles[position])
+            if matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold:
+                matches.append((matcher.ratio(), position))
+        return self._ranked(matches, threshold)
+
+    def _ranked(self, matches, threshold):
+        """
+        Ranks the matches scoring at least the threshold, best first and in index order for equal scores.
+
+        :param matches: list.
+            (score, position) tuples.
+        :param threshold: float.
+        :return: list.
+            Matching items.
+        """
+        matches = sorted((match for match in matches if match[0] >= threshold), key=lambda match: (-match[0], match[1]))
+        return [self.items[position] for score, position in matches]
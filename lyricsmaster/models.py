@@ -7,8 +7,11 @@ Defines classes for Song, Album and Discography.
 """
 
 import os
+import zlib
+from itertools import chain
 from codecs import open
 from .utils import set_save_folder, normalize
+from .profiling import profiled
 
 
 class Song(object):
@@ -25,19 +28,45 @@ class Song(object):
         Lyrics of the song.
     :param writers: string.
         List of the song's writers.
+    :param compression: integer.
+        Zlib compression level (1 to 9) of the lyrics kept in memory. They are then decompressed on each access to
+        'lyrics'. None to keep them uncompressed.
     """
-    __slots__ = ('title', 'album', 'artist', 'lyrics', 'writers')
+    __slots__ = ('title', 'album', 'artist', '_lyrics', 'writers', 'compression')
 
-    def __init__(self, title, album, artist, lyrics=None, writers=None):
+    def __init__(self, title, album, artist, lyrics=None, writers=None, compression=None):
         self.title = title
         self.album = album
         self.artist = artist
+        self.compression = compression
         self.lyrics = lyrics
         self.writers = writers
 
     def __repr__(self):
         return '{0}.{1}({2}, {3}, {4})'.format(__name__, self.__class__.__name__, self.title, self.album, self.artist)
 
+    @property
+    def lyrics(self):
+        """
+        Lyrics of the song.
+
+        :return: string or None.
+        """
+        if isinstance(self._lyrics, bytes):
+            return zlib.decompress(self._lyrics).decode('utf-8')
+        return self._lyrics
+
+    @lyrics.setter
+    def lyrics(self, lyrics):
+        if lyrics and self.compression:
+            encoded = lyrics.encode('utf-8')
+            compressed = zlib.compress(encoded, self.compression)
+            # Short lyrics can grow when compressed.
+            if len(compressed) < len(encoded):
+                lyrics = compressed
+        self._lyrics = lyrics
+
+    @profiled('save')
     def save(self, folder=None):
         """
         Saves the lyrics of the song in the supplied folder.
@@ -59,10 +88,47 @@ class Song(object):
                 file.write(self.lyrics)
 
 
+class SequenceView(object):
+    """
+    SequenceView Class.
+    Read-only view over some items of a list. The items are not copied and changes to the list are reflected in
+    the view. Each iteration over a view is independent from the others.
+
+    :param sequence: list.
+        Viewed list.
+    :param indices: range.
+        Indices of the viewed items.
+    """
+    __slots__ = ('sequence', 'indices')
+
+    def __init__(self, sequence, indices):
+        self.sequence = sequence
+        self.indices = indices
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return SequenceView(self.sequence, self.indices[key])
+        return self.sequence[self.indices[key]]
+
+    def __iter__(self):
+        sequence = self.sequence
+        return (sequence[i] for i in self.indices)
+
+    def __reversed__(self):
+        return iter(self[::-1])
+
+
 class Album(object):
     """
     Album Class.
     The Album class follows the Iterable protocol and can be iterated over the songs.
+    Each iteration is independent, so an album can be walked by several consumers at the same time.
 
     :param title: string.
         Album title.
@@ -73,10 +139,9 @@ class Album(object):
     :param songs: list.
         List of Songs objects.
     """
-    __slots__ = ('__idx__', 'title', 'artist', 'release_date', 'songs')
+    __slots__ = ('title', 'artist', 'release_date', 'songs')
 
     def __init__(self, title, artist, songs, release_date='Unknown'):
-        self.__idx__ = 0
         self.title = title
         self.artist = artist
         self.release_date = release_date
@@ -103,20 +168,21 @@ class Album(object):
         return
 
     def __iter__(self):
-        return self
-
-    def __next__(self):
-        self.__idx__ += 1
-        try:
-            return self.songs[self.__idx__ - 1]
-        except IndexError:
-            self.__idx__ = 0
-            raise StopIteration
+        return iter(self.songs)
 
     def __reversed__(self):
         return reversed(self.songs)
 
-    next = __next__  # Python 2.7 compatibility for iterator protocol
+    def view(self, key=slice(None)):
+        """
+        Returns a read-only view over a slice of the songs, without copying them.
+
+        :param key: slice.
+        :return: SequenceView object.
+        """
+        if not isinstance(key, slice):
+            raise TypeError('A view is taken over a slice, not {0}'.format(type(key).__name__))
+        return SequenceView(self.songs, range(len(self.songs))[key])
 
     def save(self, folder=None):
         """
@@ -134,18 +200,22 @@ class Discography(object):
     """
     Discography Class.
     The Discography class follows the Iterable protocol and can be iterated over the albums.
+    Each iteration is independent, so a discography can be walked by several consumers at the same time.
 
     :param artist: string.
         Artist name.
     :param albums: list.
         List of Album objects.
+    :param complete: bool.
+        Whether all the lyrics of the crawl were downloaded. False if the crawl was cut short by its deadline or
+        if pages or songs could not be downloaded.
     """
-    __slots__ = ('__idx__', 'artist', 'albums')
+    __slots__ = ('artist', 'albums', 'complete')
 
-    def __init__(self, artist, albums):
-        self.__idx__ = 0
+    def __init__(self, artist, albums, complete=True):
         self.artist = artist
         self.albums = albums
+        self.complete = complete
 
     def __repr__(self):
         return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, self.artist)
@@ -157,7 +227,7 @@ class Discography(object):
         return self.albums[key]
 
     def __setitem__(self, key, value):
-        if not isinstance(value, Song):
+        if not isinstance(value, Album):
             raise TypeError
         else:
             self.albums[key] = value
@@ -168,20 +238,30 @@ class Discography(object):
         return
 
     def __iter__(self):
-        return self
-
-    def __next__(self):
-        self.__idx__ += 1
-        try:
-            return self.albums[self.__idx__ - 1]
-        except IndexError:
-            self.__idx__ = 0
-            raise StopIteration
+        return iter(self.albums)
 
     def __reversed__(self):
         return reversed(self.albums)
 
-    next = __next__  # Python 2.7 compatibility for iterator protocol
+    def view(self, key=slice(None)):
+        """
+        Returns a read-only view over a slice of the albums, without copying them.
+
+        :param key: slice.
+        :return: SequenceView object.
+        """
+        if not isinstance(key, slice):
+            raise TypeError('A view is taken over a slice, not {0}'.format(type(key).__name__))
+        return SequenceView(self.albums, range(len(self.albums))[key])
+
+    def iter_songs(self):
+        """
+        Iterates over the songs of all the albums.
+
+        :return: iterator.
+            Song objects, album after album.
+        """
+        return chain.from_iterable(self.albums)
 
     def save(self, folder=None):
         """
@@ -190,5 +270,10 @@ class Discography(object):
         :param folder: string.
             Path to save folder.
         """
+        # Songs shared by several albums are saved once.
+        saved = set()
         for album in self.albums:
-            album.save(folder)
+            for song in album.songs:
+                if song and id(song) not in saved:
+                    saved.add(id(song))
+                    song.save(folder)
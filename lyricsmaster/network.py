@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+
+"""Network utilities.
+
+Bounds the memory used by the downloads of the providers. Response bodies are read in chunks into reusable
+buffers, responses larger than a maximum size are abandoned and a memory budget shared by all the providers
+limits the number of bytes being downloaded at any time.
+Circuit breakers stop sending requests to hosts which keep failing and identical requests in flight at the same
+time share a single download. The latencies of the requests are tracked to hedge the slowest ones.
+New connections start warmer: host names are resolved once per time to live and the pools share one TLS context,
+so the CA bundle is loaded once rather than for each connection.
+
+"""
+
+import math
+import socket
+import time
+from collections import Counter, deque
+
+import certifi
+import gevent
+from gevent.event import AsyncResult, Event
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.ssl_ import create_urllib3_context
+
+from .utils import logger
+
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024  # Bytes of response bodies downloaded at the same time by all providers.
+MISSING_STATUSES = (404, 410)  # Http statuses telling that a page does not exist rather than that the request failed.
+
+
+class ResponseTooLarge(Exception):
+    """
+    Raised when a response body is larger than the maximum response size.
+
+    """
+    pass
+
+
+def is_failure(status):
+    """
+    Checks if an http status means that a request failed, e.g. on a server error or rate limiting, rather than
+    that the page was found or does not exist.
+
+    :param status: integer.
+    :return: bool.
+    """
+    return not 200 <= status < 300 and status not in MISSING_STATUSES
+
+
+class MemoryBudget(object):
+    """
+    Budget of the bytes being downloaded at the same time.
+    Downloads reserve their expected size before reading the body and wait while the budget is exhausted, which
+    throttles the number of concurrent downloads when large pages are in flight.
+    A single download is always allowed, even if it is larger than the budget, so downloads can not deadlock.
+
+    :param limit: integer.
+        Maximum number of bytes in flight.
+    """
+    __slots__ = ('limit', 'in_flight', '_released')
+
+    def __init__(self, limit=DEFAULT_MEMORY_BUDGET):
+        self.limit = limit
+        self.in_flight = 0
+        self._released = Event()
+
+    def __repr__(self):
+        return '{0}.{1}({2}, {3})'.format(__name__, self.__class__.__name__, self.in_flight, self.limit)
+
+    def acquire(self, size):
+        """
+        Reserves bytes of the budget, waiting until enough bytes are released.
+
+        :param size: integer.
+            Number of bytes.
+        """
+        while self.in_flight and self.in_flight + size > self.limit:
+            self._released.clear()
+            self._released.wait()
+        self.in_flight += size
+
+    def grow(self, size):
+        """
+        Reserves bytes of the budget without waiting, for downloads growing past their expected size.
+        Waiting there could deadlock downloads holding part of the budget, so the budget is overdrawn instead and
+        new downloads wait until it is paid back.
+
+        :param size: integer.
+            Number of bytes.
+        """
+        self.in_flight += size
+
+    def release(self, size):
+        """
+        Releases bytes of the budget and wakes up the downloads waiting for them.
+
+        :param size: integer.
+            Number of bytes.
+        """
+        self.in_flight -= size
+        self._released.set()
+        # Lets the waiting downloads run before the releasing one reserves bytes again.
+        gevent.sleep(0)
+
+
+class BufferPool(object):
+    """
+    Pool of fixed size buffers in which response bodies are read, so downloads do not allocate a new buffer for
+    each chunk.
+
+    :param size: integer.
+        Size of the buffers in bytes.
+    """
+    __slots__ = ('size', 'buffers')
+
+    def __init__(self, size):
+        self.size = size
+        self.buffers = []
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, self.size)
+
+    def get(self):
+        """
+        Returns a free buffer.
+
+        :return: bytearray.
+        """
+        return self.buffers.pop() if self.buffers else bytearray(self.size)
+
+    def put(self, buffer):
+        """
+        Gives back a buffer to the pool.
+
+        :param buffer: bytearray.
+        """
+        self.buffers.append(buffer)
+
+
+def content_length(response):
+    """
+    Returns the announced length of the response body.
+
+    :param response: urllib3.response.HTTPResponse Object.
+    :return: integer or None.
+        None if the length is unknown or if the body is compressed, as the decoded body is then longer.
+    """
+    if response.headers.get('content-encoding'):
+        return None
+    try:
+        return int(response.headers.get('content-length'))
+    except (TypeError, ValueError):
+        return None
+
+
+def read_body(response, max_size, budget, buffers):
+    """
+    Reads the body of a response which was requested with 'preload_content=False'.
+    The body is read within the memory budget and the read is abandoned as soon as the body is larger than the
+    maximum size.
+
+    :param response: urllib3.response.HTTPResponse Object.
+    :param max_size: integer.
+        Maximum size of the body in bytes.
+    :param budget: MemoryBudget object.
+    :param buffers: BufferPool object.
+    :return: bytes.
+        Response body.
+    """
+    length = content_length(response)
+    if length is not None and length > max_size:
+        raise ResponseTooLarge(length)
+    reserved = length if length is not None else buffers.size
+    budget.acquire(reserved)
+    buffer = buffers.get()
+    view = memoryview(buffer)
+    body = bytearray()
+    try:
+        while True:
+            size = response.readinto(buffer)
+            if not size:
+                break
+            if len(body) + size > max_size:
+                raise ResponseTooLarge(len(body) + size)
+            body += view[:size]
+            if len(body) > reserved:
+                budget.grow(len(body) - reserved)
+                reserved = len(body)
+        return bytes(body)
+    finally:
+        view.release()
+        buffers.put(buffer)
+        budget.release(reserved)
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of the requests sent to a host.
+    The circuit is closed while the host answers. It opens after 'threshold' consecutive failures and requests then
+    fail fast without being sent. Once 'reset_timeout' seconds have passed, the circuit is half-open and a single
+    probe request is let through: the circuit closes if it succeeds and opens again if it fails.
+    State transitions are counted in the supplied metrics, e.g. 'circuit_opened'.
+
+    :param host: string.
+        Host name.
+    :param metrics: collections.Counter object.
+    :param threshold: integer.
+        Number of consecutive failures opening the circuit.
+    :param reset_timeout: float.
+        Seconds before probing a host whose circuit is open.
+    """
+    __slots__ = ('host', 'metrics', 'threshold', 'reset_timeout', 'state', 'failures', 'opened_at', 'probing')
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, host, metrics, threshold=5, reset_timeout=30):
+        self.host = host
+        self.metrics = metrics
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def __repr__(self):
+        return '{0}.{1}({2}, {3})'.format(__name__, self.__class__.__name__, self.host, self.state)
+
+    def _set_state(self, state):
+        """
+        Changes the state of the circuit, counting and logging the transition.
+
+        :param state: string.
+        """
+        if state == self.state:
+            return
+        self.state = state
+        self.metrics['circuit_{0}'.format(state.replace('-', '_'))] += 1
+        logger.warning('Circuit of {0} is {1}'.format(self.host, state))
+
+    def allow(self):
+        """
+        Checks if a request can be sent to the host.
+
+        :return: bool.
+        """
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        """
+        Records a request which was answered.
+
+        """
+        self.failures = 0
+        self.probing = False
+        self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        """
+        Records a failed request.
+
+        """
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def release(self):
+        """
+        Ends a probe request which neither succeeded nor failed, e.g. when it was cancelled by a deadline.
+        The next request probes the host again.
+
+        """
+        self.probing = False
+
+
+class SingleFlight(object):
+    """
+    Coalesces the concurrent calls with the same key.
+    The first call runs and the calls made while it is in flight wait for its result instead of running again.
+    Coalesced calls are counted in the supplied metrics as 'requests_coalesced'.
+
+    :param metrics: collections.Counter object.
+    """
+    __slots__ = ('metrics', 'calls')
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.calls = {}
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, len(self.calls))
+
+    def do(self, key, function, *args):
+        """
+        Calls the function, or waits for the result of the call in flight with the same key.
+
+        :param key: hashable.
+        :param function: function.
+        :param args: arguments of the function.
+        :return: result of the function.
+        """
+        call = self.calls.get(key)
+        if call is not None:
+            self.metrics['requests_coalesced'] += 1
+            return call.get()
+        call = self.calls[key] = AsyncResult()
+        try:
+            result = function(*args)
+        except BaseException:
+            # The waiting calls get no result rather than the exception, e.g. when the first call is killed.
+            call.set(None)
+            raise
+        else:
+            call.set(result)
+            return result
+        finally:
+            del self.calls[key]
+
+
+class LatencyTracker(object):
+    """
+    Keeps the latencies of the last requests to compute their percentiles.
+
+    :param size: integer.
+        Number of latencies kept.
+    """
+    __slots__ = ('latencies',)
+
+    def __init__(self, size=200):
+        self.latencies = deque(maxlen=size)
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return len(self.latencies)
+
+    def record(self, latency):
+        """
+        Records the latency of a request.
+
+        :param latency: float.
+            Duration of the request in seconds.
+        """
+        self.latencies.append(latency)
+
+    def percentile(self, percent):
+        """
+        Computes a percentile of the recorded latencies, with the nearest-rank method.
+
+        :param percent: float.
+            Percentile between 0 and 100, e.g. 95.
+        :return: float or None.
+            None if no latency was recorded.
+        """
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[max(int(math.ceil(percent / 100.0 * len(latencies))) - 1, 0)]
+
+
+class DnsCache(object):
+    """
+    Caches the addresses of host names for a time to live.
+    Concurrent resolutions of the same host name share a single lookup.
+    Cache hits are counted in 'metrics' as 'dns_cache_hits'.
+
+    :param ttl: float.
+        Seconds after which a host name is resolved again.
+    """
+    __slots__ = ('ttl', 'entries', 'metrics', '_in_flight')
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.entries = {}
+        self.metrics = Counter()
+        self._in_flight = SingleFlight(self.metrics)
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, len(self.entries))
+
+    def resolve(self, host, port):
+        """
+        Resolves a host name.
+
+        :param host: string.
+        :param port: integer.
+        :return: list.
+            Addresses of the host.
+        :raises: socket.gaierror if the host name can't be resolved.
+        """
+        entry = self.entries.get((host, port))
+        if entry is not None and entry[0] > time.time():
+            self.metrics['dns_cache_hits'] += 1
+            return entry[1]
+        addresses = self._in_flight.do((host, port), self._lookup, host, port)
+        if addresses is None:
+            raise socket.gaierror('The resolution of {0} was interrupted'.format(host))
+        return addresses
+
+    def _lookup(self, host, port):
+        """
+        Resolves a host name with the system resolver and caches its addresses.
+
+        :param host: string.
+        :param port: integer.
+        :return: list.
+        """
+        addresses = []
+        for family, socktype, proto, canonname, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        self.entries[(host, port)] = (time.time() + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host, port):
+        """
+        Drops the cached addresses of a host name, e.g. when connecting to them failed.
+
+        :param host: string.
+        :param port: integer.
+        """
+        self.entries.pop((host, port), None)
+
+
+# Budget shared by the providers which are not given their own.
+shared_budget = MemoryBudget()
+# Host names resolved by the connection pools of the providers.
+dns_cache = DnsCache()
+_ssl_context = None
+
+
+def ssl_context():
+    """
+    Gets the TLS context shared by the connection pools, verifying certificates against certifi's CA bundle.
+
+    :return: ssl.SSLContext object.
+    """
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = create_urllib3_context()
+        _ssl_context.load_verify_locations(certifi.where())
+    return _ssl_context
+
+
+class _CachedDnsMixin(object):
+    """
+    Makes urllib3 connections resolve their host with the shared DnsCache.
+    The addresses of the host are tried in turn and its cached addresses are dropped if none of them answers.
+
+    """
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            addresses = dns_cache.resolve(host, self.port)
+        except socket.gaierror:
+            # urllib3 resolves the host again and reports the error.
+            return super(_CachedDnsMixin, self)._new_conn()
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    return super(_CachedDnsMixin, self)._new_conn()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    logger.debug('Connection to {0} ({1}) failed: {2}'.format(host, address, e))
+                    error = e
+            dns_cache.forget(host, self.port)
+            raise error
+        finally:
+            self._dns_host = host
+
+
+class CachedDnsHTTPConnection(_CachedDnsMixin, HTTPConnection):
+    pass
+
+
+class CachedDnsHTTPSConnection(_CachedDnsMixin, HTTPSConnection):
+    pass
+
+
+class CachedDnsHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CachedDnsHTTPConnection
+
+
+class CachedDnsHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CachedDnsHTTPSConnection
+
+
+# Connection pools used by a urllib3.PoolManager through its 'pool_classes_by_scheme' attribute.
+cached_dns_pool_classes = {'http': CachedDnsHTTPConnectionPool, 'https': CachedDnsHTTPSConnectionPool}
+
+
+def warm_up(session, url, connections):
+    """
+    Opens connections to the host of the supplied url and leaves them in the session's pool, so that the next
+    requests to the host skip the connection and TLS handshake.
+
+    :param session: urllib3.PoolManager object.
+    :param url: string.
+    :param connections: integer.
+        Number of connections opened.
+    :return: integer.
+        Number of connections opened.
+    """
+    pool = session.connection_from_url(url)
+    # Connections are all taken before any is returned, so that each one is a new connection.
+    taken = [pool._get_conn() for i in range(connections)]
+    connects = [gevent.spawn(conn.connect) for conn in taken if conn.sock is None]
+    try:
+        gevent.joinall(connects)
+    finally:
+        gevent.killall(connects)
+        for conn in taken:
+            pool._put_conn(conn)
+    for connect in connects:
+        if connect.exception is not None:
+            logger.debug('Connection warm-up to {0} failed: {1}'.format(url, connect.exception))
+    return len([connect for connect in connects if connect.successful()])
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+"""Crawl profiling.
+
+Tells where the time and memory of a crawl go. The crawl is split in stages: 'request' for the network, 'artist'
+for the artist page, 'albums' for the album listings, 'song' for the lyrics pages, 'parse' for the html parsing
+and 'save' for writing the lyrics to disk. A Profiler records the duration, calls and memory of each stage along
+with cProfile and tracemalloc data::
+
+    from lyricsmaster.profiling import Profiler
+
+    with Profiler('2pac'):
+        LyricWiki().get_lyrics('2Pac').save()
+
+writes 2pac.txt, a summary of the stages, the largest allocations and the slowest functions, 2pac.prof, the cProfile
+data, and 2pac.folded, CPU samples as folded stacks rooted at their stage, for flamegraph.pl or speedscope.
+
+"""
+
+import cProfile
+import functools
+import io
+import os
+import pstats
+import signal
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+
+from greenlet import getcurrent
+
+from .utils import logger
+
+# Profiler currently running, if any. Stages are only recorded while a profiler runs.
+_active = None
+
+
+def profiled(name):
+    """
+    Decorator recording each call of the decorated function as a stage of the running profiler.
+
+    :param name: string.
+        Stage name.
+    :return: function.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with _active.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _NoStage(object):
+    """
+    Stage context doing nothing, used when no profiler runs.
+
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_no_stage = _NoStage()
+
+
+def stage(name):
+    """
+    Records a block of code as a stage of the running profiler.
+
+    :param name: string.
+        Stage name.
+    :return: context manager.
+    """
+    if _active is None:
+        return _no_stage
+    return _active.stage(name)
+
+
+class StageStats(object):
+    """
+    Statistics of a stage.
+
+    :param name: string.
+    """
+    __slots__ = ('name', 'calls', 'seconds', 'memory')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.memory = 0
+
+    def __repr__(self):
+        return '{0}.{1}({2}, {3}, {4:.3f})'.format(__name__, self.__class__.__name__, self.name, self.calls,
+                                                   self.seconds)
+
+
+class _Stage(object):
+    """
+    Context recording one call of a stage.
+
+    :param profiler: Profiler object.
+    :param name: string.
+    """
+    __slots__ = ('profiler', 'name', 'stack', 'start', 'memory')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        stacks = self.profiler.stacks
+        current = getcurrent()
+        if current not in stacks:
+            stacks[current] = []
+        self.stack = stacks[current]
+        self.stack.append(self.name)
+        self.memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        self.stack.pop()
+        stats = self.profiler.stages.get(self.name)
+        if stats is None:
+            stats = self.profiler.stages[self.name] = StageStats(self.name)
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.memory += tracemalloc.get_traced_memory()[0] - self.memory
+        return False
+
+
+class Profiler(object):
+    """
+    Profiles the crawls run while it is started, with cProfile, tracemalloc and CPU sampling.
+    Only one profiler can run at a time.
+
+    Stage durations are wall-clock times including their nested stages, and the durations of stages running
+    concurrently in several greenlets add up. Stage memory is the memory allocated and not freed by the stage.
+    CPU samples are taken every 'interval' seconds of CPU time, where the process supports profiling timers.
+
+    :param path: string.
+        Path, without extension, of the files written when the profiler is used as a context manager.
+    :param interval: float.
+        Seconds of CPU time between two samples.
+    """
+
+    def __init__(self, path=None, interval=0.005):
+        self.path = path
+        self.interval = interval
+        self.stages = {}
+        self.samples = Counter()
+        self.stacks = weakref.WeakKeyDictionary()
+        self.profile = cProfile.Profile()
+        self.snapshot = None
+        self.peak_memory = 0
+        self._tracing = False
+        self._sampling = False
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, self.path)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        if self.path:
+            self.save(self.path)
+
+    def start(self):
+        """
+        Starts profiling.
+
+        """
+        global _active
+        if _active is not None:
+            raise RuntimeError('A profiler is already running')
+        _active = self
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        if hasattr(signal, 'setitimer'):
+            try:
+                signal.signal(signal.SIGPROF, self._sample)
+            except ValueError:
+                # Signal handlers can only be set in the main thread.
+                logger.warning('CPU sampling is disabled outside of the main thread')
+            else:
+                signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+                self._sampling = True
+        self.profile.enable()
+
+    def stop(self):
+        """
+        Stops profiling.
+
+        """
+        global _active
+        self.profile.disable()
+        if self._sampling:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+            self._sampling = False
+        self.peak_memory = tracemalloc.get_traced_memory()[1]
+        self.snapshot = tracemalloc.take_snapshot()
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        _active = None
+
+    def stage(self, name):
+        """
+        Records a block of code as a stage.
+
+        :param name: string.
+            Stage name.
+        :return: context manager.
+        """
+        return _Stage(self, name)
+
+    def _sample(self, signum, frame):
+        """
+        Records the stack of the running greenlet, rooted at its stages.
+
+        :param signum: integer.
+        :param frame: frame object.
+            Frame interrupted by the timer.
+        """
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append('{0} ({1}:{2})'.format(code.co_name, os.path.basename(code.co_filename),
+                                                 code.co_firstlineno))
+            frame = frame.f_back
+        stages = ['stage:{0}'.format(name) for name in self.stacks.get(getcurrent(), ())]
+        self.samples[';'.join(stages + frames[::-1])] += 1
+
+    def summary(self, functions=30, allocations=10):
+        """
+        Summarizes the stages, the largest allocations and the functions taking the most time.
+
+        :param functions: integer.
+            Number of functions listed.
+        :param allocations: integer.
+            Number of allocation sites listed.
+        :return: string.
+        """
+        lines = ['{0:<10} {1:>8} {2:>12} {3:>14}'.format('Stage', 'Calls', 'Seconds', 'Memory (KiB)')]
+        for stats in sorted(self.stages.values(), key=lambda stats: stats.seconds, reverse=True):
+            lines.append('{0:<10} {1:>8} {2:>12.3f} {3:>14.1f}'.format(stats.name, stats.calls, stats.seconds,
+                                                                       stats.memory / 1024.0))
+        lines.extend(['', 'Peak memory: {0:.1f} KiB'.format(self.peak_memory / 1024.0), ''])
+        if self.snapshot is not None:
+            lines.append('Largest allocations:')
+            for allocation in self.snapshot.statistics('lineno')[:allocations]:
+                lines.append('    {0}'.format(allocation))
+            lines.append('')
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(functions)
+        lines.append(stream.getvalue())
+        return '\n'.join(lines)
+
+    def save(self, path):
+        """
+        Writes the summary to 'path'.txt, the cProfile data to 'path'.prof and the CPU samples as folded stacks to
+        'path'.folded.
+
+        :param path: string.
+            Path of the files, without extension.
+        """
+        with open(path + '.txt', 'w', encoding='utf-8') as file:
+            file.write(self.summary())
+        self.profile.dump_stats(path + '.prof')
+        with open(path + '.folded', 'w', encoding='utf-8') as file:
+            for stack, count in sorted(self.samples.items()):
+                file.write('{0} {1}\n'.format(stack, count))
+        logger.info('Profile written to {0}.txt, {0}.prof and {0}.folded'.format(path))
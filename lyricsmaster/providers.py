@@ -11,16 +11,25 @@ All lyrics providers inherit from the base class LyricsProvider.
 # implement the required methods in order to have a nice and consistent API.
 from abc import ABCMeta, abstractmethod
 
+import io
 import re
+import string
+import time
+import hashlib
+from collections import Counter
 import urllib3
-from urllib.parse import quote, urlsplit, urlunsplit
-import certifi
+from urllib.parse import quote, unquote, urlsplit, urlunsplit, parse_qsl, urlencode, urljoin
 from bs4 import BeautifulSoup
+from lxml import etree
 
 # We use gevent in order to make asynchronous http requests while downloading lyrics.
 # It is also used to patch the socket module to use SOCKS5 instead to interface with the Tor controller.
+import gevent
 import gevent.monkey
+from gevent import Greenlet
+from gevent.lock import BoundedSemaphore
 from gevent.pool import Pool
+from gevent.queue import Queue
 
 # Python 2.7 compatibility
 # Works for Python 2 and 3
@@ -34,7 +43,13 @@ except ImportError:
 
 # Importing the app models and utilities
 from .models import Song, Album, Discography
-from .utils import normalize, logger
+from .matching import TitleIndex, normalize_title
+from .sitemaps import iter_sitemap_entries
+from .profiling import profiled, stage
+from .deadletters import DeadLetterQueue
+from .network import BufferPool, CircuitBreaker, LatencyTracker, ResponseTooLarge, SingleFlight, read_body, \
+    shared_budget, cached_dns_pool_classes, ssl_context, warm_up, is_failure
+from .utils import normalize, logger, basestring
 
 # TODO: advertise the fact that contributors can add new lyrics providers by conforming the Provider metaclass
 class LyricsProvider:
@@ -45,21 +60,81 @@ class LyricsProvider:
     Tor anonymisation is provided if tor is installed on the system and a TorController is passed at instance creation.
 
     :param tor_controller: TorController Object.
+    :param streaming: bool.
+        Whether lyrics pages are parsed while they are downloaded and the download stopped once the lyrics and
+        writers were read. Only used by providers defining 'stream_markers'.
+    :param memory_budget: network.MemoryBudget object.
+        Budget of the bytes downloaded at the same time. Defaults to the budget shared by all providers.
+    :param archive: archive.WarcWriter object.
+        Archive in which the downloaded pages are saved, so lyrics can be extracted again without downloading them.
+    :param hedging: bool.
+        Whether a second identical request is sent when a request takes longer than most requests to the provider,
+        the first answer being used.
+    :param negative_cache: cache.NegativeCache object.
+        Cache of the artists and lyrics pages the provider does not have, which are then not requested again.
+    :param artist_index: artists.ArtistIndex object.
+        Index of the provider's artists, looked up instead of searching artists on the provider's site.
+    :param compression: integer.
+        Zlib compression level (1 to 9) of the lyrics of the downloaded songs while they are kept in memory. None
+        to keep them uncompressed.
 
     """
     __metaclass__ = ABCMeta
     name = ''
-
-    def __init__(self, tor_controller=None):
+    base_url = ''
+    match_threshold = 0.8  # Minimum similarity for album and song titles to match the requested ones.
+    max_connections = 10  # Maximum number of simultaneous connections to the provider's host.
+    # (tag, class) of the elements of a lyrics page after which nothing else is needed.
+    # Providers reading lyrics pages up to their end leave it empty.
+    stream_markers = ()
+    sitemap_urls = ()  # Sitemaps or sitemap indexes listing the lyrics pages. Empty if they can't be used.
+    stream_chunk_size = 8192
+    max_response_size = 10 * 1024 * 1024  # Responses larger than this are abandoned.
+    breaker_threshold = 5  # Consecutive failed requests after which requests to a host fail fast.
+    breaker_reset_timeout = 30  # Seconds before a host whose requests fail fast is probed again.
+    connect_timeout = 10  # Seconds to connect to the provider's host.
+    read_timeout = 30  # Seconds waiting for data from the provider's host.
+    request_timeout = 40  # Seconds an attempt of a request may take, connecting and reading the headers included.
+    # Retries of a request after connection or read errors. With 'request_timeout', a request takes at most
+    # (request_retries + 1) * request_timeout seconds plus the backoff between its attempts.
+    request_retries = 2
+    request_backoff = 0.5  # Seconds before the second retry of a request, doubled for each retry after it.
+    max_redirects = 10
+    hedge_percentile = 95  # Requests slower than this percentile of the latencies are hedged.
+    hedge_budget = 0.1  # Maximum ratio of hedged requests to sent requests.
+    hedge_min_samples = 20  # Number of latencies needed before hedging requests.
+    preconnections = 4  # Connections opened to the provider's host while its artist page is parsed.
+    retry_concurrency = 2  # Songs of the dead-letter queue downloaded at the same time by the retry pass.
+    retry_attempts = 3  # Downloads of a failed song by the retry pass.
+    retry_backoff = 1  # Seconds before the first retry of a song, doubled for each attempt.
+
+    def __init__(self, tor_controller=None, streaming=False, memory_budget=None, archive=None, hedging=False,
+                 negative_cache=None, artist_index=None, dead_letters=None, compression=None):
         if not self.__socket_is_patched():
             gevent.monkey.patch_socket()
         self.tor_controller = tor_controller
+        self.streaming = streaming
+        self.archive = archive
+        self.hedging = hedging
+        self.negative_cache = negative_cache
+        self.artist_index = artist_index
+        self.compression = compression
+        self.dead_letters = dead_letters if dead_letters is not None else DeadLetterQueue()
         if not self.tor_controller:
             user_agent = {'user-agent': 'Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36'}
-            self.session = urllib3.PoolManager(maxsize=10, cert_reqs='CERT_REQUIRED', ca_certs=certifi.where(),
-                                               headers=user_agent)
+            self.session = urllib3.PoolManager(maxsize=self.max_connections, cert_reqs='CERT_REQUIRED',
+                                               ssl_context=ssl_context(), headers=user_agent)
+            # Host names are resolved through the shared DNS cache. Tor sessions let the proxy resolve them.
+            self.session.pool_classes_by_scheme = cached_dns_pool_classes
         else:
             self.session = self.tor_controller.get_tor_session()
+        self.metrics = Counter()
+        self.memory_budget = memory_budget or shared_budget
+        self._buffers = BufferPool(self.stream_chunk_size)
+        self.circuit_breakers = {}
+        self._in_flight = SingleFlight(self.metrics)
+        self.latencies = LatencyTracker()
+        self._album_pages = {}
         self.__tor_status__()
 
     def __repr__(self):
@@ -121,6 +196,199 @@ class LyricsProvider:
         """
         pass
 
+    def _artist_listing_urls(self):
+        """
+        Lists the urls of the pages listing all the provider's artists, e.g. one page per letter.
+        Providers without artist listings return an empty list.
+
+        :return: list.
+        """
+        return []
+
+    def _extract_artists(self, listing_page):
+        """
+        Extracts the artists of an artist listing page.
+
+        :param listing_page: BeautifulSoup object.
+        :return: list.
+            (name, url) of the artists.
+        """
+        return []
+
+    def update_artist_index(self, index=None, max_age=None):
+        """
+        Crawls the artist listing pages missing from the index, or older than 'max_age', and uses the index to find
+        artist pages from now on.
+
+        :param index: artists.ArtistIndex object.
+            Index to update. Defaults to the provider's index or to a new index.
+        :param max_age: float.
+            Seconds after which a listing page is crawled again. None to only crawl the missing pages.
+        :return: artists.ArtistIndex object.
+        :raises: ValueError if the index belongs to another provider.
+        """
+        from .artists import ArtistIndex
+        if index is None:
+            index = self.artist_index if self.artist_index is not None else ArtistIndex()
+        if index.provider is None:
+            index.provider = self.name
+        elif index.provider != self.name:
+            raise ValueError('The artist index of {0} can not be used by {1}'.format(index.provider, self.name))
+        urls = [url for url in self._artist_listing_urls() if index.is_stale(url, max_age)]
+
+        def fetch_listing(url):
+            req = self.get_page(url)
+            if req is None or req.status != 200:
+                return None
+            return self._extract_artists(self._parse(req.data))
+
+        listings = {}
+        pool = Pool(self.max_connections)
+        for url, artists in zip(urls, pool.imap(fetch_listing, urls)):
+            if artists is not None:
+                listings[url] = artists
+        index.update_listings(listings)
+        logger.info('{0} artist listing pages of {1} crawled, {2} artists indexed'.format(
+            len(listings), self.name, len(index)))
+        self.artist_index = index
+        return index
+
+    def _indexed_artist_url(self, artist):
+        """
+        Looks up the artist page url of the supplied artist in the artist index, by name with or without a leading
+        'the'. Similar names are not used, as they can belong to another artist, e.g. 'Queen' and 'Queen Latifah'.
+
+        :param artist: string.
+        :return: string or None.
+            None if the provider has no index of its own or if the artist is not indexed.
+        """
+        if self.artist_index is None or self.artist_index.provider not in (None, self.name):
+            return None
+        url = self.artist_index.get(artist)
+        if url is not None:
+            self.metrics['artist_index_hits'] += 1
+        return url
+
+    def _parse_song_url(self, url):
+        """
+        Finds the song of a lyrics page from its url, for the urls listed by the provider's sitemaps.
+
+        :param url: string.
+            Url listed by a sitemap.
+        :return: tuple(string, string, string) or None.
+            Artist name, album title and song title. None if the url is not a lyrics page.
+        """
+        return None
+
+    def discover_songs(self, artist=None):
+        """
+        Reads the provider's sitemaps and lists the lyrics pages they contain.
+        Sitemaps are parsed while they are downloaded and sitemap indexes are followed.
+
+        :param artist: string.
+            Artist name. Only the songs of this artist are listed if supplied.
+        :return: iterator.
+            (url, artist name, album title, song title) of the lyrics pages.
+        """
+        artist_key = normalize_title(artist) if artist else None
+        pending = list(self.sitemap_urls)
+        while pending:
+            sitemap_url = pending.pop(0)
+            req = self.get_page(sitemap_url, stream=True)
+            if req is None:
+                continue
+            finished = False
+            try:
+                if req.status != 200:
+                    continue
+                self.metrics['sitemaps_read'] += 1
+                for kind, location in iter_sitemap_entries(req.stream(self.stream_chunk_size)):
+                    if kind == 'sitemap':
+                        pending.append(location)
+                        continue
+                    song = self._parse_song_url(location)
+                    if song and (artist_key is None or normalize_title(song[0]) == artist_key):
+                        self.metrics['songs_discovered'] += 1
+                        yield (location,) + song
+                finished = True
+            finally:
+                if not finished:
+                    req.close()
+                req.release_conn()
+
+    def iter_sitemap_songs(self, artist=None):
+        """
+        Downloads the lyrics of the songs listed by the provider's sitemaps, without reading the artist and album
+        pages. The downloads start while the sitemaps are being read and the songs are yielded as soon as they are
+        downloaded, so a whole site can be mirrored without keeping its lyrics in memory.
+
+        :param artist: string.
+            Artist name. Only the songs of this artist are downloaded if supplied.
+        :return: iterator.
+            models.Song objects, in the order their downloads complete.
+        """
+        pool = Pool(25)
+        downloaded = Queue()
+        discovered = set()
+
+        def download(url, song_title, song_artist, album_title):
+            downloaded.put(self._download_song(url, song_title, song_artist, album_title))
+
+        def discover():
+            for url, song_artist, album_title, song_title in self.discover_songs(artist):
+                self._archive_song(url, song_title, song_artist, album_title)
+                if url not in discovered:
+                    discovered.add(url)
+                    pool.spawn(download, url, song_title, song_artist, album_title)
+            pool.join()
+
+        discovery = gevent.spawn(discover)
+        # Ends the iteration once the sitemaps are read and the songs downloaded, or if the discovery failed.
+        discovery.link(lambda greenlet: downloaded.put(StopIteration))
+        try:
+            for song in downloaded:
+                if isinstance(song, Song):
+                    yield song
+            discovery.get()
+        finally:
+            discovery.kill()
+            pool.kill()
+        logger.info('{0} songs discovered in the sitemaps of {1}'.format(len(discovered), self.name))
+
+    def get_sitemap_lyrics(self, artist=None):
+        """
+        Downloads the lyrics of the songs listed by the provider's sitemaps, without reading the artist and album
+        pages. All the lyrics are kept in memory, use iter_sitemap_songs to process the songs as they are downloaded.
+
+        :param artist: string.
+            Artist name. Only the songs of this artist are downloaded if supplied.
+        :return: list.
+            models.Discography objects, one per artist.
+        """
+        discographies = {}
+        albums = {}
+        for song in self.iter_sitemap_songs(artist):
+            if (song.artist, song.album) not in albums:
+                albums[(song.artist, song.album)] = Album(song.album, song.artist, [])
+                discographies.setdefault(song.artist, Discography(song.artist, [])).albums.append(
+                    albums[(song.artist, song.album)])
+            albums[(song.artist, song.album)].songs.append(song)
+        return list(discographies.values())
+
+    def _make_song_url(self, artist, song):
+        """
+        Builds an url for the lyrics page of the supplied song.
+        Providers whose song urls can not be guessed from the artist name and song title return None,
+        in which case the song is looked up by enumerating the artist's albums.
+
+        :param artist: string.
+            Artist name.
+        :param song: string.
+            Song title.
+        :return: string or None.
+        """
+        return None
+
     @abstractmethod
     def _clean_string(self, text):
         """
@@ -146,6 +414,45 @@ class LyricsProvider:
         """
         pass
 
+    def _listing_page_urls(self, listing_page, url):
+        """
+        Finds the urls of the other pages of a paginated listing, e.g. the list of an artist's albums.
+        Providers without paginated listings return an empty list.
+
+        :param listing_page: BeautifulSoup object.
+            First page of the listing.
+        :param url: string.
+            Url of the first page of the listing.
+        :return: list.
+            Urls of the other pages of the listing.
+        """
+        return []
+
+    def _get_listing(self, url, extract):
+        """
+        Fetches a paginated listing and returns the items of all its pages.
+        The first page tells how many pages there are, the other pages are then fetched concurrently,
+        at most 'max_connections' at a time.
+
+        :param url: string.
+            Url of the first page of the listing.
+        :param extract: function.
+            Returns the list of items of a listing page from the BeautifulSoup page.
+        :return: list.
+            Items of all the pages, in the order of the pages.
+        """
+        def fetch_page(page_url):
+            return self._parse(self._album_page_body(self.get_page(page_url)))
+
+        listing_page = fetch_page(url)
+        items = extract(listing_page)
+        page_urls = self._listing_page_urls(listing_page, url)
+        if page_urls:
+            pool = Pool(self.max_connections)
+            for page in pool.imap(fetch_page, page_urls):
+                items.extend(extract(page))
+        return items
+
     @abstractmethod
     def get_album_infos(self, tag):
         """
@@ -159,6 +466,93 @@ class LyricsProvider:
         """
         pass
 
+    def _album_url(self, album):
+        """
+        Builds the url of the album page of the supplied album.
+        Providers listing the songs of the albums directly on the artist page return None.
+
+        :param album: BeautifulSoup object.
+        :return: string or None.
+        """
+        return None
+
+    def _get_album_page(self, album, release=False):
+        """
+        Fetches and parses the album page of the supplied album.
+        The pages of the albums of a crawl are kept until they are released, so providers reading both the album
+        infos and the songs from the album page download and parse it once per crawl. Concurrent crawls of the
+        same albums share their pages, which are only forgotten once no crawl uses them.
+
+        :param album: BeautifulSoup object.
+        :param release: bool.
+            Whether the page can be forgotten once returned, if no other crawl uses it.
+        :return: BeautifulSoup object.
+        """
+        url = self._album_url(album)
+        entry = self._album_pages.get(url)
+        if entry is None:
+            # The album is not part of a crawl.
+            return self._fetch_album_page(url)
+        album_page = entry[0]
+        if album_page is None:
+            album_page = entry[0] = self._fetch_album_page(url)
+        elif isinstance(album_page, Greenlet):
+            # The page is being prefetched.
+            album_page = album_page.get()
+            if entry[0] is not None:
+                entry[0] = album_page
+        if release and entry[1] <= 1:
+            entry[0] = None
+        return album_page
+
+    @profiled('albums')
+    def _fetch_album_page(self, url):
+        """
+        Fetches and parses the album page at the supplied url.
+
+        :param url: string.
+        :return: BeautifulSoup object.
+            Empty if the page could not be downloaded.
+        """
+        return self._parse(self._album_page_body(self.get_page(url)))
+
+    def _album_page_body(self, req):
+        """
+        Returns the body of an album or listing page, counting the pages which could not be downloaded.
+
+        :param req: urllib3.HTTPResponse object or None.
+        :return: bytes.
+            Empty if the page could not be downloaded.
+        """
+        if req is None or is_failure(req.status):
+            self.metrics['album_pages_failed'] += 1
+            return b''
+        return req.data
+
+    def _prefetch_album_pages(self, albums):
+        """
+        Starts downloading the album pages of the supplied albums concurrently, at most 'max_connections' at a time.
+        The pages are picked up by '_get_album_page' and kept until the crawl calls '_forget_album_pages'.
+
+        :param albums: list.
+            List of BeautifulSoup objects.
+        """
+        semaphore = BoundedSemaphore(self.max_connections)
+
+        def fetch(url):
+            with semaphore:
+                return self._fetch_album_page(url)
+
+        for album in albums:
+            url = self._album_url(album)
+            if not url:
+                continue
+            # [page or greenlet prefetching it or None once released, number of crawls using the page]
+            entry = self._album_pages.setdefault(url, [None, 0])
+            entry[1] += 1
+            if entry[0] is None:
+                entry[0] = gevent.spawn(fetch, url)
+
     @abstractmethod
     def get_songs(self, album):
         """
@@ -171,19 +565,110 @@ class LyricsProvider:
         """
         pass
 
-    @abstractmethod
-    def create_song(self, link, artist, album_title):
+    def _song_url(self, link):
         """
-        Must be implemented by children classes conforming to the LyricsMaster API.
+        Builds the url of the lyrics page from the supplied link.
+
+        :param link: BeautifulSoup Link object.
+        :return: string.
+        """
+        if not link.attrs['href'].startswith(self.base_url):
+            return self.base_url + link.attrs['href']
+        return link.attrs['href']
 
+    def _song_title(self, link):
+        """
+        Extracts the song title from the supplied link.
+
+        :param link: BeautifulSoup Link object.
+        :return: string or None.
+            None if the song should not be downloaded.
+        """
+        return link.text
+
+    def create_song(self, link, artist, album_title):
+        """
         Creates a Song object.
+        Providers customize it through '_song_url', '_song_title', 'extract_lyrics' and 'extract_writers'.
 
         :param link: BeautifulSoup Link object.
         :param artist: string.
         :param album_title: string.
         :return: models.Song object or None.
         """
-        pass
+        song_title = self._song_title(link)
+        if not song_title:
+            return None
+        return self._download_song(self._song_url(link), song_title, artist, album_title)
+
+    @profiled('song')
+    def _download_song(self, url, song_title, artist, album_title):
+        """
+        Downloads the lyrics page at the supplied url and creates a Song object.
+
+        :param url: string.
+            Lyrics url.
+        :param song_title: string.
+        :param artist: string.
+        :param album_title: string.
+        :return: models.Song object or None.
+        """
+        try:
+            raw_lyrics_page, lyrics_page, failure = self._load_lyrics_page(url)
+            if failure:
+                self.dead_letters.add(url, self.name, song_title, artist, album_title, failure)
+                return None
+            self.dead_letters.discard(url)
+            if not raw_lyrics_page:
+                return None
+            lyrics = self.extract_lyrics(lyrics_page)
+            if lyrics is None:
+                return None
+            writers = self.extract_writers(lyrics_page)
+        except Exception as e:
+            logger.warning('Error {0} while downloading {1}'.format(e, url))
+            self.dead_letters.add(url, self.name, song_title, artist, album_title, repr(e))
+            return None
+        return Song(song_title, album_title, artist, lyrics, writers, self.compression)
+
+    def retry_dead_letters(self, urls=None):
+        """
+        Downloads again the songs of the dead-letter queue, 'retry_concurrency' at a time.
+        The songs still failing are retried in up to 'retry_attempts' rounds and the delay before each round
+        doubles. The songs downloaded are removed from the queue.
+
+        :param urls: iterable.
+            Urls of the songs to retry. Defaults to the songs of the queue which failed on this provider.
+        :return: dict.
+            Maps the urls to the songs downloaded.
+        """
+        if urls is None:
+            urls = [url for url, entry in self.dead_letters if entry['provider'] == self.name]
+        recovered = {}
+
+        def retry(url):
+            entry = self.dead_letters.get(url)
+            song = self._download_song(url, entry['title'], entry['artist'], entry['album'])
+            if song is not None:
+                recovered[url] = song
+
+        for attempt in range(self.retry_attempts):
+            # Songs whose page turned out to be missing are not in the queue anymore.
+            urls = [url for url in urls if url in self.dead_letters]
+            if not urls:
+                break
+            gevent.sleep(self.retry_backoff * 2 ** attempt)
+            pool = Pool(self.retry_concurrency)
+            try:
+                for url in urls:
+                    pool.spawn(retry, url)
+                pool.join()
+            finally:
+                pool.kill()
+        self.metrics['dead_letters_recovered'] += len(recovered)
+        logger.info('{0} failed songs recovered, {1} left in the dead-letter queue'.format(
+            len(recovered), len(self.dead_letters)))
+        return recovered
 
     @abstractmethod
     def extract_lyrics(self, lyrics_page):
@@ -213,26 +698,242 @@ class LyricsProvider:
         """
         pass
 
-    def get_page(self, url):
+    @profiled('parse')
+    def _parse(self, raw_html):
+        """
+        Parses the supplied raw html page.
+        All the pages downloaded by the providers go through this method.
+        Pages are decoded as utf-8 whatever their declared encoding, as some providers declare wrong encodings.
+
+        :param raw_html: bytes.
+            Raw html page.
+        :return: BeautifulSoup object.
+        """
+        return BeautifulSoup(raw_html.decode('utf-8', 'ignore'), 'lxml')
+
+    def get_page(self, url, stream=False):
         """
         Fetches the supplied url and returns a request object.
+        The body is read within the memory budget and responses larger than 'max_response_size' are abandoned.
+        Concurrent requests of the same url share a single download and response, unless they are streamed.
+        Requests which are not streamed are hedged if the provider is hedging.
 
         :param url: string.
+        :param stream: bool.
+            Whether the body is left unread, to be read with the 'stream' method of the response.
         :return: urllib3.response.HTTPResponse Object or None.
         """
         if not self.__socket_is_patched():
             gevent.monkey.patch_socket()
+        url = self._quote_url(url)
+        if stream:
+            return self._request(url, stream=True)
+        return self._in_flight.do(url, self._hedged_request if self.hedging else self._request, url)
+
+    def _hedged_request(self, url):
+        """
+        Sends a request for the supplied quoted url and, if it is slower than 'hedge_percentile' of the latencies,
+        a second identical request on another connection. The first answer is returned and the other request
+        is cancelled.
+        Hedged requests are limited to 'hedge_budget' of the sent requests and counted in the metrics as
+        'requests_hedged', those answered first as 'hedges_won'.
+
+        :param url: string.
+        :return: urllib3.response.HTTPResponse Object or None.
+        """
+        if len(self.latencies) < self.hedge_min_samples:
+            return self._request(url)
+        request = gevent.spawn(self._request, url)
+        hedge = None
+        try:
+            request.join(timeout=self.latencies.percentile(self.hedge_percentile))
+            if request.ready() or self.metrics['requests_hedged'] >= self.hedge_budget * self.metrics['requests_sent']:
+                return request.get()
+            self.metrics['requests_hedged'] += 1
+            hedge = gevent.spawn(self._request, url)
+            first = gevent.wait([request, hedge], count=1)[0]
+            other = hedge if first is request else request
+            if first.value is None:
+                # The first answer failed, the other request may still succeed.
+                other.join()
+                first = other
+            if first is hedge:
+                self.metrics['hedges_won'] += 1
+            return first.value
+        finally:
+            gevent.killall([greenlet for greenlet in (request, hedge) if greenlet is not None], block=False)
+
+    def _quote_url(self, url):
+        """
+        Quotes the path, query and fragment of the supplied url.
+
+        :param url: string.
+        :return: string.
+        """
+        split_url = list(urlsplit(url))
+        split_url[2:] = [quote(elmt, safe='/=+&%') for elmt in split_url[2:]]
+        return urlunsplit(split_url)
+
+    @profiled('request')
+    def _request(self, url, stream=False):
+        """
+        Sends a request for the supplied quoted url.
+
+        :param url: string.
+        :param stream: bool.
+            Whether the body is left unread.
+        :return: urllib3.response.HTTPResponse Object or None.
+        """
+        circuit_breaker = self._circuit_breaker(url)
+        if not circuit_breaker.allow():
+            self.metrics['requests_short_circuited'] += 1
+            logger.debug('Skipped url {0} as {1} is failing'.format(url, circuit_breaker.host))
+            return None
+        probe = circuit_breaker.state == CircuitBreaker.HALF_OPEN
+        self.metrics['requests_sent'] += 1
+        start = time.time()
         try:
-            split_url = list(urlsplit(url))
-            split_url[2:] = [quote(elmt, safe='/=+&%') for elmt in split_url[2:]]
-            url = urlunsplit(split_url)
-            req = self.session.request('GET', url, retries=30)
+            timeout = urllib3.Timeout(connect=self.connect_timeout, read=self.read_timeout,
+                                      total=self.request_timeout)
+            # The total also bounds the errors which are neither connection nor read errors.
+            retries = urllib3.Retry(total=self.request_retries + self.max_redirects, connect=self.request_retries,
+                                    read=self.request_retries, redirect=self.max_redirects,
+                                    backoff_factor=self.request_backoff)
+            req = self.session.request('GET', url, retries=retries, timeout=timeout, preload_content=False)
         except Exception as e:
-            logger.exception(e)
+            circuit_breaker.record_failure()
+            logger.debug('Error while downloading url {0}'.format(url), exc_info=True)
+            logger.warning('Unable to download url {0}: {1}'.format(url, e))
+            return None
+        finally:
+            if probe:
+                # A probe killed by a deadline or a hedge records nothing, the host is probed again.
+                circuit_breaker.release()
+        if is_failure(req.status):
+            circuit_breaker.record_failure()
+        else:
+            circuit_breaker.record_success()
+        if stream:
+            return req
+        try:
+            req = self._read_response(req, url)
+            self.latencies.record(time.time() - start)
+        except ResponseTooLarge:
+            self.metrics['responses_too_large'] += 1
             req = None
-            logger.warning('Unable to download url ' + url)
+            logger.warning('Abandoned url {0} larger than {1} bytes'.format(url, self.max_response_size))
+        except Exception as e:
+            req = None
+            logger.warning('Unable to download url {0}: {1}'.format(url, e))
         return req
 
+    def _circuit_breaker(self, url):
+        """
+        Returns the circuit breaker of the host of the supplied url.
+
+        :param url: string.
+        :return: network.CircuitBreaker object.
+        """
+        host = urlsplit(url).netloc
+        if host not in self.circuit_breakers:
+            self.circuit_breakers[host] = CircuitBreaker(host, self.metrics, self.breaker_threshold,
+                                                         self.breaker_reset_timeout)
+        return self.circuit_breakers[host]
+
+    def is_available(self):
+        """
+        Checks if the provider's host is answering, i.e. if its requests are not failing fast.
+
+        :return: bool.
+        """
+        circuit_breaker = self.circuit_breakers.get(urlsplit(self.base_url).netloc)
+        return circuit_breaker is None or circuit_breaker.state != CircuitBreaker.OPEN
+
+    def _read_response(self, req, url):
+        """
+        Reads the body of the supplied response and gives its connection back to the pool.
+        The page is archived if the provider has an archive.
+
+        :param req: urllib3.response.HTTPResponse Object.
+            Response whose body was not read.
+        :param url: string.
+            Url of the response.
+        :return: urllib3.response.HTTPResponse Object.
+            Response holding the body.
+        """
+        try:
+            body = read_body(req, self.max_response_size, self.memory_budget, self._buffers)
+        except Exception:
+            # The rest of the body is not read, so the connection can not be reused.
+            req.close()
+            raise
+        finally:
+            req.release_conn()
+        self.metrics['bytes_downloaded'] += len(body)
+        if self.archive:
+            self.archive.write_response(url, req.status, req.headers, body)
+        return urllib3.HTTPResponse(body=io.BytesIO(body), headers=req.headers, status=req.status, reason=req.reason,
+                                    decode_content=False)
+
+    def _stream_page(self, url):
+        """
+        Downloads the page at the supplied url until all the elements of 'stream_markers' were parsed, then closes
+        the connection without reading the rest of the page.
+        The page is read within the memory budget and abandoned if it is larger than 'max_response_size'.
+
+        :param url: string.
+        :return: bytes or None.
+            Beginning of the raw html page, or the whole page if some markers were not found.
+        """
+        req = self.get_page(url, stream=True)
+        if req is None:
+            return None
+        if is_failure(req.status):
+            req.close()
+            req.release_conn()
+            return None
+        parser = etree.HTMLPullParser(events=('end',))
+        remaining = set(self.stream_markers)
+        chunks = []
+        size = 0
+        reserved = self.stream_chunk_size
+        self.memory_budget.acquire(reserved)
+        finished = False
+        try:
+            for chunk in req.stream(self.stream_chunk_size):
+                size += len(chunk)
+                if size > self.max_response_size:
+                    self.metrics['responses_too_large'] += 1
+                    logger.warning('Abandoned url {0} larger than {1} bytes'.format(url, self.max_response_size))
+                    return None
+                if size > reserved:
+                    self.memory_budget.grow(size - reserved)
+                    reserved = size
+                chunks.append(chunk)
+                self.metrics['bytes_downloaded'] += len(chunk)
+                parser.feed(chunk)
+                for event, element in parser.read_events():
+                    classes = (element.get('class') or '').split()
+                    remaining.difference_update([(tag, class_) for tag, class_ in remaining
+                                                 if element.tag == tag and class_ in classes])
+                if not remaining:
+                    self.metrics['streams_stopped_early'] += 1
+                    break
+            else:
+                finished = True
+        finally:
+            if not finished:
+                # Closing the connection is what stops the download of the rest of the page.
+                req.close()
+            req.release_conn()
+            self.memory_budget.release(reserved)
+        raw_html = b''.join(chunks)
+        if self.archive:
+            self.archive.write_response(self._quote_url(url), req.status, req.headers, raw_html,
+                                        truncated=not finished)
+        return raw_html
+
+    @profiled('artist')
     def get_artist_page(self, artist):
         """
         Fetches the web page for the supplied artist.
@@ -243,15 +944,70 @@ class LyricsProvider:
             Artist's raw html page. None if the artist page was not found.
         """
         artist = self._clean_string(artist)
+        # Some providers search the artist to build the url, so misses are cached by artist rather than by url.
+        miss_key = '{0}:artist:{1}'.format(self.name, artist)
+        if self._is_known_miss(miss_key):
+            return None
         url = self._make_artist_url(artist)
+        if url is False:
+            # The site search answered without the artist.
+            self._add_miss(miss_key)
+            return None
         if not url:
             return None
-        raw_html = self.get_page(url).data
-        artist_page = BeautifulSoup(raw_html.decode('utf-8', 'ignore'), 'lxml')
+        req = self.get_page(url)
+        if req is None or is_failure(req.status):
+            return None
+        self._warm_up(url)
+        raw_html = req.data
+        artist_page = self._parse(raw_html)
         if not self._has_artist(artist_page):
+            self._add_miss(miss_key)
             return None
         return raw_html
 
+    def _warm_up(self, url):
+        """
+        Starts opening 'preconnections' connections to the host of the supplied url in the background, so that the
+        album and lyrics pages downloaded next skip the connection and TLS handshakes.
+        The connections are counted in the metrics as 'connections_prewarmed'.
+
+        :param url: string.
+        """
+        if not self.preconnections or not isinstance(self.session, urllib3.PoolManager):
+            return
+
+        def open_connections(session):
+            self.metrics['connections_prewarmed'] += warm_up(session, url,
+                                                             min(self.preconnections, self.max_connections))
+
+        gevent.spawn(open_connections, self.session)
+        # Lets the connections start before the page is parsed, which does not yield to other greenlets.
+        gevent.sleep(0)
+
+    def _is_known_miss(self, key):
+        """
+        Checks if the negative cache knows the supplied artist or lyrics page is missing.
+
+        :param key: string.
+            Artist key or lyrics url.
+        :return: bool.
+        """
+        if self.negative_cache is not None and key in self.negative_cache:
+            self.metrics['negative_cache_hits'] += 1
+            return True
+        return False
+
+    def _add_miss(self, key):
+        """
+        Adds a missing artist or lyrics page to the negative cache.
+
+        :param key: string.
+            Artist key or lyrics url.
+        """
+        if self.negative_cache is not None:
+            self.negative_cache.add(key)
+
     def get_lyrics_page(self, url):
         """
         Fetches the web page containing the lyrics at the supplied url.
@@ -261,69 +1017,407 @@ class LyricsProvider:
         :return: string or None.
             Lyrics's raw html page. None if the lyrics page was not found.
         """
-        try:
-            raw_html = self.get_page(url).data
-        except AttributeError:
-            return None
-        lyrics_page = BeautifulSoup(raw_html.decode('utf-8', 'ignore'), 'lxml')
+        return self._fetch_lyrics_page(url)[0]
+
+    def _fetch_lyrics_page(self, url):
+        """
+        Fetches and parses the web page containing the lyrics at the supplied url.
+
+        :param url: string.
+            Lyrics url.
+        :return: tuple(string, BeautifulSoup object).
+            Lyrics's raw and parsed html page. (None, None) if the lyrics page was not found.
+        """
+        raw_html, lyrics_page, failure = self._load_lyrics_page(url)
+        return raw_html, lyrics_page
+
+    def _load_lyrics_page(self, url):
+        """
+        Fetches and parses the web page containing the lyrics at the supplied url, telling failed downloads from
+        missing pages.
+
+        :param url: string.
+            Lyrics url.
+        :return: tuple(string, BeautifulSoup object, string).
+            Lyrics's raw and parsed html page, which are None if the page was not found or not downloaded, and the
+            reason why the download failed, None unless it failed.
+        """
+        if self._is_known_miss(url):
+            return None, None, None
+        if self.streaming and self.stream_markers:
+            raw_html = self._stream_page(url)
+            if raw_html is None:
+                return None, None, 'No response'
+        else:
+            req = self.get_page(url)
+            if req is None:
+                return None, None, 'No response'
+            if is_failure(req.status):
+                return None, None, 'Http status {0}'.format(req.status)
+            raw_html = req.data
+        lyrics_page = self._parse(raw_html)
         if not self._has_lyrics(lyrics_page):
+            self._add_miss(url)
+            return None, None, None
+        return raw_html, lyrics_page, None
+
+    def get_song(self, artist, song, album=None):
+        """
+        Fetches a single song directly from its lyrics page, without downloading the artist's albums.
+
+        :param artist: string.
+            Artist name.
+        :param song: string.
+            Song title.
+        :param album: string.
+            Album title.
+        :return: models.Song object or None.
+            None if the song url can not be guessed or if the lyrics page was not found.
+        """
+        url = self._make_song_url(artist, song)
+        if not url:
             return None
-        return raw_html
+        self._archive_song(url, song, artist, album or 'Unknown')
+        return self._download_song(url, song, artist, album or 'Unknown')
 
-    def get_lyrics(self, artist, album=None, song=None):
+    def _archive_song(self, url, song_title, artist, album_title, release_date='Unknown'):
+        """
+        Archives which song the lyrics page at the supplied url belongs to, if the provider has an archive.
+
+        :param url: string.
+            Lyrics url.
+        :param song_title: string.
+        :param artist: string.
+        :param album_title: string.
+        :param release_date: string.
+        """
+        if self.archive:
+            self.archive.write_metadata(self._quote_url(url), {'provider': self.name, 'artist': artist,
+                                                               'album': album_title, 'release_date': release_date,
+                                                               'title': song_title})
+
+    def get_lyrics(self, artist, album=None, song=None, deadline=None):
         """
         This is the main method of this class.
         Connects to the Lyrics Provider and downloads lyrics for all the albums of the supplied artist and songs.
         Returns a Discography Object or None if the artist was not found on the Lyrics Provider.
+        The discography is not complete if the deadline was reached or if pages or songs could not be downloaded.
 
         :param artist: string.
             Artist name.
         :param album: string.
             Album title.
         :param song: string.
-            Song title.
+            Song title. Without an album, the song is fetched from its own lyrics page when its url can be guessed,
+            and its album and release date are then 'Unknown'.
+        :param deadline: float.
+            Maximum duration of the crawl in seconds. When it is reached, the pending downloads are cancelled and the
+            songs downloaded so far are returned.
         :return: models.Discography object or None.
         """
+        timeout = gevent.Timeout.start_new(deadline) if deadline else None
+        try:
+            return self._get_lyrics(artist, album, song, timeout)
+        except gevent.Timeout as e:
+            if e is not timeout:
+                raise
+            self.metrics['deadlines_exceeded'] += 1
+            logger.warning('Deadline of {0} seconds reached before downloading any album'.format(deadline))
+            return None
+        finally:
+            if timeout:
+                timeout.close()
+
+    def _get_lyrics(self, artist, album, song, timeout):
+        """
+        Downloads the lyrics of the supplied artist, album and song.
 
+        :param artist: string.
+        :param album: string.
+        :param song: string.
+        :param timeout: gevent.Timeout object or None.
+            Deadline of the crawl.
+        :return: models.Discography object or None.
+        """
+        if song and not album:
+            # Tries the song's own page first and only enumerates the whole discography on a miss. The song's page
+            # does not tell its album, so a supplied album is checked against the discography instead.
+            song_obj = self.get_song(artist, song)
+            if song_obj:
+                logger.info('{0} successfully downloaded'.format(song_obj.title))
+                return Discography(artist, [Album(song_obj.album, artist, [song_obj])])
         raw_html = self.get_artist_page(artist)
         if not raw_html:
-            logger.warning('{0} was not found on {1}'.format(artist, self.name))
+            logger.warning('{0} was not found on {1}{2}'.format(artist, self.name, self._suggest_artists(artist)))
             return None
-        albums = self.get_albums(raw_html)
+        # Failed album pages are counted per provider, so a failure of a concurrent crawl marks this one as
+        # incomplete too.
+        album_pages_failed = self.metrics['album_pages_failed']
+        with stage('albums'):
+            all_albums = self.get_albums(raw_html)
+        self._prefetch_album_pages(all_albums)
+        try:
+            discography = self._download_albums(artist, all_albums, album, song, timeout)
+        finally:
+            self._forget_album_pages(all_albums)
+        if self.metrics['album_pages_failed'] > album_pages_failed:
+            discography.complete = False
+        return discography
+
+    def _suggest_artists(self, artist):
+        """
+        Suggests the indexed artists whose name is similar to the supplied name, for the messages of the misses.
+
+        :param artist: string.
+        :return: string.
+            Empty if the provider has no index or no similar artist.
+        """
+        if self.artist_index is None or self.artist_index.provider not in (None, self.name):
+            return ''
+        names = [name for name, url in self.artist_index.search(artist, self.match_threshold)[:3]]
+        return ', did you mean {0}?'.format(' or '.join(names)) if names else ''
+
+    def _forget_album_pages(self, all_albums):
+        """
+        Forgets the album pages of a crawl, e.g. those of filtered out albums, unless other crawls still use them.
+
+        :param all_albums: list.
+            List of BeautifulSoup objects.
+        """
+        for elmt in all_albums:
+            url = self._album_url(elmt)
+            entry = self._album_pages.get(url)
+            if entry is None:
+                continue
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._album_pages[url]
+                if isinstance(entry[0], Greenlet):
+                    entry[0].kill(block=False)
+
+    def get_library_lyrics(self, artist, albums):
+        """
+        Downloads the lyrics of a set of songs of an artist, e.g. the tracks of a music library.
+        The artist page is fetched once and the albums are downloaded concurrently. The songs which are not found
+        on their album are then fetched from their own lyrics page.
+
+        :param artist: string.
+            Artist name.
+        :param albums: dict.
+            Maps album titles to lists of song titles. Songs whose album is unknown are listed under None.
+        :return: dict.
+            Maps the (album title, song title) found to models.Song objects.
+        """
+        found = {}
+        raw_html = self.get_artist_page(artist) if any(albums) else None
+        if raw_html:
+            all_albums = self.get_albums(raw_html)
+            self._prefetch_album_pages(all_albums)
+            try:
+                # Only the wanted songs of the albums are downloaded.
+                crawls = dict((album_title, gevent.spawn(self._download_albums, artist, all_albums, album_title,
+                                                         albums[album_title]))
+                              for album_title in albums if album_title)
+                gevent.joinall(list(crawls.values()))
+            finally:
+                self._forget_album_pages(all_albums)
+            for album_title, crawl in crawls.items():
+                if not crawl.value:
+                    continue
+                songs = TitleIndex(list(crawl.value.iter_songs()), key=lambda song: song.title)
+                for song_title in albums[album_title]:
+                    matches = songs.search(song_title, self.match_threshold)
+                    if matches:
+                        found[(album_title, song_title)] = matches[0]
+        pool = Pool(self.max_connections)
+        lookups = dict(((album_title, song_title), pool.spawn(self.get_song, artist, song_title, album_title))
+                       for album_title, song_titles in albums.items() for song_title in song_titles
+                       if (album_title, song_title) not in found)
+        pool.join()
+        for key, lookup in lookups.items():
+            if isinstance(lookup.value, Song):
+                found[key] = lookup.value
+        return found
+
+    def _download_albums(self, artist, all_albums, album=None, song=None, timeout=None):
+        """
+        Downloads the lyrics of the supplied albums.
+
+        :param artist: string.
+            Artist name.
+        :param all_albums: list.
+            List of BeautifulSoup objects.
+        :param album: string.
+            Album title.
+        :param song: string or list.
+            Song title, or list of the song titles to download.
+        :param timeout: gevent.Timeout object.
+            Deadline of the crawl. When it expires, the albums downloaded so far are returned.
+        :return: models.Discography object.
+            Not complete if the deadline was reached or if songs of the crawl could not be downloaded.
+        """
+        albums = []
+        complete = True
+        with stage('albums'):
+            for elmt in all_albums:
+                try:
+                    albums.append((elmt, self.get_album_infos(elmt)))
+                except ValueError as e:
+                    logger.warning('Error {0} while reading the album {1}'.format(e, elmt.text.strip()))
         if album:
             # If user supplied a specific album
-            albums = [elmt for elmt in albums if album.lower() in self.get_album_infos(elmt)[0].lower()]
+            albums = TitleIndex(albums, key=lambda elmt: elmt[1][0]).search(album, self.match_threshold)
+        song_titles = [song] if isinstance(song, basestring) else song
         album_objects = []
-        for elmt in albums:
-            try:
-                album_title, release_date = self.get_album_infos(elmt)
-            except ValueError as e:
-                logger.warning('Error {0} while downloading {1}'.format(e, album_title))
-                continue
-            song_links = self.get_songs(elmt)
-            song_links = [link for link in song_links if link]
-            if song:
-                # If user supplied a specific song
-                song_links = [link for link in song_links if song.lower() in link.text.lower()]
-            if self.tor_controller and self.tor_controller.controlport:
-                # Renew Tor circuit before starting downloads.
-                self.tor_controller.renew_tor_circuit()
-                self.session = self.tor_controller.get_tor_session()
-            if song_links:
-                logger.info('Downloading {0}'.format(album_title))
-                pool = Pool(25)  # Sets the worker pool for async requests. 25 is a nice value to not annoy site owners ;)
-                results = [pool.spawn(self.create_song, *(link, artist, album_title)) for link in song_links]
-                pool.join()  # Gathers results from the pool
-                songs = [song.value for song in results if song.value]
-                if songs:
-                    album_obj = Album(album_title, artist, songs, release_date)
-                    album_objects.append(album_obj)
-                    logger.info('{0} successfully downloaded'.format(album_title))
-                else:
-                    logger.info('Skipped downloading {0} as no lyrics matched.'.format(album_title))
-        discography = Discography(artist, album_objects)
+        # Songs listed on several albums are downloaded once per crawl and shared by the albums.
+        downloads = {}
+        songs_by_content = {}
+        requests_saved = self.metrics['requests_saved']
+        pool = None
+        results = []
+        # (album, title, release date, song urls) of the albums downloaded, for the retry pass.
+        crawled_albums = []
+        try:
+            for elmt, (album_title, release_date) in albums:
+                with stage('albums'):
+                    song_links = self.get_songs(elmt)
+                song_links = [link for link in song_links if link]
+                if song_titles:
+                    # If user supplied specific songs
+                    song_index = TitleIndex(song_links, key=lambda link: self._song_title(link) or link.text)
+                    song_links = []
+                    for title in song_titles:
+                        for link in song_index.search(title, self.match_threshold):
+                            if not any(link is wanted for wanted in song_links):
+                                song_links.append(link)
+                if self.tor_controller and self.tor_controller.controlport:
+                    # Renew Tor circuit before starting downloads.
+                    self.tor_controller.renew_tor_circuit()
+                    self.session = self.tor_controller.get_tor_session()
+                if song_links:
+                    logger.info('Downloading {0}'.format(album_title))
+                    pool = Pool(25)  # Sets the worker pool for async requests. 25 is a nice value to not annoy site owners ;)
+                    results = []
+                    urls = []
+                    for link in song_links:
+                        url = self._song_url(link)
+                        if self.archive and self._song_title(link):
+                            self._archive_song(url, self._song_title(link), artist, album_title, release_date)
+                        if url in downloads:
+                            self.metrics['requests_saved'] += 1
+                        else:
+                            downloads[url] = pool.spawn(self.create_song, *(link, artist, album_title))
+                        results.append(downloads[url])
+                        urls.append(url)
+                    pool.join()  # Gathers results from the pool
+                    album_object = self._add_album(album_objects, album_title, artist, release_date, results,
+                                                   songs_by_content)
+                    crawled_albums.append((album_object, album_title, release_date, urls))
+                    results = []
+            failed = [url for url in downloads if url in self.dead_letters]
+            if failed:
+                logger.info('Retrying {0} failed songs'.format(len(failed)))
+                recovered = self.retry_dead_letters(failed)
+                if recovered:
+                    album_objects[:] = self._add_recovered_songs(crawled_albums, artist, downloads, recovered,
+                                                                 songs_by_content)
+                complete = not any(url in self.dead_letters for url in failed)
+        except gevent.Timeout as e:
+            if e is not timeout:
+                raise
+            complete = False
+            self.metrics['deadlines_exceeded'] += 1
+            logger.warning('Deadline reached, the pending downloads are cancelled')
+            if pool is not None:
+                pool.kill()
+            if results:
+                # Keeps the songs of the current album downloaded before the deadline.
+                self._add_album(album_objects, album_title, artist, release_date, results, songs_by_content)
+        if self.metrics['requests_saved'] > requests_saved:
+            logger.info('{0} requests saved by downloading duplicate songs once'.format(
+                self.metrics['requests_saved'] - requests_saved))
+        discography = Discography(artist, album_objects, complete)
         return discography
 
+    def _add_album(self, album_objects, album_title, artist, release_date, results, songs_by_content):
+        """
+        Creates an Album object with the songs downloaded by the supplied greenlets.
+
+        :param album_objects: list.
+            Albums of the crawl, to which the album is added if it has songs.
+        :param album_title: string.
+        :param artist: string.
+        :param release_date: string.
+        :param results: list.
+            Greenlets downloading the songs. Cancelled greenlets and songs without lyrics are left out.
+        :param songs_by_content: dict.
+            Songs of the crawl by title and lyrics hash.
+        :return: models.Album object or None.
+            None if the album has no songs.
+        """
+        songs = [self._deduplicate(result.value, songs_by_content) for result in results
+                 if isinstance(result.value, Song)]
+        if songs:
+            album_objects.append(Album(album_title, artist, songs, release_date))
+            logger.info('{0} successfully downloaded'.format(album_title))
+            return album_objects[-1]
+        logger.info('Skipped downloading {0} as no lyrics matched.'.format(album_title))
+        return None
+
+    def _add_recovered_songs(self, crawled_albums, artist, downloads, recovered, songs_by_content):
+        """
+        Adds the songs recovered by the retry pass to their albums, at the position of their links.
+
+        :param crawled_albums: list.
+            (album, title, release date, song urls) of the albums downloaded, in crawl order. The album is None if
+            none of its songs were downloaded.
+        :param artist: string.
+        :param downloads: dict.
+            Greenlets of the crawl downloading the songs, by url.
+        :param recovered: dict.
+            Songs recovered, by url.
+        :param songs_by_content: dict.
+            Songs of the crawl by title and lyrics hash.
+        :return: list.
+            Albums of the crawl.
+        """
+        album_objects = []
+        for album, album_title, release_date, urls in crawled_albums:
+            if any(url in recovered for url in urls):
+                # The songs of the album were added in the order of the urls which were downloaded.
+                songs = iter(album.songs if album is not None else [])
+                album_songs = []
+                for url in urls:
+                    if isinstance(downloads[url].value, Song):
+                        album_songs.append(next(songs))
+                    elif url in recovered:
+                        album_songs.append(self._deduplicate(recovered[url], songs_by_content))
+                if album is None:
+                    album = Album(album_title, artist, album_songs, release_date)
+                else:
+                    album.songs = album_songs
+            if album is not None:
+                album_objects.append(album)
+        return album_objects
+
+    def _deduplicate(self, song, songs_by_content):
+        """
+        Returns the first song of the crawl with the same title and lyrics as the supplied song.
+        Catches the same track published under different urls.
+
+        :param song: models.Song object.
+        :param songs_by_content: dict.
+            Songs of the crawl by title and lyrics hash.
+        :return: models.Song object.
+        """
+        if not song.lyrics:
+            return song
+        key = (normalize_title(song.title), hashlib.sha1(song.lyrics.encode('utf-8')).digest())
+        first_song = songs_by_content.setdefault(key, song)
+        if first_song is not song:
+            self.metrics['duplicate_songs'] += 1
+        return first_song
+
 
 class LyricWiki(LyricsProvider):
     """
@@ -333,6 +1427,10 @@ class LyricWiki(LyricsProvider):
     """
     base_url = 'http://lyrics.wikia.com'
     name = 'LyricWiki'
+    stream_markers = (('div', 'lyricbox'), ('table', 'song-credit-box'))
+    sitemap_urls = ('http://lyrics.wikia.com/sitemap-newsitemapxml-index.xml',)
+    # Wiki pages which are not songs although their title contains a colon.
+    _namespaces = ('Category', 'File', 'Help', 'LyricWiki', 'Special', 'Template', 'User', 'User_blog', 'Talk')
 
     def _has_lyrics(self, lyrics_page):
         """
@@ -355,6 +1453,35 @@ class LyricWiki(LyricsProvider):
         url = self.base_url + '/wiki/' + artist
         return url
 
+    def _make_song_url(self, artist, song):
+        """
+        Builds an url for the lyrics page of the supplied song.
+
+        :param artist: string.
+            Artist name.
+        :param song: string.
+            Song title.
+        :return: string.
+        """
+        return self.base_url + '/wiki/' + self._clean_string(artist) + ':' + self._clean_string(song)
+
+    def _parse_song_url(self, url):
+        """
+        Finds the song of a lyrics page from its url, http://lyrics.wikia.com/wiki/Artist:Song_Title .
+        Album pages, whose title ends with the release year, and the other wiki pages are left out.
+        The album of a song can't be told from its url.
+
+        :param url: string.
+        :return: tuple(string, string, string) or None.
+        """
+        path = unquote(urlsplit(url).path)
+        if not path.startswith('/wiki/') or ':' not in path:
+            return None
+        artist, song = path[len('/wiki/'):].split(':', 1)
+        if not artist or not song or artist in self._namespaces or re.search(r'_\(\d{4}\)$', song):
+            return None
+        return artist.replace('_', ' '), 'Unknown', song.replace('_', ' ')
+
     def get_album_page(self, artist, album):
         """
         Fetches the album page for the supplied artist and album.
@@ -369,8 +1496,11 @@ class LyricWiki(LyricsProvider):
         artist = self._clean_string(artist)
         album = self._clean_string(album)
         url = self.base_url + '/wiki/' + artist + ':' + album
-        raw_html = self.get_page(url).data
-        album_page = BeautifulSoup(raw_html.decode('utf-8', 'ignore'), 'lxml')
+        req = self.get_page(url)
+        if req is None or req.status != 200:
+            return None
+        raw_html = req.data
+        album_page = self._parse(raw_html)
         if album_page.find("div", {'class': 'noarticletext'}):
             return None
         return raw_html
@@ -383,7 +1513,7 @@ class LyricWiki(LyricsProvider):
         :return: list.
             List of BeautifulSoup objects.
         """
-        artist_page = BeautifulSoup(raw_artist_page.decode('utf-8', 'ignore'), 'lxml')
+        artist_page = self._parse(raw_artist_page)
         albums = [tag for tag in artist_page.find_all("span", {'class': 'mw-headline'}) if
                   tag.attrs['id'] not in ('Additional_information', 'External_links')]
         return albums
@@ -419,31 +1549,19 @@ class LyricWiki(LyricsProvider):
         song_links = [elmt.find('a') for elmt in parent_node.find_all('li')]
         return song_links
 
-    def create_song(self, link, artist, album_title):
+    def _song_title(self, link):
         """
-        Creates a Song object.
+        Extracts the song title from the supplied link.
 
         :param link: BeautifulSoup Link object.
-        :param artist: string.
-        :param album_title: string.
-        :return: models.Song object or None.
+        :return: string or None.
+            None if the song page does not exist on LyricWiki.
         """
-        if not link.attrs['href'].startswith(self.base_url):
-            song_url = self.base_url + link.attrs['href']
-        else:
-            song_url = link.attrs['href']
         song_title = link.attrs['title']
         song_title = song_title[song_title.index(':') + 1:]
         if '(page does not exist' in song_title:
             return None
-        raw_lyrics_page = self.get_lyrics_page(song_url)
-        if not raw_lyrics_page:
-            return None
-        lyrics_page = BeautifulSoup(raw_lyrics_page.decode('utf-8', 'ignore'), 'lxml')
-        lyrics = self.extract_lyrics(lyrics_page)
-        writers = self.extract_writers(lyrics_page)
-        song = Song(song_title, album_title, artist, lyrics, writers)
-        return song
+        return song_title
 
     def extract_lyrics(self, lyrics_page):
         """
@@ -530,7 +1648,8 @@ class AzLyrics(LyricsProvider):  # TODO: Check why Qzlyrics randomly generates '
         :return: bool.
         """
         artist_result = page.find("div", {'class': 'panel-heading'})
-        if artist_result.find('b').text == 'Artist results:':
+        # Pages without any result have no results panel.
+        if artist_result and artist_result.find('b') and artist_result.find('b').text == 'Artist results:':
             return True
         else:
             return False
@@ -551,28 +1670,74 @@ class AzLyrics(LyricsProvider):  # TODO: Check why Qzlyrics randomly generates '
     def _make_artist_url(self, artist):
         """
         Builds an url for the artist page of the lyrics provider.
+        The artist is looked up in the artist index if the provider has one, and searched on the site otherwise.
 
         :param artist: string.
-        :return: string.
+        :return: string, False or None.
+            False if the site search found no artist.
         """
-        return self.search(artist)
+        return self._indexed_artist_url(artist) or self.search(artist)
+
+    def _make_song_url(self, artist, song):
+        """
+        Builds an url for the lyrics page of the supplied song.
+        AzLyrics urls only keep the lowercase alphanumeric characters of the artist name (without a leading 'The '
+        word) and of the song title.
+
+        :param artist: string.
+            Artist name.
+        :param song: string.
+            Song title.
+        :return: string or None.
+        """
+        artist = artist.lower().strip()
+        if artist.startswith('the '):
+            artist = artist[4:]
+        artist = ''.join(c for c in artist if c.isalnum())
+        song = ''.join(c for c in song.lower() if c.isalnum())
+        if not artist or not song:
+            return None
+        return self.base_url + '/lyrics/' + artist + '/' + song + '.html'
+
+    def _artist_listing_urls(self):
+        """
+        Lists the urls of the pages listing the artists, one page per letter and one for the other characters.
+
+        :return: list.
+        """
+        return ['{0}/{1}.html'.format(self.base_url, letter) for letter in list(string.ascii_lowercase) + ['19']]
+
+    def _extract_artists(self, listing_page):
+        """
+        Extracts the artists of an artist listing page.
+
+        :param listing_page: BeautifulSoup object.
+        :return: list.
+            (name, url) of the artists.
+        """
+        return [(link.text.strip(), urljoin(self.base_url + '/', link.attrs['href']))
+                for column in listing_page.find_all("div", {'class': 'artist-col'})
+                for link in column.find_all('a', href=True)]
 
     def search(self, artist):
         """
         Searches for the artist in the supplier's database.
 
         :param artist: Artist's name.
-        :return: url or None.
-            Url to the artist's page if found. None if not Found.
+        :return: url, False or None.
+            Url to the artist's page if found. False if the search found no artist and None if the search failed.
         """
         artist = artist.replace(' ', '+')
         if artist.lower().startswith('the'):
             artist = artist[4:]
         url = self.search_url + artist
-        search_results = self.get_page(url).data
-        results_page = BeautifulSoup(search_results.decode('utf-8', 'ignore'), 'lxml')
-        if not self._has_artist_result(results_page):
+        req = self.get_page(url)
+        if req is None or req.status != 200:
+            # The search failed, e.g. the provider is failing.
             return None
+        results_page = self._parse(req.data)
+        if not self._has_artist_result(results_page):
+            return False
         target_node = results_page.find("div", {'class': 'panel-heading'}).find_next_sibling("table")
         artist_url = target_node.find('a').attrs['href']
         if not artist_url:
@@ -589,7 +1754,7 @@ class AzLyrics(LyricsProvider):  # TODO: Check why Qzlyrics randomly generates '
         :return: list.
             List of BeautifulSoup objects.
         """
-        artist_page = BeautifulSoup(raw_artist_page.decode('utf-8', 'ignore'), 'lxml')
+        artist_page = self._parse(raw_artist_page)
         albums = [tag for tag in artist_page.find_all("div", {'id': 'listAlbum'})]
         return albums
 
@@ -620,24 +1785,14 @@ class AzLyrics(LyricsProvider):  # TODO: Check why Qzlyrics randomly generates '
         song_links = [song for song in song_links if 'href' in song.attrs]
         return song_links
 
-    def create_song(self, link, artist, album_title):
+    def _song_url(self, link):
         """
-        Creates a Song object.
+        Builds the url of the lyrics page from the supplied link.
 
         :param link: BeautifulSoup Link object.
-        :param artist: string.
-        :param album_title: string.
-        :return: models.Song object or None.
+        :return: string.
         """
-        song_title = link.text
-        raw_lyrics_page = self.get_lyrics_page(self.base_url + link.attrs['href'].replace('..', ''))
-        if not raw_lyrics_page:
-            return None
-        lyrics_page = BeautifulSoup(raw_lyrics_page.decode('utf-8', 'ignore'), 'lxml')
-        lyrics = self.extract_lyrics(lyrics_page)
-        writers = self.extract_writers(lyrics_page)
-        song = Song(song_title, album_title, artist, lyrics, writers)
-        return song
+        return self.base_url + link.attrs['href'].replace('..', '')
 
     def extract_lyrics(self, lyrics_page):
         """
@@ -724,6 +1879,18 @@ class Genius(LyricsProvider):
         url = self.base_url + '/artists/' + artist
         return url
 
+    def _make_song_url(self, artist, song):
+        """
+        Builds an url for the lyrics page of the supplied song.
+
+        :param artist: string.
+            Artist name.
+        :param song: string.
+            Song title.
+        :return: string.
+        """
+        return self.base_url + '/' + self._clean_string(artist + ' ' + song) + '-lyrics'
+
     def get_albums(self, raw_artist_page):
         """
         Fetches the albums section in the supplied html page.
@@ -732,13 +1899,46 @@ class Genius(LyricsProvider):
         :return: list.
             List of BeautifulSoup objects.
         """
-        artist_page = BeautifulSoup(raw_artist_page.decode('utf-8', 'ignore'), 'lxml')
+        artist_page = self._parse(raw_artist_page)
         albums_link = artist_page.find("a", {'class': 'full_width_button'})
         albums_link = albums_link.attrs['href'].replace('songs?', 'albums?')
-        albums_page = BeautifulSoup(self.get_page(self.base_url + albums_link).data.decode('utf-8', 'ignore'), 'lxml')
-        albums = [tag for tag in albums_page.find_all("a", {'class': 'album_link'})]
+        albums = self._get_listing(self.base_url + albums_link,
+                                   lambda albums_page: albums_page.find_all("a", {'class': 'album_link'}))
         return albums
 
+    def _listing_page_urls(self, listing_page, url):
+        """
+        Finds the urls of the other pages of a paginated listing.
+        Genius listings link to their pages from a 'pagination' div, the pages being selected by the 'page' query
+        parameter.
+
+        :param listing_page: BeautifulSoup object.
+            First page of the listing.
+        :param url: string.
+            Url of the first page of the listing.
+        :return: list.
+            Urls of the other pages of the listing.
+        """
+        pagination = listing_page.find("div", {'class': 'pagination'})
+        if not pagination:
+            return []
+        page_numbers = [int(link.text) for link in pagination.find_all('a') if link.text.strip().isdigit()]
+        if not page_numbers:
+            return []
+        split_url = urlsplit(url)
+        query = [(key, value) for key, value in parse_qsl(split_url.query) if key != 'page']
+        return [urlunsplit(split_url._replace(query=urlencode(query + [('page', page)])))
+                for page in range(2, max(page_numbers) + 1)]
+
+    def _album_url(self, album):
+        """
+        Builds the url of the album page of the supplied album.
+
+        :param album: BeautifulSoup object.
+        :return: string.
+        """
+        return self.base_url + album.attrs['href']
+
     def get_album_infos(self, tag):
         """
         Extracts the Album informations from the tag
@@ -748,7 +1948,7 @@ class Genius(LyricsProvider):
             Album title and release date.
         """
         album_title = tag.text
-        album_page = BeautifulSoup(self.get_page(self.base_url + tag.attrs['href']).data.decode('utf-8', 'ignore'), 'lxml')
+        album_page = self._get_album_page(tag)
         info_box = album_page.find("div", {'class': 'header_with_cover_art-primary_info'})
         metadata = [elmt for elmt in info_box.find_all("div", {'class': 'metadata_unit'}) if elmt.text.startswith('Released')]
         try:
@@ -766,33 +1966,19 @@ class Genius(LyricsProvider):
         :param album: BeautifulSoup object.
         :return: List of BeautifulSoup Link objects.
         """
-        album_page = BeautifulSoup(self.get_page(self.base_url + album.attrs['href']).data.decode('utf-8', 'ignore'), 'lxml')
+        album_page = self._get_album_page(album, release=True)
         song_links = album_page.find_all("div", {'class': 'chart_row chart_row--light_border chart_row--full_bleed_left chart_row--align_baseline chart_row--no_hover'})
         song_links = [song.find('a') for song in song_links]
         return song_links
 
-    def create_song(self, link, artist, album_title):
+    def _song_title(self, link):
         """
-        Creates a Song object.
+        Extracts the song title from the supplied link.
 
         :param link: BeautifulSoup Link object.
-        :param artist: string.
-        :param album_title: string.
-        :return: models.Song object or None.
+        :return: string.
         """
-        if not link.attrs['href'].startswith(self.base_url):
-            song_url = self.base_url + link.attrs['href']
-        else:
-            song_url = link.attrs['href']
-        song_title = link.text.strip('\n').split('\n')[0].lstrip()
-        raw_lyrics_page = self.get_lyrics_page(song_url)
-        if not raw_lyrics_page:
-            return None
-        lyrics_page = BeautifulSoup(raw_lyrics_page.decode('utf-8', 'ignore'), 'lxml')
-        lyrics = self.extract_lyrics(lyrics_page)
-        writers = self.extract_writers(lyrics_page)
-        song = Song(song_title, album_title, artist, lyrics, writers)
-        return song
+        return link.text.strip('\n').split('\n')[0].lstrip()
 
     def extract_lyrics(self, lyrics_page):
         """
@@ -878,8 +2064,8 @@ class Lyrics007(LyricsProvider):
         :param page: BeautifulSoup object.
         :return: bool.
         """
-        artist_link = page.find("div", {'id': 'search_result'}).find('a')
-        if artist_link:
+        search_result = page.find("div", {'id': 'search_result'})
+        if search_result and search_result.find('a'):
             return True
         else:
             return False
@@ -887,11 +2073,35 @@ class Lyrics007(LyricsProvider):
     def _make_artist_url(self, artist):
         """
         Builds an url for the artist page of the lyrics provider.
+        The artist is looked up in the artist index if the provider has one, and searched on the site otherwise.
 
         :param artist: string.
-        :return: string.
+        :return: string, False or None.
+            False if the site search found no artist.
+        """
+        return self._indexed_artist_url(artist) or self.search(artist)
+
+    def _artist_listing_urls(self):
         """
-        return self.search(artist)
+        Lists the urls of the pages listing the artists, one page per letter.
+
+        :return: list.
+        """
+        return ['{0}/artists/{1}.html'.format(self.base_url, letter) for letter in string.ascii_lowercase + '0']
+
+    def _extract_artists(self, listing_page):
+        """
+        Extracts the artists of an artist listing page.
+
+        :param listing_page: BeautifulSoup object.
+        :return: list.
+            (name, url) of the artists.
+        """
+        artist_list = listing_page.find("ul", {'class': 'artist_list'})
+        if not artist_list:
+            return []
+        return [(link.text.strip(), urljoin(self.base_url, link.attrs['href']))
+                for link in artist_list.find_all('a', href=True)]
 
     def search(self, artist):
         """
@@ -899,15 +2109,18 @@ class Lyrics007(LyricsProvider):
 
         :param artist: string.
             Artist's name.
-        :return: string or None.
-            Artist's url page.
+        :return: string, False or None.
+            Artist's url page. False if the search found no artist and None if the search failed.
         """
         artist = "".join([c if (c.isalnum() or c == '.') else "+" for c in artist])
         url = self.search_url + artist
-        search_results = self.get_page(url).data
-        results_page = BeautifulSoup(search_results.decode('utf-8', 'ignore'), 'lxml')
-        if not self._has_artist_result(results_page):
+        req = self.get_page(url)
+        if req is None or req.status != 200:
+            # The search failed, e.g. the provider is failing.
             return None
+        results_page = self._parse(req.data)
+        if not self._has_artist_result(results_page):
+            return False
         artist_url = results_page.find("div", {'id': 'search_result'}).find('a').attrs['href']
         if not artist_url:
             return None
@@ -923,7 +2136,7 @@ class Lyrics007(LyricsProvider):
         :return: list.
             List of BeautifulSoup objects.
         """
-        artist_page = BeautifulSoup(raw_artist_page.decode('utf-8', 'ignore'), 'lxml')
+        artist_page = self._parse(raw_artist_page)
         content = artist_page.find("div", {'class': 'content'})
         albums = [tag for tag in content.find_all('li', recursive=False)]
         return albums
@@ -955,29 +2168,6 @@ class Lyrics007(LyricsProvider):
         song_links = [elmt.find('a') for elmt in target_node.find_all('li') if elmt.find('a')]
         return song_links
 
-    def create_song(self, link, artist, album_title):
-        """
-        Creates a Song object.
-
-        :param link: BeautifulSoup Link object.
-        :param artist: string.
-        :param album_title: string.
-        :return: models.Song object or None.
-        """
-        if not link.attrs['href'].startswith(self.base_url):
-            song_url = self.base_url + link.attrs['href']
-        else:
-            song_url = link.attrs['href']
-        song_title = link.text
-        raw_lyrics_page = self.get_lyrics_page(song_url)
-        if not raw_lyrics_page:
-            return None
-        lyrics_page = BeautifulSoup(raw_lyrics_page.decode('utf-8', 'ignore'), 'lxml')
-        lyrics = self.extract_lyrics(lyrics_page)
-        writers = self.extract_writers(lyrics_page)
-        song = Song(song_title, album_title, artist, lyrics, writers)
-        return song
-
     def extract_lyrics(self, lyrics_page):
         """
         Extracts the lyrics from the lyrics page of the supplied song.
@@ -1029,6 +2219,8 @@ class MusixMatch(LyricsProvider):
     base_url = 'https://www.musixmatch.com'
     search_url = base_url + '/search/{0}/artists'
     name = 'MusixMatch'
+    stream_markers = (('div', 'mxm-lyrics'), ('p', 'mxm-lyrics__copyright'))
+    sitemap_urls = ('https://www.musixmatch.com/sitemap.xml',)
 
     def _has_lyrics(self, page):
         """
@@ -1063,6 +2255,31 @@ class MusixMatch(LyricsProvider):
         """
         return self.base_url + '/artist/' + artist
 
+    def _make_song_url(self, artist, song):
+        """
+        Builds an url for the lyrics page of the supplied song.
+
+        :param artist: string.
+            Artist name.
+        :param song: string.
+            Song title.
+        :return: string.
+        """
+        return self.base_url + '/lyrics/' + self._clean_string(artist) + '/' + self._clean_string(song)
+
+    def _parse_song_url(self, url):
+        """
+        Finds the song of a lyrics page from its url, https://www.musixmatch.com/lyrics/Artist/Song-Title .
+        The album of a song can't be told from its url.
+
+        :param url: string.
+        :return: tuple(string, string, string) or None.
+        """
+        parts = unquote(urlsplit(url).path).strip('/').split('/')
+        if len(parts) != 3 or parts[0] != 'lyrics':
+            return None
+        return parts[1].replace('-', ' '), 'Unknown', parts[2].replace('-', ' ')
+
     def get_albums(self, raw_artist_page):
         """
         Fetches the albums section in the supplied html page.
@@ -1071,13 +2288,43 @@ class MusixMatch(LyricsProvider):
         :return: list.
             List of BeautifulSoup objects.
         """
-        artist_page = BeautifulSoup(raw_artist_page.decode('utf-8', 'ignore'), 'lxml')
+        artist_page = self._parse(raw_artist_page)
         albums_link = artist_page.find("li", {'id': 'albums'})
         albums_link = albums_link.find('a').attrs['href']
-        albums_page = BeautifulSoup(self.get_page(self.base_url + albums_link).data.decode('utf-8', 'ignore'), 'lxml')
-        albums = [tag for tag in albums_page.find_all("div", {'class': 'media-card-text'})]
+        albums = self._get_listing(self.base_url + albums_link,
+                                   lambda albums_page: albums_page.find_all("div", {'class': 'media-card-text'}))
         return albums
 
+    def _listing_page_urls(self, listing_page, url):
+        """
+        Finds the urls of the other pages of a paginated listing.
+        MusixMatch loads the next pages of a listing while scrolling, from the urls '{listing url}/{page number}'
+        linked in the listing.
+
+        :param listing_page: BeautifulSoup object.
+            First page of the listing.
+        :param url: string.
+            Url of the first page of the listing.
+        :return: list.
+            Urls of the other pages of the listing.
+        """
+        path = urlsplit(url).path.rstrip('/')
+        page_link = re.compile('^(?:' + re.escape(self.base_url) + ')?' + re.escape(path) + r'/(\d+)/?$')
+        page_numbers = [int(page_link.match(link.attrs['href']).group(1))
+                        for link in listing_page.find_all('a', href=page_link)]
+        if not page_numbers:
+            return []
+        return [self.base_url + path + '/' + str(page) for page in range(2, max(page_numbers) + 1)]
+
+    def _album_url(self, album):
+        """
+        Builds the url of the album page of the supplied album.
+
+        :param album: BeautifulSoup object.
+        :return: string.
+        """
+        return self.base_url + album.find('a').attrs['href']
+
     def get_album_infos(self, tag):
         """
         Extracts the Album informations from the tag
@@ -1100,37 +2347,12 @@ class MusixMatch(LyricsProvider):
         :param album: BeautifulSoup object.
         :return: List of BeautifulSoup Link objects.
         """
-        album_page = BeautifulSoup(self.get_page(self.base_url + album.find('a').attrs['href']).data.decode('utf-8', 'ignore'), 'lxml')
+        album_page = self._get_album_page(album, release=True)
         album_div = album_page.find("div", {'class': 'mxm-album__tracks mxm-collection-container'})
         song_links = album_div.find_all("li", {'class': re.compile("^mui-collection__item")})
         song_links = [song.find('a') for song in song_links]
         return song_links
 
-    def create_song(self, link, artist, album_title):
-        """
-        Creates a Song object.
-
-        :param link: BeautifulSoup Link object.
-        :param artist: string.
-        :param album_title: string.
-        :return: models.Song object or None.
-        """
-        if not link.attrs['href'].startswith(self.base_url):
-            song_url = self.base_url + link.attrs['href']
-        else:
-            song_url = link.attrs['href']
-        song_title = link.text
-        raw_lyrics_page = self.get_lyrics_page(song_url)
-        if not raw_lyrics_page:
-            return None
-        lyrics_page = BeautifulSoup(raw_lyrics_page.decode('utf-8', 'ignore'), 'lxml')
-        lyrics = self.extract_lyrics(lyrics_page)
-        if not lyrics:
-            return None
-        writers = self.extract_writers(lyrics_page)
-        song = Song(song_title, album_title, artist, lyrics, writers)
-        return song
-
     def extract_lyrics(self, lyrics_page):
         """
         Extracts the lyrics from the lyrics page of the supplied song.
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""Registry of the lyrics providers.
+
+Providers are imported on first use, so that importing lyricsmaster or running 'lyricsmaster --help' does not load
+the html parsing and networking libraries.
+Third party packages can add providers by declaring them in the 'lyricsmaster.providers' entry point group::
+
+    entry_points={
+        'lyricsmaster.providers': ['mysite = mypackage.providers:MySite'],
+    }
+
+"""
+
+from importlib import import_module
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2.7 compatibility
+    from collections import Mapping
+
+ENTRY_POINT_GROUP = 'lyricsmaster.providers'
+
+BUILTIN_PROVIDERS = {'lyricwiki': 'lyricsmaster.providers:LyricWiki',
+                     'azlyrics': 'lyricsmaster.providers:AzLyrics',
+                     'genius': 'lyricsmaster.providers:Genius',
+                     'musixmatch': 'lyricsmaster.providers:MusixMatch',
+                     'lyrics007': 'lyricsmaster.providers:Lyrics007',
+                     }
+
+
+def load_object(path):
+    """
+    Imports the object at the supplied path.
+
+    :param path: string.
+        'module:attribute' path of the object.
+    :return: object.
+    """
+    module, attribute = path.split(':')
+    return getattr(import_module(module), attribute)
+
+
+def iter_entry_points(group):
+    """
+    Lists the entry points of the installed packages in the supplied group.
+
+    :param group: string.
+        Entry point group.
+    :return: list.
+        Entry point objects, with a 'name' attribute and a 'load' method.
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        import pkg_resources
+        return list(pkg_resources.iter_entry_points(group))
+    entry_points = entry_points()
+    if hasattr(entry_points, 'select'):
+        return list(entry_points.select(group=group))
+    return list(entry_points.get(group, []))
+
+
+class ProviderRegistry(Mapping):
+    """
+    Maps lowercase provider names to provider classes.
+    The classes are only imported when they are looked up and the installed entry points are only scanned when a
+    name is not one of the builtin or registered providers.
+
+    :param providers: dict.
+        Maps provider names to provider classes or to 'module:Class' paths.
+    """
+
+    def __init__(self, providers=None):
+        self._providers = dict(BUILTIN_PROVIDERS if providers is None else providers)
+        self._entry_points_loaded = False
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, sorted(self._providers))
+
+    def __getitem__(self, name):
+        name = name.lower()
+        if name not in self._providers:
+            self._load_entry_points()
+        provider = self._providers[name]
+        if not isinstance(provider, type):
+            provider = provider.load() if hasattr(provider, 'load') else load_object(provider)
+            self._providers[name] = provider
+        return provider
+
+    def __iter__(self):
+        self._load_entry_points()
+        return iter(self._providers)
+
+    def __len__(self):
+        self._load_entry_points()
+        return len(self._providers)
+
+    def register(self, name, provider):
+        """
+        Registers a provider.
+
+        :param name: string.
+            Provider name.
+        :param provider: LyricsProvider subclass or string.
+            Provider class or its 'module:Class' path.
+        """
+        self._providers[name.lower()] = provider
+
+    def _load_entry_points(self):
+        """
+        Adds the providers declared by the installed packages. Providers already registered are kept.
+
+        """
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+        for entry_point in iter_entry_points(ENTRY_POINT_GROUP):
+            self._providers.setdefault(entry_point.name.lower(), entry_point)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+"""Lookup server.
+
+Serves lyrics lookups over HTTP/JSON from a long-running process, so that clients share the provider instances,
+their connection pools and a cache of the lookup results instead of paying for them on each run::
+
+    $ lyricsmaster serve --port 8080
+    $ curl 'http://127.0.0.1:8080/lyrics?artist=2Pac&album=Me+Against+the+World&song=So+Many+Tears'
+    $ curl 'http://127.0.0.1:8080/stats'
+
+Identical lookups received while one is in flight wait for its result instead of downloading the lyrics again.
+Only complete results are cached: lookups cut short by the deadline or by failed requests are looked up again.
+
+"""
+
+import json
+import time
+from collections import Counter, OrderedDict
+from urllib.parse import parse_qs
+
+import lyricsmaster
+from .cache import NegativeCache
+from .matching import normalize_title
+from .network import LatencyTracker, SingleFlight
+from .utils import logger
+
+_statuses = {200: '200 OK', 400: '400 Bad Request', 404: '404 Not Found', 500: '500 Internal Server Error',
+             503: '503 Service Unavailable'}
+
+
+class ResultCache(object):
+    """
+    Least recently used cache of lookup results, which expire after a time to live.
+
+    :param size: integer.
+        Maximum number of results.
+    :param ttl: float.
+        Seconds after which a result is looked up again.
+    """
+    __slots__ = ('size', 'ttl', 'entries')
+
+    def __init__(self, size=1024, ttl=3600):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def __repr__(self):
+        return '{0}.{1}({2}, {3})'.format(__name__, self.__class__.__name__, len(self), self.size)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Gets a cached result.
+
+        :param key: hashable.
+        :return: cached value or None.
+            None if the result is not cached or has expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        """
+        Caches a result, evicting the least recently used one if the cache is full.
+
+        :param key: hashable.
+        :param value: value to cache.
+        """
+        self.entries[key] = (time.time() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+def discography_to_dict(discography):
+    """
+    Converts a discography to a dict which can be serialized to json.
+
+    :param discography: models.Discography object.
+    :return: dict.
+    """
+    return {'artist': discography.artist,
+            'albums': [{'title': album.title,
+                        'release_date': album.release_date,
+                        'songs': [{'title': song.title, 'lyrics': song.lyrics, 'writers': song.writers}
+                                  for song in album]}
+                       for album in discography]}
+
+
+class LyricsServer(object):
+    """
+    WSGI application serving lyrics lookups.
+
+    GET /lyrics?artist=...&album=...&song=...&provider=... answers with the json of the discography found by the
+    provider's get_lyrics(), LyricWiki by default. GET /stats answers with the latency percentiles of the lookups,
+    the cache statistics and the metrics of the providers.
+
+    :param providers: dict.
+        Maps lowercase provider names to provider instances. Other providers are instantiated on first use.
+    :param cache: ResultCache object.
+        Cache of the lookup results.
+    :param deadline: float.
+        Maximum duration of a lookup in seconds. The lyrics downloaded so far are returned.
+    :param provider_options: dict.
+        Keyword arguments of the providers instantiated by the server, e.g. 'tor_controller'. The providers share a
+        NegativeCache of the missing artists and songs unless a 'negative_cache' is supplied.
+    """
+
+    def __init__(self, providers=None, cache=None, deadline=None, provider_options=None):
+        self.providers = providers or {}
+        self.cache = cache if cache is not None else ResultCache()
+        self.deadline = deadline
+        self.provider_options = dict(provider_options or {})
+        self.provider_options.setdefault('negative_cache', NegativeCache())
+        self.metrics = Counter()
+        self.latencies = LatencyTracker(1000)
+        self._in_flight = SingleFlight(self.metrics)
+
+    def __repr__(self):
+        return '{0}.{1}({2})'.format(__name__, self.__class__.__name__, sorted(self.providers))
+
+    def __call__(self, environ, start_response):
+        start = time.time()
+        path = environ.get('PATH_INFO', '/')
+        query = dict((name, values[0]) for name, values in parse_qs(environ.get('QUERY_STRING', '')).items())
+        if environ.get('REQUEST_METHOD', 'GET') != 'GET':
+            status, payload = 400, {'error': 'Only GET requests are supported'}
+        elif path == '/lyrics':
+            status, payload = self.lookup(query.get('provider', 'LyricWiki'), query.get('artist'),
+                                          query.get('album'), query.get('song'))
+            self.metrics['lookups'] += 1
+            self.latencies.record(time.time() - start)
+        elif path == '/stats':
+            status, payload = 200, self.stats()
+        else:
+            status, payload = 404, {'error': 'Unknown path {0}'.format(path)}
+        body = json.dumps(payload).encode('utf-8')
+        start_response(_statuses[status], [('Content-Type', 'application/json; charset=utf-8'),
+                                           ('Content-Length', str(len(body)))])
+        return [body]
+
+    def provider(self, name):
+        """
+        Gets the shared instance of a provider.
+
+        :param name: string.
+            Provider name.
+        :return: LyricsProvider object or None.
+            None if the provider is not supported.
+        """
+        name = name.lower()
+        if name not in self.providers:
+            if name not in lyricsmaster.CURRENT_PROVIDERS:
+                return None
+            self.providers[name] = lyricsmaster.CURRENT_PROVIDERS[name](**self.provider_options)
+        return self.providers[name]
+
+    def lookup(self, provider_name, artist, album=None, song=None):
+        """
+        Looks up lyrics, from the cache or from the provider.
+
+        :param provider_name: string.
+        :param artist: string.
+        :param album: string.
+        :param song: string.
+        :return: tuple(integer, dict).
+            Http status and json payload of the response.
+        """
+        if not artist:
+            return 400, {'error': 'The artist parameter is required'}
+        provider = self.provider(provider_name)
+        if provider is None:
+            return 400, {'error': 'The provider {0} is not supported'.format(provider_name)}
+        key = (provider.name, normalize_title(artist), normalize_title(album or ''), normalize_title(song or ''))
+        result = self.cache.get(key)
+        if result is not None:
+            self.metrics['cache_hits'] += 1
+            return result
+        self.metrics['cache_misses'] += 1
+        result = self._in_flight.do(key, self._lookup, key, provider, artist, album, song)
+        if result is None:
+            # The lookup this one waited for was interrupted.
+            return 503, {'error': 'The lookup of {0} was interrupted'.format(artist)}
+        return result
+
+    def _lookup(self, key, provider, artist, album, song):
+        """
+        Looks up lyrics from the provider and caches the result if it is complete.
+        Artists which are not found are not cached either, as the provider can't tell them from failed lookups. Its
+        negative cache remembers the missing artists instead.
+
+        :param key: tuple.
+            Cache key of the lookup.
+        :param provider: LyricsProvider object.
+        :param artist: string.
+        :param album: string.
+        :param song: string.
+        :return: tuple(integer, dict).
+        """
+        try:
+            discography = provider.get_lyrics(artist, album, song, deadline=self.deadline)
+        except Exception as e:
+            logger.exception('The lookup of {0} on {1} failed'.format(artist, provider.name))
+            self.metrics['failed_lookups'] += 1
+            return 500, {'error': 'The lookup of {0} failed: {1}'.format(artist, e)}
+        if discography is None and not provider.is_available():
+            logger.warning('{0} is unavailable, {1} was not looked up'.format(provider.name, artist))
+            return 503, {'error': 'The provider {0} is unavailable'.format(provider.name)}
+        if discography:
+            result = 200, discography_to_dict(discography)
+        else:
+            result = 404, {'error': 'No lyrics found for {0}'.format(artist)}
+        if discography is None or not discography.complete:
+            self.metrics['uncached_lookups'] += 1
+        else:
+            self.cache.set(key, result)
+        return result
+
+    def stats(self):
+        """
+        Reports the latency percentiles of the lookups, the cache statistics and the metrics of the providers.
+
+        :return: dict.
+        """
+        return {'lookups': self.metrics['lookups'],
+                'latency': dict(('p{0}'.format(percent), self.latencies.percentile(percent))
+                                for percent in (50, 90, 95, 99)),
+                'cache': {'size': len(self.cache),
+                          'hits': self.metrics['cache_hits'],
+                          'misses': self.metrics['cache_misses'],
+                          'coalesced': self.metrics['requests_coalesced'],
+                          'uncached': self.metrics['uncached_lookups']},
+                'providers': dict((provider.name, dict(provider.metrics)) for provider in self.providers.values())}
+
+
+def serve(host='127.0.0.1', port=8080, **kwargs):
+    """
+    Runs a LyricsServer on a gevent WSGI server until it is interrupted.
+
+    :param host: string.
+    :param port: integer.
+    :param kwargs: keyword arguments of the LyricsServer.
+    """
+    from gevent.pywsgi import WSGIServer
+
+    server = WSGIServer((host, port), LyricsServer(**kwargs), log=None)
+    logger.info('Serving lyrics on http://{0}:{1}'.format(host, port))
+    server.serve_forever()
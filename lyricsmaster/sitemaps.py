@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""Sitemap parsing.
+
+Reads XML sitemaps and sitemap indexes incrementally, so sitemaps listing tens of thousands of urls are parsed while
+they are downloaded, in constant memory. Gzipped sitemaps are decompressed on the fly.
+
+"""
+
+import zlib
+
+from lxml import etree
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def _decompress(chunks):
+    """
+    Decompresses the chunks of a gzipped file, or passes them through if the file is not gzipped.
+
+    :param chunks: iterable.
+        Chunks of bytes.
+    :return: iterator.
+        Chunks of decompressed bytes.
+    """
+    decompressor = None
+    for chunk in chunks:
+        if decompressor is None:
+            if not chunk.startswith(GZIP_MAGIC):
+                yield chunk
+                for chunk in chunks:
+                    yield chunk
+                return
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        yield decompressor.decompress(chunk)
+    if decompressor is not None:
+        yield decompressor.flush()
+
+
+def iter_sitemap_entries(chunks):
+    """
+    Parses a sitemap or a sitemap index from the chunks of its file.
+
+    :param chunks: iterable.
+        Chunks of bytes of the sitemap file, gzipped or not.
+    :return: iterator.
+        ('url', location) for the pages of a sitemap and ('sitemap', location) for the sitemaps of an index.
+    """
+    parser = etree.XMLPullParser(events=('end',))
+    for chunk in _decompress(iter(chunks)):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            tag = etree.QName(element).localname
+            if tag in ('url', 'sitemap'):
+                location = element.findtext('{*}loc')
+                if location:
+                    yield tag, location.strip()
+                # The entries are dropped once read, so the tree does not grow with the sitemap.
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+    parser.close()
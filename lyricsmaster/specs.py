@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+"""Declarative lyrics providers.
+
+A ProviderSpec describes a lyrics site with url templates and CSS selectors. It is compiled once into a
+LyricsProvider subclass, so new sites can be supported without writing a provider class::
+
+    from lyricsmaster.specs import ProviderSpec, compile_provider
+
+    spec = ProviderSpec(name='ExampleLyrics', base_url='https://www.example.com',
+                        artist_url='{base_url}/artist/{artist}', song_url='{base_url}/lyrics/{artist}/{song}',
+                        has_artist='div.discography', has_lyrics='div.lyrics',
+                        albums='div.discography div.album', album_title='h2', release_date='span.year',
+                        songs='ol li a', lyrics='div.lyrics', writers='p.credits')
+    ExampleLyrics = compile_provider(spec)
+    discography = ExampleLyrics().get_lyrics('2Pac')
+
+Specs can also be written in a json file, a list of objects with the same keys, and loaded with 'load_specs'.
+
+"""
+
+import json
+from codecs import open
+from urllib.parse import urljoin
+
+import soupsieve
+
+from .providers import LyricsProvider
+from .utils import normalize
+
+# Selectors which must be supplied by every spec.
+REQUIRED_SELECTORS = ('has_artist', 'has_lyrics', 'albums', 'songs', 'lyrics')
+OPTIONAL_SELECTORS = ('album_title', 'release_date', 'album_url', 'writers')
+
+
+class ProviderSpec(object):
+    """
+    Declarative definition of a lyrics provider.
+
+    :param name: string.
+        Provider name.
+    :param base_url: string.
+        Url of the lyrics site.
+    :param artist_url: string.
+        Template of the artist page url, with the '{base_url}' and '{artist}' fields.
+    :param song_url: string.
+        Template of the lyrics page url, with the '{base_url}', '{artist}' and '{song}' fields.
+        None if the lyrics urls can't be built from the artist name and song title.
+    :param has_artist: string.
+        CSS selector matching an artist page.
+    :param has_lyrics: string.
+        CSS selector matching a lyrics page.
+    :param albums: string.
+        CSS selector of the albums on the artist page.
+    :param songs: string.
+        CSS selector of the song links, relative to an album or to the album page when 'album_url' is supplied.
+    :param lyrics: string.
+        CSS selector of the lyrics on the lyrics page.
+    :param album_title: string.
+        CSS selector of the album title, relative to an album. Defaults to the text of the album.
+    :param release_date: string.
+        CSS selector of the release date, relative to an album.
+    :param album_url: string.
+        CSS selector of the link to the album page, relative to an album, for sites listing the songs on album pages.
+    :param writers: string.
+        CSS selector of the song writers on the lyrics page.
+    :param word_separator: string.
+        Separator of the words of the artist name and song title in urls.
+    :param lowercase: bool.
+        Whether the artist name and song title are lowercased in urls.
+    :param lyrics_separator: string.
+        Separator of the text pieces of the lyrics, e.g. the lines separated by <br> tags.
+    """
+
+    def __init__(self, name, base_url, artist_url, has_artist, has_lyrics, albums, songs, lyrics, song_url=None,
+                 album_title=None, release_date=None, album_url=None, writers=None, word_separator='-',
+                 lowercase=False, lyrics_separator='\n'):
+        self.name = name
+        self.base_url = base_url
+        self.artist_url = artist_url
+        self.song_url = song_url
+        self.has_artist = has_artist
+        self.has_lyrics = has_lyrics
+        self.albums = albums
+        self.songs = songs
+        self.lyrics = lyrics
+        self.album_title = album_title
+        self.release_date = release_date
+        self.album_url = album_url
+        self.writers = writers
+        self.word_separator = word_separator
+        self.lowercase = lowercase
+        self.lyrics_separator = lyrics_separator
+
+    def __repr__(self):
+        return '{0}.{1}({2}, {3})'.format(__name__, self.__class__.__name__, self.name, self.base_url)
+
+    @classmethod
+    def from_dict(cls, definition):
+        """
+        Creates a spec from its dictionary definition.
+
+        :param definition: dict.
+            Keyword arguments of ProviderSpec.
+        :return: ProviderSpec object.
+        """
+        return cls(**definition)
+
+    def compile_selectors(self):
+        """
+        Compiles the CSS selectors of the spec.
+
+        :return: dict.
+            Compiled soupsieve selectors by name. Selectors which were not supplied are None.
+        """
+        selectors = {}
+        for name in REQUIRED_SELECTORS + OPTIONAL_SELECTORS:
+            selector = getattr(self, name)
+            if not selector and name in REQUIRED_SELECTORS:
+                raise ValueError('The {0} selector of the {1} provider spec is missing'.format(name, self.name))
+            selectors[name] = soupsieve.compile(selector) if selector else None
+        return selectors
+
+
+class SpecProvider(LyricsProvider):
+    """
+    Base class of the providers compiled from a ProviderSpec.
+    The compiled selectors of the spec are class attributes, so they are compiled once per provider.
+
+    """
+    spec = None
+    selectors = {}
+
+    def _select_text(self, name, node, default=None):
+        """
+        Returns the stripped text of the first node matching the named selector.
+
+        :param name: string.
+            Selector name.
+        :param node: BeautifulSoup object.
+        :param default: string.
+            Returned when the selector was not supplied or does not match.
+        :return: string.
+        """
+        selector = self.selectors[name]
+        match = selector.select_one(node) if selector else None
+        return match.get_text().strip() if match is not None else default
+
+    def _has_lyrics(self, page):
+        """
+        Checks if the page matches the 'has_lyrics' selector.
+
+        :param page: BeautifulSoup object.
+        :return: bool.
+        """
+        return self.selectors['has_lyrics'].select_one(page) is not None
+
+    def _has_artist(self, page):
+        """
+        Checks if the page matches the 'has_artist' selector.
+
+        :param page: BeautifulSoup object.
+        :return: bool.
+        """
+        return self.selectors['has_artist'].select_one(page) is not None
+
+    def _clean_string(self, text):
+        """
+        Formats the text to use in a url, with the word separator and case of the spec.
+
+        :param text: string.
+        :return: string.
+        """
+        text = normalize(text).replace('-', self.spec.word_separator)
+        return text.lower() if self.spec.lowercase else text
+
+    def _make_artist_url(self, artist):
+        """
+        Builds the artist page url from the 'artist_url' template.
+
+        :param artist: string.
+        :return: string.
+        """
+        return self.spec.artist_url.format(base_url=self.base_url, artist=artist)
+
+    def _make_song_url(self, artist, song):
+        """
+        Builds the lyrics page url from the 'song_url' template.
+
+        :param artist: string.
+        :param song: string.
+        :return: string or None.
+        """
+        if not self.spec.song_url:
+            return None
+        return self.spec.song_url.format(base_url=self.base_url, artist=self._clean_string(artist),
+                                         song=self._clean_string(song))
+
+    def _album_url(self, album):
+        """
+        Finds the album page url with the 'album_url' selector. The album itself can be the link.
+
+        :param album: BeautifulSoup object.
+        :return: string or None.
+        """
+        if not self.selectors['album_url']:
+            return None
+        link = self.selectors['album_url'].select_one(album)
+        if link is None and album.name == 'a':
+            link = album
+        return urljoin(self.base_url, link.attrs['href']) if link is not None else None
+
+    def _song_url(self, link):
+        """
+        Resolves the url of the supplied song link.
+
+        :param link: BeautifulSoup Link object.
+        :return: string.
+        """
+        return urljoin(self.base_url, link.attrs['href'])
+
+    def _song_title(self, link):
+        """
+        Extracts the song title from the text of the supplied link.
+
+        :param link: BeautifulSoup Link object.
+        :return: string.
+        """
+        return link.get_text().strip()
+
+    def get_albums(self, raw_artist_page):
+        """
+        Finds the albums matching the 'albums' selector.
+
+        :param raw_artist_page: Artist's raw html page.
+        :return: list.
+            List of BeautifulSoup objects.
+        """
+        return self.selectors['albums'].select(self._parse(raw_artist_page))
+
+    def get_album_infos(self, tag):
+        """
+        Extracts the album title and release date with the 'album_title' and 'release_date' selectors.
+
+        :param tag: BeautifulSoup object.
+        :return: tuple(string, string).
+            Album title and release date.
+        """
+        album_title = self._select_text('album_title', tag, tag.get_text().strip())
+        release_date = self._select_text('release_date', tag, 'Unknown')
+        return album_title, release_date
+
+    def get_songs(self, album):
+        """
+        Finds the song links matching the 'songs' selector, in the album or in its album page.
+
+        :param album: BeautifulSoup object.
+        :return: List of BeautifulSoup Link objects.
+        """
+        if self.selectors['album_url']:
+            album = self._get_album_page(album, release=True)
+        return [link for link in self.selectors['songs'].select(album) if 'href' in link.attrs]
+
+    def extract_lyrics(self, lyrics_page):
+        """
+        Extracts the lyrics matching the 'lyrics' selector.
+
+        :param lyrics_page: BeautifulSoup Object.
+        :return: string or None.
+        """
+        lyric_box = self.selectors['lyrics'].select_one(lyrics_page)
+        if lyric_box is None:
+            return None
+        return self.spec.lyrics_separator.join(lyric_box.strings).strip()
+
+    def extract_writers(self, lyrics_page):
+        """
+        Extracts the song writers matching the 'writers' selector.
+
+        :param lyrics_page: BeautifulSoup Object.
+        :return: string or None.
+        """
+        return self._select_text('writers', lyrics_page)
+
+
+def compile_provider(spec):
+    """
+    Compiles a provider spec into a LyricsProvider subclass.
+
+    :param spec: ProviderSpec object or dict.
+    :return: SpecProvider subclass.
+    """
+    if isinstance(spec, dict):
+        spec = ProviderSpec.from_dict(spec)
+    attributes = {'__doc__': 'Class interfacing with {0} .'.format(spec.base_url),
+                  '__module__': __name__,
+                  'name': spec.name,
+                  'base_url': spec.base_url,
+                  'spec': spec,
+                  'selectors': spec.compile_selectors()}
+    return type(str(spec.name), (SpecProvider,), attributes)
+
+
+def load_specs(path, registry=None):
+    """
+    Loads the provider specs of a json file, compiles them and registers the providers.
+
+    :param path: string.
+        Path to a json file holding a list of provider specs.
+    :param registry: registry.ProviderRegistry object.
+        Registry in which the providers are registered. Defaults to lyricsmaster.CURRENT_PROVIDERS.
+    :return: list.
+        Compiled provider classes.
+    """
+    if registry is None:
+        from . import CURRENT_PROVIDERS as registry
+    with open(path, 'r', encoding='utf-8') as file:
+        definitions = json.load(file)
+    providers = [compile_provider(definition) for definition in definitions]
+    for provider in providers:
+        registry.register(provider.name, provider)
+    return providers
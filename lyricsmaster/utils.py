@@ -4,12 +4,6 @@
 
 import os
 import re
-from stem import Signal
-from stem.control import Controller
-from urllib3.contrib.socks import SOCKSProxyManager
-import certifi
-
-import gevent.monkey
 import socket
 
 import logging
@@ -107,10 +101,14 @@ class TorController:
 
         :return: urllib3.SOCKSProxyManager object.
         """
+        from urllib3.contrib.socks import SOCKSProxyManager
+        from .network import ssl_context
+
         user_agent = {'user-agent':
                 'Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36'}
+        # The TLS context is shared with the sessions created after each circuit renewal.
         session = SOCKSProxyManager('socks5://{0}:{1}'.format(self.ip, self.socksport), cert_reqs='CERT_REQUIRED',
-                                    ca_certs=certifi.where(), headers=user_agent)
+                                    ssl_context=ssl_context(), headers=user_agent)
         return session
 
     def renew_tor_circuit(self):
@@ -122,6 +120,10 @@ class TorController:
             Whether a new tor ciruit was created.
 
         """
+        # Imported here as stem and gevent are only needed to control Tor.
+        from stem import Signal
+        from stem.control import Controller
+        import gevent.monkey
 
         def renew_circuit(password):
             """
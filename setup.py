@@ -18,6 +18,7 @@ requirements = [
     'Click>=6.0',
     'lxml',
     'beautifulsoup4',
+    'soupsieve',
     'urllib3',
     'urllib3[secure]',
     'pysocks',
@@ -59,10 +60,20 @@ setup(
     entry_points={
         'console_scripts': [
             'lyricsmaster=lyricsmaster.cli:main'
-        ]
+        ],
+        'lyricsmaster.providers': [
+            'lyricwiki=lyricsmaster.providers:LyricWiki',
+            'azlyrics=lyricsmaster.providers:AzLyrics',
+            'genius=lyricsmaster.providers:Genius',
+            'musixmatch=lyricsmaster.providers:MusixMatch',
+            'lyrics007=lyricsmaster.providers:Lyrics007',
+        ],
     },
     include_package_data=True,
     install_requires=requirements,
+    extras_require={
+        'tags': ['mutagen'],
+    },
     license="MIT license",
     zip_safe=False,
     keywords='lyricsmaster lyrics LyricWiki Lyrics Wikia Lyrics007 AzLyrics Genius MusixMatch Tor',
@@ -75,14 +86,15 @@ setup(
         'Intended Audience :: End Users/Desktop',
         'License :: OSI Approved :: MIT License',
         'Natural Language :: English',
-        "Programming Language :: Python :: 2",
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
+    python_requires='>=3.7',
     test_suite='tests',
     tests_require=test_requirements,
     setup_requires=setup_requirements,
@@ -6,24 +6,52 @@
 import os
 import sys
 import codecs
+import gzip
+import io
+import json
+import subprocess
+import time
+from collections import Counter
 
 import pytest
 from click.testing import CliRunner
 
 from bs4 import BeautifulSoup, Tag
 
+import lyricsmaster
 from lyricsmaster import models
 from lyricsmaster import cli
 from lyricsmaster.providers import LyricWiki, AzLyrics, Genius, Lyrics007, \
-    MusixMatch
+    MusixMatch, LyricsProvider
 from lyricsmaster.utils import TorController, normalize
+from lyricsmaster.matching import TitleIndex, normalize_title, title_numbers
+from lyricsmaster import registry
+from lyricsmaster.registry import ProviderRegistry
+from lyricsmaster.specs import compile_provider, load_specs
+from lyricsmaster.archive import WarcWriter, iter_records, iter_responses, read_songs, reextract
+from lyricsmaster.cache import NegativeCache
+from lyricsmaster.artists import ArtistIndex
+from lyricsmaster.deadletters import DeadLetterQueue
+from lyricsmaster.library import fill_library, group_tracks, scan_library
+from lyricsmaster.sitemaps import iter_sitemap_entries
+from lyricsmaster.server import LyricsServer, ResultCache
+from lyricsmaster import profiling
+from lyricsmaster.profiling import Profiler, profiled, stage
+from lyricsmaster.network import MemoryBudget, BufferPool, CircuitBreaker, LatencyTracker, ResponseTooLarge, \
+    read_body, DnsCache, cached_dns_pool_classes, dns_cache, ssl_context, warm_up
 
 try:
     basestring  # Python 2.7 compatibility
 except NameError:
     basestring = str
 
+import gevent
 import gevent.monkey
+import urllib3
+from urllib3 import HTTPResponse
+from urllib3.exceptions import ProtocolError
+from urllib.parse import unquote, urlencode
+from wsgiref.util import setup_testing_defaults
 
 # Works for Python 2 and 3
 try:
@@ -85,6 +113,141 @@ songs = [models.Song(real_singer['songs'][0]['song'], real_singer['album'],
                      real_singer['name'], real_singer['songs'][1]['lyrics'])]
 
 
+
+# Carries the 'not found' markers of every provider.
+not_found_page = '<html><body><div class="noarticletext"></div><div class="render_404"></div></body></html>'
+
+
+class FakeSession(object):
+    """
+    Stands in for the urllib3 session of a provider and serves recorded pages.
+
+    :param pages: dict.
+        Maps urls to html strings or bytes. Unknown urls are answered with a 404.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def request(self, method, url, **kwargs):
+        url = unquote(url)
+        self.requested.append(url)
+        body = self.pages.get(url)
+        status = 200 if body is not None else 404
+        body = body or not_found_page
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        return HTTPResponse(body=io.BytesIO(body), status=status,
+                            preload_content=kwargs.get('preload_content', True))
+
+
+class SlowSession(FakeSession):
+    """
+    FakeSession taking some time to answer and recording how many requests are in flight.
+
+    :param pages: dict.
+        Maps urls to html strings.
+    :param delay: float.
+        Response time in seconds.
+    """
+
+    def __init__(self, pages, delay=0.05):
+        super(SlowSession, self).__init__(pages)
+        self.delay = delay
+        self.in_flight = 0
+        self.concurrency = {}
+
+    def request(self, method, url, **kwargs):
+        self.in_flight += 1
+        # Number of requests in flight when each url was requested.
+        self.concurrency[unquote(url)] = self.in_flight
+        try:
+            gevent.sleep(self.delay)
+            return super(SlowSession, self).request(method, url, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+def offline_provider(provider_class, pages):
+    """
+    Creates a provider whose requests are answered by a FakeSession.
+
+    :param provider_class: LyricsProvider subclass.
+    :param pages: dict.
+        Maps urls to html strings.
+    :return: LyricsProvider object.
+    """
+    provider = provider_class()
+    provider.session = FakeSession(pages)
+    return provider
+
+
+genius_song_page = """<!doctype html><html><body>
+<div class="song_body-lyrics"><div class="lyrics">Remember back in the days...</div></div>
+<span class="metadata_unit-label">Written By</span><span class="metadata_unit-info">Christopher Wallace</span>
+</body></html>"""
+lyricwiki_song_page = """<!doctype html><html><body>
+<div class="lyricbox">{0}<br/>Remember back in the days...</div>
+</body></html>"""
+
+lyricwiki_pages = {
+    provider_strings['LyricWiki']['artist_url']: """<!doctype html><html><body>
+<h2><span class="mw-headline" id="Ready_to_Die_.281994.29">Ready to Die (1994)</span></h2>
+<ol>
+<li><a href="/wiki/The_Notorious_B.I.G.:Things_Done_Changed" title="The Notorious B.I.G.:Things Done Changed">Things Done Changed</a></li>
+<li><a href="/wiki/The_Notorious_B.I.G.:Gimme_The_Loot" title="The Notorious B.I.G.:Gimme The Loot">Gimme The Loot</a></li>
+</ol>
+<h2><span class="mw-headline" id="Life_After_Death_.281997.29">Life After Death (1997)</span></h2>
+<ol>
+<li><a href="/wiki/The_Notorious_B.I.G.:Hypnotize" title="The Notorious B.I.G.:Hypnotize">Hypnotize</a></li>
+</ol>
+<h2><span class="mw-headline" id="Greatest_Hits_.282007.29">Greatest Hits (2007)</span></h2>
+<ol>
+<li><a href="/wiki/The_Notorious_B.I.G.:Hypnotize" title="The Notorious B.I.G.:Hypnotize">Hypnotize</a></li>
+<li><a href="/wiki/The_Notorious_B.I.G.:Things_Done_Changed" title="The Notorious B.I.G.:Things Done Changed">Things Done Changed</a></li>
+</ol>
+</body></html>""",
+    'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Things_Done_Changed':
+        lyricwiki_song_page.format('Things Done Changed'),
+    'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Gimme_The_Loot':
+        lyricwiki_song_page.format('Gimme The Loot'),
+    'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Hypnotize':
+        lyricwiki_song_page.format('Hypnotize'),
+}
+
+genius_album_page = """<!doctype html><html><body>
+<div class="header_with_cover_art-primary_info">
+<div class="metadata_unit">Released {0}</div>
+</div>
+{1}
+</body></html>"""
+genius_song_row = """<div class="chart_row chart_row--light_border chart_row--full_bleed_left chart_row--align_baseline chart_row--no_hover">
+<a href="https://genius.com/The-notorious-big-{0}-lyrics">
+{1}
+Lyrics
+</a></div>"""
+
+genius_pages = {
+    provider_strings['Genius']['artist_url']: """<!doctype html><html><body>
+<a class="full_width_button" href="/artists/songs?for_artist_page=22&id=The-notorious-big">Show all songs</a>
+</body></html>""",
+    'https://genius.com/artists/albums?for_artist_page=22&id=The-notorious-big': """<!doctype html><html><body>
+<a class="album_link" href="/albums/The-notorious-big/Ready-to-die">Ready to Die</a>
+<a class="album_link" href="/albums/The-notorious-big/Life-after-death">Life After Death</a>
+</body></html>""",
+    'https://genius.com/albums/The-notorious-big/Ready-to-die': genius_album_page.format(
+        'September 13, 1994',
+        genius_song_row.format('things-done-changed', 'Things Done Changed') +
+        genius_song_row.format('gimme-the-loot', 'Gimme the Loot')),
+    'https://genius.com/albums/The-notorious-big/Life-after-death': genius_album_page.format(
+        'March 25, 1997', genius_song_row.format('hypnotize', 'Hypnotize')),
+    'https://genius.com/The-notorious-big-things-done-changed-lyrics': genius_song_page,
+    'https://genius.com/The-notorious-big-gimme-the-loot-lyrics': genius_song_page,
+    'https://genius.com/The-notorious-big-hypnotize-lyrics': genius_song_page,
+}
+
+
 class TestSongs:
     """Tests for Song Class."""
     song = songs[0]
@@ -113,6 +276,32 @@ class TestSongs:
         with codecs.open(path, 'r', encoding='utf-8') as file:
             assert self.song.lyrics == file.readlines()[0]
 
+    def test_song_compression(self):
+        lyrics = u'Remember back in the days, ça va...\n' * 50
+        song = models.Song('Things Done Changed', real_singer['album'], real_singer['name'], lyrics, compression=6)
+        short_song = models.Song('Things Done Changed', real_singer['album'], real_singer['name'], u'Short',
+                                 compression=6)
+        assert isinstance(song._lyrics, bytes)
+        assert len(song._lyrics) < len(lyrics)
+        assert song.lyrics == lyrics
+        assert short_song._lyrics == u'Short'
+        assert models.Song('Things Done Changed', real_singer['album'], real_singer['name'], lyrics)._lyrics == lyrics
+        song.lyrics = None
+        assert song.lyrics is None
+
+    def test_song_compression_counts_bytes(self):
+        # 40 characters but 120 bytes in utf-8, which zlib compresses below 120 but not below 40 bytes.
+        lyrics = u''.join(chr(0x4e00 + i * 37) for i in range(40))
+        song = models.Song('Things Done Changed', real_singer['album'], real_singer['name'], lyrics, compression=9)
+        assert isinstance(song._lyrics, bytes)
+        assert song.lyrics == lyrics
+
+    def test_provider_compression(self):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        provider.compression = 6
+        discography = provider.get_lyrics(real_singer['name'])
+        assert all(song.compression == 6 for song in discography.iter_songs())
+
 
 class TestAlbums:
     """Tests for Album Class."""
@@ -120,7 +309,6 @@ class TestAlbums:
     album = models.Album(real_singer['album'], real_singer['name'], songs, '2017')
 
     def test_album(self):
-        assert self.album.__idx__ == 0
         assert self.album.title == real_singer['album']
         assert self.album.artist == real_singer['name']
         assert self.album.__repr__() == 'lyricsmaster.models.Album({0}, {1})'.format(
@@ -133,6 +321,24 @@ class TestAlbums:
         for x, y in zip(reversed(self.album), reversed(self.album.songs)):
             assert x == y
 
+    def test_album_nested_iteration(self):
+        pairs = [(x, y) for x in self.album for y in self.album]
+        assert pairs == [(x, y) for x in songs for y in songs]
+        first, second = iter(self.album), iter(self.album)
+        assert next(first) is songs[0]
+        assert next(second) is songs[0]
+        assert next(first) is songs[1]
+
+    def test_album_view(self):
+        view = self.album.view(slice(1, None))
+        assert len(view) == 1
+        assert view[0] is songs[1]
+        assert list(view) == songs[1:]
+        assert list(reversed(self.album.view())) == songs[::-1]
+        assert list(self.album.view()[::-1][:1]) == [songs[1]]
+        with pytest.raises(TypeError):
+            self.album.view(1)
+
     def test_album_save(self):
         self.album.save()
         for song in self.album.songs:
@@ -158,13 +364,21 @@ class TestDiscography:
             real_singer['name'])
 
     def test_discography_isiter(self):
-        assert self.discography.__idx__ == 0
         assert len(self.discography) == 2
         assert [elmt for elmt in self.discography] == self.albums
         for x, y in zip(reversed(self.discography),
                         reversed(self.discography.albums)):
             assert x == y
 
+    def test_discography_iter_songs(self):
+        assert list(self.discography.iter_songs()) == songs + songs
+        assert [song for album in self.discography for song in self.discography.iter_songs()] == (songs + songs) * 2
+        assert list(self.discography.view(slice(1, 2))) == self.albums[1:2]
+        with pytest.raises(TypeError):
+            self.discography.view(0)
+        with pytest.raises(TypeError):
+            self.discography[0] = songs[0]
+
     def test_discography_save(self):
         self.discography.save()
         for album in self.albums:
@@ -347,6 +561,1479 @@ class TestLyricsProviders:
 
 
 
+class TestSongLookup:
+    """Tests for the direct song lookup."""
+
+    def test_get_song_direct(self):
+        provider = offline_provider(Genius, {provider_strings['Genius']['song_url']: genius_song_page})
+        discography = provider.get_lyrics(real_singer['name'], song='Things Done Changed')
+        assert provider.session.requested == [provider_strings['Genius']['song_url']]
+        assert len(discography) == 1
+        song = discography.albums[0].songs[0]
+        assert song.title == 'Things Done Changed'
+        assert song.album == 'Unknown'
+        assert song.writers == 'Christopher Wallace'
+
+    def test_album_is_checked(self):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        discography = provider.get_lyrics(real_singer['name'], album='Some Album That Does Not Exist',
+                                          song='Hypnotize')
+        assert not discography
+        discography = provider.get_lyrics(real_singer['name'], album='Life After Death', song='Hypnotize')
+        assert [(album.title, album[0].title) for album in discography] == [('Life After Death', 'Hypnotize')]
+
+    def test_song_is_matched_on_its_title(self):
+        pages = dict(genius_pages)
+        pages['https://genius.com/albums/The-notorious-big/Life-after-death'] = genius_album_page.format(
+            'March 25, 1997', genius_song_row.format('hypnotize', 'Hypnotize') +
+            genius_song_row.format('hypnotize-remix', 'Hypnotize (Remix)'))
+        provider = offline_provider(Genius, pages)
+        # Genius song links also contain 'Lyrics', so both songs would contain all the words of the query.
+        discography = provider.get_lyrics(real_singer['name'], album='Life After Death', song='Hypnotize')
+        assert [song.title for song in discography.iter_songs()] == ['Hypnotize']
+        assert 'https://genius.com/The-notorious-big-hypnotize-remix-lyrics' not in provider.session.requested
+
+    @pytest.mark.parametrize('artist, url', [
+        ('The Notorious B.I.G.', 'https://www.azlyrics.com/lyrics/notoriousbig/song.html'),
+        ('Thelonious Monk', 'https://www.azlyrics.com/lyrics/theloniousmonk/song.html'),
+        ('Them', 'https://www.azlyrics.com/lyrics/them/song.html'),
+    ])
+    def test_azlyrics_song_url(self, artist, url):
+        assert AzLyrics()._make_song_url(artist, 'Song') == url
+
+    @pytest.mark.parametrize('provider', providers)
+    def test_make_song_url(self, provider):
+        url = provider._make_song_url(real_singer['name'], 'Things Done Changed')
+        if provider.name == 'Lyrics007':
+            assert url is None
+        else:
+            assert url == provider_strings[provider.name]['song_url']
+
+    def test_get_song_miss(self):
+        provider = offline_provider(MusixMatch, {})
+        assert provider.get_song(real_singer['name'], 'Things Done Changed') is None
+        assert len(provider.session.requested) == 1
+
+
+class TestTitleMatching:
+    """Tests for the title matching."""
+
+    @pytest.mark.parametrize('title, normalized', [
+        ('Ready to Die (1994)', 'ready to die 1994'),
+        ('Beyoncé', 'beyonce'),
+        ('Mo Money Mo Problems (feat. Mase & Puff Daddy)', 'mo money mo problems'),
+        ('Notorious Thugs ft. Bone Thugs-N-Harmony', 'notorious thugs'),
+        ('Why $#!+ So Crazy?', 'why so crazy'),
+        ('Dance With Me', 'dance with me'),
+    ])
+    def test_normalize_title(self, title, normalized):
+        assert normalize_title(title) == normalized
+
+    def test_title_index(self):
+        titles = ['Ready to Die', 'Ready to Die (Remastered)', 'Life After Death',
+                  'Mo Money Mo Problems (feat. Mase & Puff Daddy)', 'Born Again']
+        index = TitleIndex(titles)
+        assert len(index) == 5
+        assert index.search('ready to die') == ['Ready to Die']
+        assert index.search('ready to') == ['Ready to Die', 'Ready to Die (Remastered)']
+        assert index.search('Lïfe After Deth') == ['Life After Death']
+        assert index.search('Mo Money, Mo Problems') == ['Mo Money Mo Problems (feat. Mase & Puff Daddy)']
+        assert index.search('Duets: The Final Chapter') == []
+        assert index.search('Born Again (Deluxe)', threshold=0.5) == ['Born Again']
+
+    @pytest.mark.parametrize('titles, query, matches', [
+        (['Tha Carter III', 'Tha Carter IV', 'Tha Carter V'], 'Tha Carter IV', ['Tha Carter IV']),
+        (['Tha Carter III', 'Tha Carter IV', 'Tha Carter V'], 'Tha Cartr IV', ['Tha Carter IV']),
+        (['Tha Carter III', 'Tha Carter IV', 'Tha Carter V'], 'Tha Carter 4', ['Tha Carter IV']),
+        (['Vol. 1', 'Vol. 2'], 'Vol. 1', ['Vol. 1']),
+        (['Vol. 1', 'Vol. 2'], 'Vol. 3', []),
+        (['The Blueprint', 'The Blueprint 2', 'The Blueprint 3'], 'The Blueprint 3', ['The Blueprint 3']),
+        (['The Blueprint 2', 'The Blueprint 3'], 'The Bluprint 3', ['The Blueprint 3']),
+        (['Album 1', 'Album 2'], 'Album 1', ['Album 1']),
+    ])
+    def test_numbered_titles(self, titles, query, matches):
+        assert TitleIndex(titles).search(query) == matches
+
+    def test_title_numbers(self):
+        assert title_numbers('tha carter iv') == {4}
+        assert title_numbers('vol 1 and 12') == {1, 12}
+        assert title_numbers('mcmxcix') == {1999}
+        assert title_numbers('i got 5 on it') == {5}
+        assert title_numbers('did it') == set()
+
+    def test_get_lyrics_album_filter(self):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        discography = provider.get_lyrics(real_singer['name'], album='Life after Deäth')
+        assert [album.title for album in discography] == ['Life After Death']
+        discography = provider.get_lyrics(real_singer['name'], album='Ready to Die', song='Gimme the loot!')
+        assert [song.title for song in discography.albums[0]] == ['Gimme The Loot']
+
+
+class TestDeduplication:
+    """Tests for the deduplication of songs across albums."""
+
+    def test_get_lyrics_deduplicates_urls(self):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        discography = provider.get_lyrics(real_singer['name'])
+        assert [album.title for album in discography] == ['Ready to Die', 'Life After Death', 'Greatest Hits']
+        # The artist page and the 3 unique songs.
+        assert len(provider.session.requested) == 4
+        assert provider.metrics['requests_saved'] == 2
+        greatest_hits = discography.albums[2]
+        assert greatest_hits.songs[0] is discography.albums[1].songs[0]
+        assert greatest_hits.songs[1] is discography.albums[0].songs[0]
+
+    def test_get_lyrics_deduplicates_content(self):
+        pages = dict(lyricwiki_pages)
+        artist_url = provider_strings['LyricWiki']['artist_url']
+        pages[artist_url] = pages[artist_url].replace(
+            '/wiki/The_Notorious_B.I.G.:Hypnotize" title="The Notorious B.I.G.:Hypnotize">Hypnotize</a></li>\n<li>',
+            '/wiki/The_Notorious_B.I.G.:Hypnotize_(Remastered)" title="The Notorious B.I.G.:Hypnotize">Hypnotize</a></li>\n<li>')
+        pages['http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Hypnotize_(Remastered)'] = \
+            lyricwiki_song_page.format('Hypnotize')
+        provider = offline_provider(LyricWiki, pages)
+        discography = provider.get_lyrics(real_singer['name'])
+        assert provider.metrics['duplicate_songs'] == 1
+        assert discography.albums[2].songs[0] is discography.albums[1].songs[0]
+
+
+class TestAlbumPages:
+    """Tests for the album pages shared by the album infos and the songs."""
+
+    def test_get_lyrics_fetches_album_pages_once(self):
+        provider = offline_provider(Genius, genius_pages)
+        discography = provider.get_lyrics(real_singer['name'])
+        assert [album.release_date for album in discography] == ['Released September 13, 1994',
+                                                                 'Released March 25, 1997']
+        assert [len(album) for album in discography] == [2, 1]
+        # The artist page, the albums list, 2 album pages and 3 songs.
+        assert len(provider.session.requested) == 7
+        assert len(set(provider.session.requested)) == 7
+        assert provider._album_pages == {}
+
+    def test_get_lyrics_album_filter_fetches_album_pages_once(self):
+        provider = offline_provider(Genius, genius_pages)
+        discography = provider.get_lyrics(real_singer['name'], album='Ready to Die')
+        assert [album.title for album in discography] == ['Ready to Die']
+        assert len(provider.session.requested) == 6
+        assert len(set(provider.session.requested)) == 6
+        assert provider._album_pages == {}
+
+
+    def test_concurrent_crawls_share_album_pages(self):
+        provider = offline_provider(Genius, genius_pages)
+        provider.session = SlowSession(genius_pages)
+        crawls = [gevent.spawn(provider.get_lyrics, real_singer['name'], 'Ready to Die'),
+                  gevent.spawn(provider.get_lyrics, real_singer['name'])]
+        gevent.joinall(crawls, raise_error=True)
+        assert [album.title for album in crawls[0].value] == ['Ready to Die']
+        assert [len(album) for album in crawls[1].value] == [2, 1]
+        assert crawls[0].value.complete and crawls[1].value.complete
+        # The crawls share the album pages instead of downloading them again.
+        album_pages = [url for url in provider.session.requested if '/albums/' in url]
+        assert sorted(album_pages) == ['https://genius.com/albums/The-notorious-big/Life-after-death',
+                                       'https://genius.com/albums/The-notorious-big/Ready-to-die']
+        assert provider._album_pages == {}
+
+    @pytest.mark.parametrize('max_connections', [1, 2])
+    def test_album_pages_are_prefetched_concurrently(self, max_connections):
+        provider = offline_provider(Genius, genius_pages)
+        provider.session = SlowSession(genius_pages)
+        provider.max_connections = max_connections
+        discography = provider.get_lyrics(real_singer['name'])
+        assert [len(album) for album in discography] == [2, 1]
+        assert provider.session.requested[2:4] == ['https://genius.com/albums/The-notorious-big/Ready-to-die',
+                                                   'https://genius.com/albums/The-notorious-big/Life-after-death']
+        assert provider.session.concurrency['https://genius.com/albums/The-notorious-big/Life-after-death'] == \
+            max_connections
+        assert len(provider.session.requested) == 7
+
+
+class TestPagination:
+    """Tests for the paginated listings."""
+
+    def test_genius_albums_pagination(self):
+        albums_url = 'https://genius.com/artists/albums?for_artist_page=22&id=The-notorious-big'
+        pages = dict(genius_pages)
+        pages[albums_url] = pages[albums_url].replace('</body>', """<div class="pagination">
+<span class="previous_page disabled">&#8592; Previous</span> <em class="current">1</em>
+<a rel="next" href="/artists/albums?for_artist_page=22&amp;id=The-notorious-big&amp;page=2">2</a>
+<a href="/artists/albums?for_artist_page=22&amp;id=The-notorious-big&amp;page=3">3</a>
+<a class="next_page" rel="next" href="/artists/albums?for_artist_page=22&amp;id=The-notorious-big&amp;page=2">Next &#8594;</a>
+</div></body>""")
+        for page, album in ((2, 'Born Again'), (3, 'Duets')):
+            pages['{0}&page={1}'.format(albums_url, page)] = \
+                '<html><body><a class="album_link" href="/albums/The-notorious-big/{0}">{0}</a></body></html>'.format(
+                    album)
+        provider = offline_provider(Genius, pages)
+        provider.session = SlowSession(pages)
+        albums = provider.get_albums(provider.get_page(provider_strings['Genius']['artist_url']).data)
+        assert [album.text for album in albums] == ['Ready to Die', 'Life After Death', 'Born Again', 'Duets']
+        assert provider.session.concurrency[albums_url + '&page=3'] == 2
+        assert len(provider.session.requested) == 4
+
+    def test_musixmatch_albums_pagination(self):
+        provider = MusixMatch()
+        url = 'https://www.musixmatch.com/artist/The-Notorious-B-I-G/albums'
+        page = BeautifulSoup('<a href="/artist/The-Notorious-B-I-G/albums/2">2</a>'
+                             '<a href="https://www.musixmatch.com/artist/The-Notorious-B-I-G/albums/4">4</a>'
+                             '<a href="/artist/The-Notorious-B-I-G/albums/3/tracks">tracks</a>', 'lxml')
+        assert provider._listing_page_urls(page, url) == [url + '/2', url + '/3', url + '/4']
+        assert provider._listing_page_urls(BeautifulSoup('<a href="/album/x">x</a>', 'lxml'), url) == []
+
+
+class TestRegistry:
+    """Tests for the providers registry."""
+
+    def test_builtin_providers(self):
+        assert lyricsmaster.CURRENT_PROVIDERS['Genius'] is Genius
+        assert lyricsmaster.LyricWiki is LyricWiki
+        assert lyricsmaster.TorController is TorController
+        assert 'musixmatch' in lyricsmaster.CURRENT_PROVIDERS
+        assert 'fake provider' not in lyricsmaster.CURRENT_PROVIDERS
+        with pytest.raises(AttributeError):
+            lyricsmaster.NotAProvider
+
+    def test_register(self):
+        registry = ProviderRegistry({})
+        registry.register('Genius', 'lyricsmaster.providers:Genius')
+        registry.register('wiki', LyricWiki)
+        assert registry['genius'] is Genius
+        assert registry['WIKI'] is LyricWiki
+
+    def test_entry_points(self, monkeypatch):
+        class EntryPoint(object):
+            name = 'MyLyrics'
+
+            def load(self):
+                return AzLyrics
+
+        monkeypatch.setattr(registry, 'iter_entry_points', lambda group: [EntryPoint()])
+        providers_registry = ProviderRegistry()
+        assert providers_registry['mylyrics'] is AzLyrics
+        assert sorted(providers_registry) == ['azlyrics', 'genius', 'lyrics007', 'lyricwiki', 'musixmatch',
+                                              'mylyrics']
+
+    def test_lazy_import(self):
+        code = 'import sys, lyricsmaster, lyricsmaster.cli\n' \
+               'print(",".join(m for m in ("bs4", "lxml", "urllib3", "gevent", "stem") if m in sys.modules))'
+        output = subprocess.check_output([sys.executable, '-c', code])
+        assert output.strip() == b''
+
+
+class TestSpecs:
+    """Tests for the providers compiled from declarative specs."""
+
+    spec = {'name': 'ExampleLyrics', 'base_url': 'https://www.example.com',
+            'artist_url': '{base_url}/artist/{artist}', 'song_url': '{base_url}/lyrics/{artist}/{song}',
+            'has_artist': 'div.discography', 'has_lyrics': 'div.lyrics',
+            'albums': 'div.discography div.album', 'album_title': 'h2', 'release_date': 'span.year',
+            'songs': 'ol li a', 'lyrics': 'div.lyrics', 'writers': 'p.credits', 'lowercase': True}
+    pages = {
+        'https://www.example.com/artist/the-notorious-big': """<html><body><div class="discography">
+<div class="album"><h2>Ready to Die</h2><span class="year">1994</span><ol>
+<li><a href="/lyrics/the-notorious-big/things-done-changed">Things Done Changed</a></li>
+<li><a href="/lyrics/the-notorious-big/gimme-the-loot">Gimme the Loot</a></li></ol></div>
+<div class="album"><h2>Life After Death</h2><ol>
+<li><a href="https://www.example.com/lyrics/the-notorious-big/hypnotize">Hypnotize</a></li></ol></div>
+</div></body></html>""",
+        'https://www.example.com/lyrics/the-notorious-big/things-done-changed':
+            '<html><body><div class="lyrics">Remember back in the days<br/>...</div>'
+            '<p class="credits">Christopher Wallace</p></body></html>',
+        'https://www.example.com/lyrics/the-notorious-big/gimme-the-loot':
+            '<html><body><div class="lyrics">Gimme the Loot</div></body></html>',
+        'https://www.example.com/lyrics/the-notorious-big/hypnotize':
+            '<html><body><div class="lyrics">Hypnotize</div></body></html>',
+    }
+
+    def test_compile_provider(self):
+        provider_class = compile_provider(self.spec)
+        assert issubclass(provider_class, LyricsProvider)
+        assert provider_class.name == 'ExampleLyrics'
+        provider = offline_provider(provider_class, self.pages)
+        discography = provider.get_lyrics(real_singer['name'])
+        assert [(album.title, album.release_date) for album in discography] == [('Ready to Die', '1994'),
+                                                                               ('Life After Death', 'Unknown')]
+        song = discography.albums[0].songs[0]
+        assert song.title == 'Things Done Changed'
+        assert song.lyrics == 'Remember back in the days\n...'
+        assert song.writers == 'Christopher Wallace'
+        assert discography.albums[0].songs[1].writers is None
+        assert len(provider.session.requested) == 4
+
+    def test_song_url(self):
+        provider = offline_provider(compile_provider(self.spec), self.pages)
+        discography = provider.get_lyrics(real_singer['name'], song='Things Done Changed')
+        assert provider.session.requested == ['https://www.example.com/lyrics/the-notorious-big/things-done-changed']
+        assert discography.albums[0].songs[0].lyrics == 'Remember back in the days\n...'
+
+    def test_album_pages(self):
+        spec = dict(self.spec, albums='a.album', album_url='a.album', album_title=None, release_date=None)
+        pages = {'https://www.example.com/artist/the-notorious-big':
+                 '<html><body><div class="discography"><a class="album" href="/album/1">Ready to Die</a></div>'
+                 '</body></html>',
+                 'https://www.example.com/album/1': self.pages['https://www.example.com/artist/the-notorious-big'],
+                 'https://www.example.com/lyrics/the-notorious-big/hypnotize':
+                     self.pages['https://www.example.com/lyrics/the-notorious-big/hypnotize']}
+        provider = offline_provider(compile_provider(spec), pages)
+        discography = provider.get_lyrics(real_singer['name'])
+        assert [album.title for album in discography] == ['Ready to Die']
+        assert [song.title for song in discography.albums[0]] == ['Hypnotize']
+
+    def test_missing_selector(self):
+        with pytest.raises(ValueError):
+            compile_provider(dict(self.spec, lyrics=None))
+
+    def test_load_specs(self, tmpdir):
+        path = tmpdir.join('specs.json')
+        path.write(json.dumps([self.spec]))
+        providers_registry = ProviderRegistry({})
+        provider_class, = load_specs(str(path), providers_registry)
+        assert providers_registry['examplelyrics'] is provider_class
+
+
+class TestStreaming:
+    """Tests for the streaming of lyrics pages."""
+
+    song_url = 'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Things_Done_Changed'
+    song_page = """<!doctype html><html><body>
+<div class="lyricbox">Remember back in the days<br/>...</div>
+<table class="song-credit-box"><tr><td><p>Songwriters</p><p>Christopher Wallace</p></td></tr></table>
+{0}
+</body></html>""".format('<p>Comments and ads</p>' * 2000)
+
+    def test_streaming_stops_after_markers(self):
+        provider = offline_provider(LyricWiki, {self.song_url: self.song_page})
+        provider.streaming = True
+        provider.stream_chunk_size = 256
+        song = provider.get_song(real_singer['name'], 'Things Done Changed')
+        assert song.lyrics == 'Remember back in the days\n...'
+        assert song.writers == 'Christopher Wallace'
+        assert provider.metrics['streams_stopped_early'] == 1
+        assert provider.metrics['bytes_downloaded'] < len(self.song_page) / 10
+
+    def test_streaming_reads_pages_without_markers(self):
+        page = self.song_page.replace('song-credit-box', 'other-box')
+        provider = offline_provider(LyricWiki, {self.song_url: page})
+        provider.streaming = True
+        song = provider.get_song(real_singer['name'], 'Things Done Changed')
+        assert song.lyrics == 'Remember back in the days\n...'
+        assert song.writers is None
+        assert provider.metrics['streams_stopped_early'] == 0
+        assert provider.metrics['bytes_downloaded'] == len(page)
+
+    def test_streaming_missing_page(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.streaming = True
+        assert provider.get_song(real_singer['name'], 'Things Done Changed') is None
+
+
+class TestMemoryBudget:
+    """Tests for the memory bounded downloads."""
+
+    def test_oversized_pages_are_abandoned(self):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        provider.max_response_size = 100
+        assert provider.get_page(provider_strings['LyricWiki']['artist_url']) is None
+        assert provider.metrics['responses_too_large'] == 1
+        assert provider.memory_budget.in_flight == 0
+
+    def test_oversized_streamed_pages_are_abandoned(self):
+        provider = offline_provider(LyricWiki, {TestStreaming.song_url: TestStreaming.song_page})
+        provider.streaming = True
+        provider.max_response_size = 100
+        assert provider.get_song(real_singer['name'], 'Things Done Changed') is None
+        assert provider.metrics['responses_too_large'] == 1
+        assert provider.memory_budget.in_flight == 0
+
+    def test_announced_length_is_checked_before_reading(self):
+        response = HTTPResponse(body=io.BytesIO(b'x' * 1000), headers={'content-length': '1000'},
+                                preload_content=False)
+        with pytest.raises(ResponseTooLarge):
+            read_body(response, 100, MemoryBudget(), BufferPool(16))
+        assert response.tell() == 0
+
+    def test_read_body(self):
+        buffers = BufferPool(16)
+        budget = MemoryBudget()
+        response = HTTPResponse(body=io.BytesIO(b'x' * 1000), preload_content=False)
+        assert read_body(response, 1000, budget, buffers) == b'x' * 1000
+        assert budget.in_flight == 0
+        assert len(buffers.buffers) == 1
+
+    def test_budget_throttles_downloads(self):
+        budget = MemoryBudget(100)
+        budget.acquire(60)
+        waiting = gevent.spawn(budget.acquire, 60)
+        gevent.sleep(0.01)
+        assert not waiting.ready()
+        budget.release(60)
+        waiting.join(1)
+        assert waiting.ready()
+        assert budget.in_flight == 60
+
+    def test_budget_admits_a_single_large_download(self):
+        budget = MemoryBudget(100)
+        budget.acquire(1000)
+        assert budget.in_flight == 1000
+
+    def test_crawl_releases_the_budget(self):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        provider.memory_budget = MemoryBudget(1024)
+        assert provider.get_lyrics(real_singer['name'])
+        assert provider.memory_budget.in_flight == 0
+        assert provider.metrics['bytes_downloaded'] > 0
+
+
+class FailingSession(FakeSession):
+    """
+    FakeSession whose requests fail, either with a connection error or with a 503 answer.
+
+    :param pages: dict.
+        Maps urls to html strings.
+    :param status: integer.
+        Status of the answers. None to raise a connection error.
+    """
+
+    def __init__(self, pages, status=None):
+        super(FailingSession, self).__init__(pages)
+        self.status = status
+        self.failing = True
+
+    def request(self, method, url, **kwargs):
+        if not self.failing:
+            return super(FailingSession, self).request(method, url, **kwargs)
+        self.requested.append(unquote(url))
+        if self.status is None:
+            raise ProtocolError('Connection aborted.')
+        return HTTPResponse(body=io.BytesIO(b'Service Unavailable'), status=self.status, preload_content=False)
+
+
+class TestCircuitBreaker:
+    """Tests for the circuit breakers of the providers' hosts."""
+
+    song_urls = ['http://lyrics.wikia.com/wiki/2Pac:Song_{0}'.format(i) for i in range(10)]
+
+    @pytest.mark.parametrize('status', [None, 503])
+    def test_circuit_opens_after_threshold(self, status):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = FailingSession({}, status)
+        for url in self.song_urls:
+            provider.get_lyrics_page(url)
+        assert len(provider.session.requested) == provider.breaker_threshold
+        assert provider.metrics['requests_short_circuited'] == len(self.song_urls) - provider.breaker_threshold
+        assert provider.metrics['circuit_open'] == 1
+        assert not provider.is_available()
+
+    def test_successes_reset_failures(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = FailingSession({})
+        for url in self.song_urls[:provider.breaker_threshold - 1]:
+            provider.get_lyrics_page(url)
+        provider.session.failing = False
+        provider.get_lyrics_page(self.song_urls[-1])
+        provider.session.failing = True
+        provider.get_lyrics_page(self.song_urls[0])
+        assert provider.is_available()
+        assert provider.metrics['circuit_open'] == 0
+
+    def test_half_open_probe(self):
+        metrics = Counter()
+        breaker = CircuitBreaker('lyrics.wikia.com', metrics, threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        assert not breaker.allow()
+        gevent.sleep(0.02)
+        assert breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow()  # A single probe at a time.
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        gevent.sleep(0.02)
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert metrics == Counter({'circuit_open': 2, 'circuit_half_open': 2, 'circuit_closed': 1})
+
+    def test_unavailable_artist_page(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = FailingSession({})
+        assert provider.get_lyrics(real_singer['name']) is None
+
+    @pytest.mark.parametrize('provider_class', [AzLyrics, Lyrics007])
+    def test_search_with_open_circuit(self, provider_class):
+        provider = offline_provider(provider_class, {})
+        provider.session = FailingSession({})
+        for i in range(provider.breaker_threshold):
+            provider.get_page(provider.base_url + '/{0}'.format(i))
+        assert not provider.is_available()
+        assert provider.search('Some Artist') is None
+        assert provider.get_lyrics('Some Artist') is None
+
+    def test_album_page_with_open_circuit(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = FailingSession({})
+        assert provider.get_album_page(real_singer['name'], 'Ready to Die') is None
+
+    def test_killed_probe(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.breaker_threshold = 1
+        provider.breaker_reset_timeout = 0.01
+        provider.session = FailingSession({})
+        provider.get_lyrics_page(self.song_urls[0])
+        gevent.sleep(0.02)
+        provider.session = HangingSession(lyricwiki_pages, {self.song_urls[1]})
+        probe = gevent.spawn(provider.get_lyrics_page, self.song_urls[1])
+        gevent.sleep(0.01)
+        probe.kill()
+        breaker = provider._circuit_breaker(provider._quote_url(self.song_urls[1]))
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.probing
+        provider.get_lyrics_page(provider_strings['LyricWiki']['song_url'])
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestSingleFlight:
+    """Tests for the coalescing of concurrent identical requests."""
+
+    url = provider_strings['LyricWiki']['artist_url']
+
+    def test_concurrent_requests_are_coalesced(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = SlowSession(lyricwiki_pages)
+        requests = [gevent.spawn(provider.get_page, self.url) for i in range(5)]
+        gevent.joinall(requests)
+        assert provider.session.requested == [self.url]
+        assert provider.metrics['requests_coalesced'] == 4
+        assert len(set(request.value.data for request in requests)) == 1
+        assert not provider._in_flight.calls
+
+    def test_sequential_requests_are_sent(self):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        provider.get_page(self.url)
+        provider.get_page(self.url)
+        assert provider.session.requested == [self.url, self.url]
+        assert provider.metrics['requests_coalesced'] == 0
+
+    def test_killed_request_releases_waiters(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = SlowSession(lyricwiki_pages)
+        first = gevent.spawn(provider.get_page, self.url)
+        gevent.sleep(0)
+        second = gevent.spawn(provider.get_page, self.url)
+        gevent.sleep(0)
+        first.kill()
+        assert second.get(timeout=1) is None
+        assert not provider._in_flight.calls
+
+
+class HangingSession(FakeSession):
+    """
+    FakeSession never answering some urls.
+
+    :param pages: dict.
+        Maps urls to html strings.
+    :param hanging: set.
+        Urls which are never answered.
+    """
+
+    def __init__(self, pages, hanging):
+        super(HangingSession, self).__init__(pages)
+        self.hanging = hanging
+        self.timeouts = []
+        self.retries = []
+
+    def request(self, method, url, **kwargs):
+        self.timeouts.append(kwargs.get('timeout'))
+        self.retries.append(kwargs.get('retries'))
+        if unquote(url) in self.hanging:
+            gevent.sleep(60)
+        return super(HangingSession, self).request(method, url, **kwargs)
+
+
+class TestDeadline:
+    """Tests for the request timeouts and the crawl deadline."""
+
+    hanging_url = 'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Gimme_The_Loot'
+
+    def test_requests_have_timeouts(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = HangingSession(lyricwiki_pages, set())
+        provider.get_page(self.hanging_url)
+        timeout = provider.session.timeouts[0]
+        assert timeout.connect_timeout == provider.connect_timeout
+        assert timeout.read_timeout == provider.read_timeout
+        assert timeout.total == provider.request_timeout
+        retries = provider.session.retries[0]
+        assert (retries.connect, retries.read) == (provider.request_retries,) * 2
+        assert retries.total == provider.request_retries + provider.max_redirects
+
+    def test_requests_are_retried_a_bounded_number_of_times(self, monkeypatch):
+        attempts = []
+
+        def create_connection(address, *args, **kwargs):
+            attempts.append(address)
+            raise ConnectionRefusedError(111, 'Connection refused')
+
+        monkeypatch.setattr('urllib3.util.connection.create_connection', create_connection)
+        provider = LyricWiki()
+        provider.request_backoff = 0
+        assert provider.get_page('http://127.0.0.1:9/') is None
+        assert len(attempts) == provider.request_retries + 1
+
+    def test_deadline_returns_partial_discography(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = HangingSession(lyricwiki_pages, {self.hanging_url})
+        start = time.time()
+        discography = provider.get_lyrics(real_singer['name'], deadline=0.2)
+        assert time.time() - start < 5
+        assert [album.title for album in discography] == ['Ready to Die']
+        assert [song.title for song in discography[0]] == ['Things Done Changed']
+        assert provider.metrics['deadlines_exceeded'] == 1
+        assert not provider._in_flight.calls
+
+    def test_deadline_before_albums(self):
+        provider = offline_provider(LyricWiki, {})
+        artist_url = provider_strings['LyricWiki']['artist_url']
+        provider.session = HangingSession(lyricwiki_pages, {artist_url})
+        assert provider.get_lyrics(real_singer['name'], deadline=0.1) is None
+        assert provider.metrics['deadlines_exceeded'] == 1
+
+    def test_crawl_within_deadline(self):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        discography = provider.get_lyrics(real_singer['name'], deadline=60)
+        assert len(discography) == 3
+        assert provider.metrics['deadlines_exceeded'] == 0
+
+
+class TestArchive:
+    """Tests for the raw page archive and the offline re-extraction."""
+
+    def crawl(self, path):
+        with WarcWriter(path) as warc:
+            provider = offline_provider(LyricWiki, lyricwiki_pages)
+            provider.archive = warc
+            return provider.get_lyrics(real_singer['name'])
+
+    def test_pages_are_archived(self, tmp_path):
+        path = str(tmp_path / 'crawl.warc.gz')
+        self.crawl(path)
+        records = list(iter_records(path))
+        assert records[0].type == 'warcinfo'
+        songs, last_responses = read_songs(path)
+        assert {unquote(url) for url in last_responses} == set(lyricwiki_pages)
+        position = last_responses['http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.%3AHypnotize']
+        (position, url, status, body), = iter_responses(path, {position})
+        assert status == 200
+        assert body == lyricwiki_pages['http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Hypnotize'].encode('utf-8')
+        assert [(song['album'], song['title']) for song in songs] == [
+            ('Ready to Die', 'Things Done Changed'), ('Ready to Die', 'Gimme The Loot'),
+            ('Life After Death', 'Hypnotize'), ('Greatest Hits', 'Hypnotize'),
+            ('Greatest Hits', 'Things Done Changed')]
+        assert songs[0]['provider'] == 'LyricWiki'
+        assert songs[0]['release_date'] == '1994'
+
+    @pytest.mark.parametrize('processes', [1, 2])
+    def test_reextract(self, tmp_path, processes):
+        path = str(tmp_path / 'crawl.warc.gz')
+        discography = self.crawl(path)
+        reextracted, = reextract(path, processes=processes)
+        assert reextracted.artist == discography.artist
+        assert [(album.title, album.release_date) for album in reextracted] == \
+            [(album.title, album.release_date) for album in discography]
+        assert [(song.title, song.lyrics, song.writers) for song in reextracted.iter_songs()] == \
+            [(song.title, song.lyrics, song.writers) for song in discography.iter_songs()]
+        assert reextracted[1][0] is reextracted[2][0]
+
+    def test_reextract_streams_artists(self, tmp_path):
+        path = str(tmp_path / 'crawl.warc.gz')
+        discography = self.crawl(path)
+        with WarcWriter(path) as warc:
+            provider = offline_provider(LyricWiki, {TestStreaming.song_url: TestStreaming.song_page})
+            provider.archive = warc
+            provider._archive_song(TestStreaming.song_url, 'Other Song', 'Other Artist', 'Other Album', '2000')
+            provider.get_page(TestStreaming.song_url)
+        discographies = reextract(path, processes=1, batch_size=2)
+        first = next(discographies)
+        assert first.artist == discography.artist
+        assert len(list(first.iter_songs())) == 5
+        other, = discographies
+        assert (other.artist, other[0].title, other[0][0].title) == ('Other Artist', 'Other Album', 'Other Song')
+
+    def test_archive_spans_crawls(self, tmp_path):
+        path = str(tmp_path / 'crawl.warc.gz')
+        self.crawl(path)
+        self.crawl(path)
+        assert len([record for record in iter_records(path) if record.type == 'warcinfo']) == 1
+        reextracted, = reextract(path, processes=1)
+        assert len(list(reextracted.iter_songs())) == 5
+
+    def test_streamed_pages_are_archived_truncated(self, tmp_path):
+        path = str(tmp_path / 'song.warc.gz')
+        with WarcWriter(path) as warc:
+            provider = offline_provider(LyricWiki, {TestStreaming.song_url: TestStreaming.song_page})
+            provider.archive = warc
+            provider.streaming = True
+            provider.stream_chunk_size = 256
+            song = provider.get_song(real_singer['name'], 'Things Done Changed')
+        response = [record for record in iter_records(path) if record.type == 'response'][0]
+        assert response.headers['WARC-Truncated'] == 'length'
+        reextracted, = reextract(path, processes=1)
+        assert reextracted[0][0].lyrics == song.lyrics
+
+    def test_cli_reextract(self, tmp_path):
+        path = str(tmp_path / 'crawl.warc.gz')
+        self.crawl(path)
+        folder = str(tmp_path / 'lyrics')
+        result = CliRunner().invoke(cli.main, ['reextract', path, '-f', folder, '--processes', '1'])
+        assert result.exit_code == 0
+        assert os.path.exists(os.path.join(folder, 'LyricsMaster', 'The-Notorious-BIG', 'Ready-to-Die', 'Gimme-The-Loot.txt'))
+
+    def test_cli_default_command(self):
+        result = CliRunner().invoke(cli.main, [real_singer['name'], '--help'])
+        assert result.exit_code == 0
+        assert 'ARTIST_NAME' in result.output
+
+
+class StragglerSession(FakeSession):
+    """
+    FakeSession whose first request of each url is slow.
+
+    :param pages: dict.
+        Maps urls to html strings.
+    :param delay: float.
+        Response time of the first requests in seconds.
+    """
+
+    def __init__(self, pages, delay=5):
+        super(StragglerSession, self).__init__(pages)
+        self.delay = delay
+        self.seen = set()
+
+    def request(self, method, url, **kwargs):
+        if unquote(url) not in self.seen:
+            self.seen.add(unquote(url))
+            gevent.sleep(self.delay)
+        return super(StragglerSession, self).request(method, url, **kwargs)
+
+
+class TestHedging:
+    """Tests for the hedged requests."""
+
+    url = provider_strings['LyricWiki']['artist_url']
+
+    def hedging_provider(self, samples=20):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = StragglerSession(lyricwiki_pages)
+        provider.hedging = True
+        provider.metrics['requests_sent'] = 100
+        for i in range(samples):
+            provider.latencies.record(0.01)
+        return provider
+
+    def test_slow_requests_are_hedged(self):
+        provider = self.hedging_provider()
+        start = time.time()
+        req = provider.get_page(self.url)
+        assert time.time() - start < 1
+        assert req.data == lyricwiki_pages[self.url].encode('utf-8')
+        assert provider.metrics['requests_hedged'] == 1
+        assert provider.metrics['hedges_won'] == 1
+
+    def test_fast_requests_are_not_hedged(self):
+        provider = self.hedging_provider()
+        provider.session = FakeSession(lyricwiki_pages)
+        assert provider.get_page(self.url)
+        assert provider.session.requested == [self.url]
+        assert provider.metrics['requests_hedged'] == 0
+
+    def test_hedge_budget(self):
+        provider = self.hedging_provider()
+        provider.hedge_budget = 0
+        provider.session.delay = 0.1
+        assert provider.get_page(self.url)
+        assert provider.metrics['requests_hedged'] == 0
+
+    def test_hedging_needs_latencies(self):
+        provider = self.hedging_provider(samples=5)
+        provider.session.delay = 0.1
+        assert provider.get_page(self.url)
+        assert provider.metrics['requests_hedged'] == 0
+
+    def test_latency_percentile(self):
+        latencies = LatencyTracker(size=100)
+        assert latencies.percentile(95) is None
+        for latency in range(1, 201):
+            latencies.record(latency)
+        assert len(latencies) == 100
+        assert latencies.percentile(95) == 195
+        assert latencies.percentile(50) == 150
+
+
+class TestNegativeCache:
+    """Tests for the negative cache of missing artists and songs."""
+
+    song_url = 'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Things_Done_Changed'
+
+    def test_missing_lyrics_are_not_requested_again(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.negative_cache = NegativeCache()
+        assert provider.get_song(real_singer['name'], 'Things Done Changed') is None
+        assert provider.get_song(real_singer['name'], 'Things Done Changed') is None
+        assert len(provider.session.requested) == 1
+        assert provider.metrics['negative_cache_hits'] == 1
+
+    def test_missing_artists_are_not_requested_again(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.negative_cache = NegativeCache()
+        assert provider.get_lyrics('Unknown Artist') is None
+        assert provider.get_lyrics('Unknown Artist') is None
+        assert len(provider.session.requested) == 1
+        assert provider.metrics['negative_cache_hits'] == 1
+
+    @pytest.mark.parametrize('provider_class', [AzLyrics, Lyrics007])
+    def test_searched_artists_are_not_searched_again(self, provider_class):
+        search_url = provider_class.search_url + 'Unknown+Artist'
+        provider = offline_provider(provider_class, {search_url: '<!doctype html><html><body></body></html>'})
+        provider.negative_cache = NegativeCache()
+        assert provider.get_lyrics('Unknown Artist') is None
+        assert provider.get_lyrics('Unknown Artist') is None
+        assert provider.session.requested == [search_url]
+        assert provider.metrics['negative_cache_hits'] == 1
+
+    @pytest.mark.parametrize('provider_class', [AzLyrics, Lyrics007])
+    def test_failed_searches_are_not_cached(self, provider_class):
+        provider = offline_provider(provider_class, {})
+        provider.session = FailingSession({}, 503)
+        provider.negative_cache = NegativeCache()
+        assert provider.get_lyrics('Unknown Artist') is None
+        assert len(provider.negative_cache) == 0
+
+    @pytest.mark.parametrize('status', [503, 403, 429])
+    def test_failures_are_not_cached(self, status):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = FailingSession({}, status)
+        provider.negative_cache = NegativeCache()
+        assert provider.get_song(real_singer['name'], 'Things Done Changed') is None
+        assert provider.get_lyrics(real_singer['name']) is None
+        assert len(provider.negative_cache) == 0
+        assert provider.dead_letters.get(self.song_url)['reason'] == 'Http status {0}'.format(status)
+        assert provider.metrics['circuit_open'] == 0
+        for i in range(provider.breaker_threshold):
+            provider.get_page(self.song_url)
+        assert not provider.is_available()
+
+    def test_misses_expire(self):
+        cache = NegativeCache(ttl=0.01)
+        cache.add(self.song_url)
+        assert self.song_url in cache
+        time.sleep(0.02)
+        assert self.song_url not in cache
+        assert len(cache) == 0
+
+    def test_cache_persistence(self, tmp_path):
+        path = str(tmp_path / 'misses.json')
+        assert len(NegativeCache.load(path)) == 0
+        cache = NegativeCache()
+        cache.add(self.song_url)
+        cache.save(path)
+        loaded = NegativeCache.load(path)
+        assert self.song_url in loaded
+        assert 'http://lyrics.wikia.com/wiki/2Pac:Changes' not in loaded
+
+    def test_cache_grows(self):
+        cache = NegativeCache()
+        keys = ['http://lyrics.wikia.com/wiki/{0}'.format(i) for i in range(3000)]
+        for key in keys:
+            cache.add(key)
+        assert len(cache) == 3000
+        assert all(key in cache for key in keys)
+
+
+azlyrics_listing_pages = {
+    'https://www.azlyrics.com/a.html': """<!doctype html><html><body>
+<div class="col-sm-6 text-center artist-col"><a href="a/aaliyah.html">Aaliyah</a><br><a href="a/akon.html">Akon</a></div>
+</body></html>""",
+    'https://www.azlyrics.com/n.html': """<!doctype html><html><body>
+<div class="col-sm-6 text-center artist-col"><a href="n/nas.html">Nas</a><br></div>
+<div class="col-sm-6 text-center artist-col"><a href="n/notoriousbig.html">Notorious B.I.G.</a><br></div>
+</body></html>""",
+}
+
+
+class TestArtistIndex:
+    """Tests for the local artist index."""
+
+    def indexed_provider(self):
+        provider = offline_provider(AzLyrics, azlyrics_listing_pages)
+        provider.update_artist_index()
+        return provider
+
+    def test_update_artist_index(self):
+        provider = self.indexed_provider()
+        assert len(provider.session.requested) == 27
+        assert len(provider.artist_index) == 4
+        assert provider.artist_index.get('Notorious B.I.G.') == 'https://www.azlyrics.com/n/notoriousbig.html'
+
+    def test_lookups(self):
+        index = self.indexed_provider().artist_index
+        assert index.get('The Notorious B.I.G.') == 'https://www.azlyrics.com/n/notoriousbig.html'
+        assert 'aaliyah' in index
+        assert 'Tupac' not in index
+        assert index.prefix('a') == [('Aaliyah', 'https://www.azlyrics.com/a/aaliyah.html'),
+                                     ('Akon', 'https://www.azlyrics.com/a/akon.html')]
+        assert index.prefix('na') == [('Nas', 'https://www.azlyrics.com/n/nas.html')]
+        assert index.search('Aaliya') == [('Aaliyah', 'https://www.azlyrics.com/a/aaliyah.html')]
+
+    def test_artist_url_is_looked_up(self):
+        provider = self.indexed_provider()
+        provider.session.requested = []
+        assert provider._make_artist_url('The Notorious B.I.G.') == 'https://www.azlyrics.com/n/notoriousbig.html'
+        assert provider.session.requested == []
+        assert provider.metrics['artist_index_hits'] == 1
+
+    def test_similar_artists_are_not_looked_up(self):
+        provider = self.indexed_provider()
+        assert provider._indexed_artist_url('Na') is None
+        assert provider._indexed_artist_url('Aaliya') is None
+        assert provider._suggest_artists('Aaliya') == ', did you mean Aaliyah?'
+        assert provider.metrics['artist_index_hits'] == 0
+
+    def test_index_belongs_to_its_provider(self, tmp_path):
+        path = str(tmp_path / 'azlyrics.json')
+        self.indexed_provider().artist_index.save(path)
+        index = ArtistIndex.load(path)
+        assert index.provider == 'AzLyrics'
+        provider = offline_provider(Lyrics007, {})
+        provider.artist_index = index
+        assert provider._indexed_artist_url('Nas') is None
+        with pytest.raises(ValueError):
+            provider.update_artist_index()
+
+    def test_incremental_refresh(self, tmp_path):
+        path = str(tmp_path / 'azlyrics.json')
+        self.indexed_provider().artist_index.save(path)
+        pages = dict(azlyrics_listing_pages)
+        pages['https://www.azlyrics.com/t.html'] = """<!doctype html><html><body>
+<div class="col-sm-6 text-center artist-col"><a href="t/tupac.html">Tupac</a><br></div>
+</body></html>"""
+        provider = offline_provider(AzLyrics, pages)
+        index = provider.update_artist_index(ArtistIndex.load(path))
+        # Only the listing pages which were missing are crawled.
+        assert len(provider.session.requested) == 25
+        assert index.get('Tupac') == 'https://www.azlyrics.com/t/tupac.html'
+        assert len(index) == 5
+        provider.session.requested = []
+        provider.update_artist_index(max_age=0)
+        assert len(provider.session.requested) == 27
+
+
+def sitemap(tag, urls):
+    """Builds a sitemap, or a sitemap index if tag is 'sitemap', listing the supplied urls."""
+    entries = ''.join('<{0}><loc>{1}</loc></{0}>'.format(tag, url) for url in urls)
+    root = 'urlset' if tag == 'url' else 'sitemapindex'
+    return '<?xml version="1.0" encoding="UTF-8"?><{0} xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">' \
+           '{1}</{0}>'.format(root, entries)
+
+
+lyricwiki_sitemap_pages = dict(lyricwiki_pages)
+lyricwiki_sitemap_pages.update({
+    'http://lyrics.wikia.com/sitemap-newsitemapxml-index.xml': gzip.compress(sitemap('sitemap', [
+        'http://lyrics.wikia.com/sitemap-newsitemapxml-NS_0-p1.xml.gz',
+        'http://lyrics.wikia.com/sitemap-newsitemapxml-NS_0-p2.xml'
+    ]).encode('utf-8')),
+    'http://lyrics.wikia.com/sitemap-newsitemapxml-NS_0-p1.xml.gz': gzip.compress(sitemap('url', [
+        'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.',
+        'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Ready_To_Die_(1994)',
+        'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Things_Done_Changed',
+        'http://lyrics.wikia.com/wiki/Category:Hip_Hop',
+    ]).encode('utf-8')),
+    'http://lyrics.wikia.com/sitemap-newsitemapxml-NS_0-p2.xml': sitemap('url', [
+        'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Gimme_The_Loot',
+        'http://lyrics.wikia.com/wiki/2Pac:Changes',
+    ]),
+})
+
+
+class TestSitemaps:
+    """Tests for the discovery of lyrics pages from sitemaps."""
+
+    def test_iter_sitemap_entries(self):
+        body = gzip.compress(sitemap('url', ['http://a/{0}'.format(i) for i in range(100)]).encode('utf-8'))
+        chunks = [body[i:i + 50] for i in range(0, len(body), 50)]
+        entries = list(iter_sitemap_entries(chunks))
+        assert len(entries) == 100
+        assert entries[0] == ('url', 'http://a/0')
+        assert list(iter_sitemap_entries([sitemap('sitemap', ['http://a/1.xml']).encode('utf-8')])) == \
+            [('sitemap', 'http://a/1.xml')]
+
+    def test_discover_songs(self):
+        provider = offline_provider(LyricWiki, lyricwiki_sitemap_pages)
+        songs = list(provider.discover_songs())
+        assert [song[1:] for song in songs] == [('The Notorious B.I.G.', 'Unknown', 'Things Done Changed'),
+                                                ('The Notorious B.I.G.', 'Unknown', 'Gimme The Loot'),
+                                                ('2Pac', 'Unknown', 'Changes')]
+        assert provider.metrics['sitemaps_read'] == 3
+        assert [song[3] for song in provider.discover_songs('2Pac')] == ['Changes']
+
+    def test_get_sitemap_lyrics(self):
+        provider = offline_provider(LyricWiki, lyricwiki_sitemap_pages)
+        discographies = provider.get_sitemap_lyrics('The Notorious B.I.G.')
+        assert len(discographies) == 1
+        assert discographies[0].artist == 'The Notorious B.I.G.'
+        songs = discographies[0].albums[0].songs
+        assert sorted(song.title for song in songs) == ['Gimme The Loot', 'Things Done Changed']
+        assert all(song.lyrics for song in songs)
+        # Neither artist nor album pages are downloaded.
+        assert provider_strings['LyricWiki']['artist_url'] not in provider.session.requested
+
+    def test_songs_are_yielded_as_they_are_downloaded(self):
+        provider = offline_provider(LyricWiki, lyricwiki_sitemap_pages)
+        discover_songs = provider.discover_songs
+        events = []
+
+        def slow_discovery(artist=None):
+            for url, song_artist, album_title, song_title in discover_songs(artist):
+                gevent.sleep(0.02)
+                events.append('discovered {0}'.format(song_title))
+                yield url, song_artist, album_title, song_title
+
+        provider.discover_songs = slow_discovery
+        for song in provider.iter_sitemap_songs('The Notorious B.I.G.'):
+            events.append('downloaded {0}'.format(song.title))
+        assert events == ['discovered Things Done Changed', 'downloaded Things Done Changed',
+                          'discovered Gimme The Loot', 'downloaded Gimme The Loot']
+
+    def test_no_sitemaps(self):
+        provider = offline_provider(Genius, genius_pages)
+        assert provider.get_sitemap_lyrics() == []
+        assert provider.session.requested == []
+
+
+class TestServer:
+    """Tests for the lookup server."""
+
+    query = {'artist': 'The Notorious B.I.G.', 'album': 'Ready to Die', 'song': 'Things Done Changed'}
+
+    def get(self, server, path, query=None):
+        environ = {'PATH_INFO': path, 'QUERY_STRING': urlencode(query or {})}
+        setup_testing_defaults(environ)
+        statuses = []
+        body = b''.join(server(environ, lambda status, headers: statuses.append(status)))
+        return int(statuses[0].split()[0]), json.loads(body.decode('utf-8'))
+
+    def server(self, session):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = session
+        return LyricsServer(providers={'lyricwiki': provider})
+
+    def test_lookup(self):
+        server = self.server(FakeSession(lyricwiki_pages))
+        status, payload = self.get(server, '/lyrics', self.query)
+        assert status == 200
+        assert payload['artist'] == 'The Notorious B.I.G.'
+        song = payload['albums'][0]['songs'][0]
+        assert song['title'] == 'Things Done Changed'
+        assert song['lyrics']
+
+    def test_lookups_are_cached(self):
+        server = self.server(FakeSession(lyricwiki_pages))
+        self.get(server, '/lyrics', self.query)
+        query = dict(self.query, artist='the notorious b.i.g.')
+        assert self.get(server, '/lyrics', query)[0] == 200
+        # The artist page and the song, downloaded once.
+        assert len(server.providers['lyricwiki'].session.requested) == 2
+        assert server.metrics['cache_hits'] == 1
+
+    def test_concurrent_lookups_are_coalesced(self):
+        server = self.server(SlowSession(lyricwiki_pages))
+        lookups = [gevent.spawn(self.get, server, '/lyrics', self.query) for i in range(5)]
+        gevent.joinall(lookups)
+        assert all(lookup.value[0] == 200 for lookup in lookups)
+        assert len(server.providers['lyricwiki'].session.requested) == 2
+        assert server.metrics['requests_coalesced'] == 4
+
+    def test_errors(self):
+        server = self.server(FakeSession(lyricwiki_pages))
+        assert self.get(server, '/lyrics')[0] == 400
+        assert self.get(server, '/lyrics', {'artist': '2Pac', 'provider': 'Unknown'})[0] == 400
+        assert self.get(server, '/lyrics', {'artist': 'Nobody'})[0] == 404
+        assert self.get(server, '/unknown')[0] == 404
+
+    def test_stats(self):
+        server = self.server(FakeSession(lyricwiki_pages))
+        self.get(server, '/lyrics', self.query)
+        self.get(server, '/lyrics', self.query)
+        status, stats = self.get(server, '/stats')
+        assert status == 200
+        assert stats['lookups'] == 2
+        assert stats['latency']['p50'] is not None
+        assert stats['cache'] == {'size': 1, 'hits': 1, 'misses': 1, 'coalesced': 0, 'uncached': 0}
+        assert stats['providers']['LyricWiki']['requests_sent'] == 2
+
+    album_query = {'artist': 'The Notorious B.I.G.', 'album': 'Ready to Die'}
+    song_url = 'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Gimme_The_Loot'
+
+    def test_deadline_results_are_not_cached(self):
+        server = self.server(HangingSession(lyricwiki_pages, {self.song_url}))
+        server.deadline = 0.5
+        status, payload = self.get(server, '/lyrics', self.album_query)
+        assert status == 200
+        assert [song['title'] for song in payload['albums'][0]['songs']] == ['Things Done Changed']
+        assert len(server.cache) == 0
+        assert server.metrics['uncached_lookups'] == 1
+
+    def test_failed_lookups_are_not_cached(self):
+        server = self.server(FailingSession(lyricwiki_pages, 503))
+        assert self.get(server, '/lyrics', self.album_query)[0] == 404
+        server.providers['lyricwiki'].session.failing = False
+        assert self.get(server, '/lyrics', self.album_query)[0] == 200
+        assert server.metrics['cache_hits'] == 0
+
+    def test_lookup_errors(self):
+        server = self.server(FakeSession(lyricwiki_pages))
+        provider = server.providers['lyricwiki']
+
+        def get_lyrics(*args, **kwargs):
+            gevent.sleep(0.05)
+            raise AttributeError("'NoneType' object has no attribute 'find_all'")
+
+        provider.get_lyrics = get_lyrics
+        status, payload = self.get(server, '/lyrics', self.query)
+        assert status == 500
+        assert 'find_all' in payload['error']
+        assert len(server.cache) == 0
+        # A lookup waiting for an interrupted one is answered with a 503.
+        lookups = [gevent.spawn(self.get, server, '/lyrics', self.query) for i in range(2)]
+        gevent.sleep(0.01)
+        lookups[0].kill()
+        lookups[1].join()
+        assert lookups[1].value == (503, {'error': 'The lookup of The Notorious B.I.G. was interrupted'})
+
+    def test_partial_results_are_not_cached(self):
+        server = self.server(FlakySession(lyricwiki_pages, {self.song_url}, failures=10))
+        server.providers['lyricwiki'].retry_backoff = 0.01
+        status, payload = self.get(server, '/lyrics', self.album_query)
+        assert status == 200
+        assert [song['title'] for song in payload['albums'][0]['songs']] == ['Things Done Changed']
+        assert len(server.cache) == 0
+        assert self.get(server, '/lyrics', self.album_query)[0] == 200
+        assert server.metrics['cache_hits'] == 0
+
+    def test_incomplete_discography(self):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = HangingSession(lyricwiki_pages, {self.song_url})
+        assert not provider.get_lyrics(real_singer['name'], 'Ready to Die', deadline=0.5).complete
+        provider.session = FakeSession(lyricwiki_pages)
+        assert provider.get_lyrics(real_singer['name'], 'Ready to Die').complete
+
+    def test_result_cache(self):
+        cache = ResultCache(size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+        cache = ResultCache(ttl=-1)
+        cache.set('a', 1)
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+
+class TestProfiling:
+    """Tests for the crawl profiler."""
+
+    def test_stages(self, tmp_path):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        with Profiler() as profiler:
+            discography = provider.get_lyrics(real_singer['name'])
+            discography.save(folder=str(tmp_path))
+        assert profiling._active is None
+        assert set(profiler.stages) == {'request', 'artist', 'albums', 'song', 'parse', 'save'}
+        assert profiler.stages['artist'].calls == 1
+        assert profiler.stages['request'].calls == len(provider.session.requested)
+        assert profiler.stages['save'].calls == len(set(discography.iter_songs()))
+        assert all(stats.seconds > 0 for stats in profiler.stages.values())
+        assert profiler.peak_memory > 0
+        assert not any(profiler.stacks.values())
+
+    def test_save(self, tmp_path):
+        path = str(tmp_path / 'crawl')
+        with Profiler(path, interval=0.001):
+            offline_provider(LyricWiki, lyricwiki_pages).get_lyrics(real_singer['name'])
+        with open(path + '.txt', encoding='utf-8') as file:
+            summary = file.read()
+        assert 'artist' in summary and 'Largest allocations' in summary and 'cumulative' in summary
+        assert os.path.exists(path + '.prof')
+        with open(path + '.folded', encoding='utf-8') as file:
+            for line in file:
+                stack, count = line.rsplit(' ', 1)
+                assert int(count) > 0
+
+    def test_no_profiler(self):
+        @profiled('test')
+        def function(value):
+            return value
+        with stage('test'):
+            assert function(1) == 1
+        with Profiler() as profiler:
+            assert function(2) == 2
+        assert profiler.stages['test'].calls == 1
+
+    def test_single_profiler(self):
+        with Profiler():
+            with pytest.raises(RuntimeError):
+                Profiler().start()
+
+    def test_cli_profile(self, tmp_path):
+        path = str(tmp_path / 'index')
+        result = CliRunner().invoke(cli.main, ['--profile', path, 'index', 'Unknown', str(tmp_path / 'index.json')])
+        assert result.exit_code == 0
+        assert os.path.exists(path + '.txt') and os.path.exists(path + '.folded')
+        result = CliRunner().invoke(cli.main, ['--profile', path, real_singer['name'], '--help'])
+        assert result.exit_code == 0
+        assert 'ARTIST_NAME' in result.output
+
+
+class TestWarmUp:
+    """Tests for the DNS cache, the shared TLS context and the connection warm-up."""
+
+    @pytest.fixture
+    def server(self):
+        from gevent.pywsgi import WSGIServer
+
+        def application(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+            return [b'ok']
+
+        server = WSGIServer(('127.0.0.1', 0), application, log=None)
+        server.start()
+        yield 'http://localhost:{0}/'.format(server.server_port)
+        server.stop()
+
+    def session(self):
+        session = urllib3.PoolManager(maxsize=4)
+        session.pool_classes_by_scheme = cached_dns_pool_classes
+        return session
+
+    def test_dns_cache(self, monkeypatch):
+        lookups = []
+
+        def getaddrinfo(host, port, *args):
+            lookups.append(host)
+            gevent.sleep(0.01)
+            return [(2, 1, 6, '', ('10.0.0.1', port)), (2, 1, 6, '', ('10.0.0.1', port)),
+                    (2, 1, 6, '', ('10.0.0.2', port))]
+
+        monkeypatch.setattr('socket.getaddrinfo', getaddrinfo)
+        cache = DnsCache()
+        resolutions = [gevent.spawn(cache.resolve, 'example.com', 443) for i in range(3)]
+        gevent.joinall(resolutions)
+        assert [resolution.value for resolution in resolutions] == [['10.0.0.1', '10.0.0.2']] * 3
+        assert cache.resolve('example.com', 443) == ['10.0.0.1', '10.0.0.2']
+        assert lookups == ['example.com']
+        assert cache.metrics['dns_cache_hits'] == 1
+        assert cache.metrics['requests_coalesced'] == 2
+        cache.forget('example.com', 443)
+        cache.ttl = -1
+        cache.resolve('example.com', 443)
+        cache.resolve('example.com', 443)
+        assert lookups == ['example.com'] * 3
+
+    def test_requests_use_dns_cache(self, server):
+        port = urllib3.util.parse_url(server).port
+        dns_cache.forget('localhost', port)
+        session = self.session()
+        assert session.request('GET', server).data == b'ok'
+        assert ('localhost', port) in dns_cache.entries
+
+    def test_unreachable_addresses_are_skipped(self, server):
+        port = urllib3.util.parse_url(server).port
+        # Nothing listens on 127.0.0.2, so its connections are refused.
+        dns_cache.entries[('localhost', port)] = (time.time() + 60, ['127.0.0.2', '127.0.0.1'])
+        assert self.session().request('GET', server, retries=False).data == b'ok'
+        assert dns_cache.entries[('localhost', port)][1] == ['127.0.0.2', '127.0.0.1']
+        dns_cache.entries[('localhost', port)] = (time.time() + 60, ['127.0.0.2', '127.0.0.3'])
+        with pytest.raises(urllib3.exceptions.NewConnectionError):
+            self.session().request('GET', server, retries=False)
+        assert ('localhost', port) not in dns_cache.entries
+
+    def test_warm_up(self, server):
+        session = self.session()
+        assert warm_up(session, server, 3) == 3
+        pool = session.connection_from_url(server)
+        assert pool.num_connections == 3
+        requests = [gevent.spawn(session.request, 'GET', server) for i in range(3)]
+        gevent.joinall(requests)
+        assert all(request.value.data == b'ok' for request in requests)
+        # The requests reused the warm connections.
+        assert pool.num_connections == 3
+
+    def test_provider_sessions(self, server):
+        provider = LyricWiki()
+        assert provider.session.connection_pool_kw['ssl_context'] is ssl_context()
+        assert provider.session.pool_classes_by_scheme is cached_dns_pool_classes
+        provider._warm_up(server)
+        gevent.sleep(0.1)
+        assert provider.metrics['connections_prewarmed'] == provider.preconnections
+        assert offline_provider(LyricWiki, lyricwiki_pages).get_artist_page(real_singer['name'])
+
+
+class FlakySession(FakeSession):
+    """
+    FakeSession answering the first requests of some urls with a 503.
+
+    :param pages: dict.
+        Maps urls to html strings.
+    :param flaky: set.
+        Urls failing.
+    :param failures: integer.
+        Number of failed requests of each url before it is answered.
+    """
+
+    def __init__(self, pages, flaky, failures=1):
+        super(FlakySession, self).__init__(pages)
+        self.flaky = flaky
+        self.failures = Counter(dict((url, failures) for url in flaky))
+
+    def request(self, method, url, **kwargs):
+        if self.failures[unquote(url)] > 0:
+            self.failures[unquote(url)] -= 1
+            self.requested.append(unquote(url))
+            return HTTPResponse(body=io.BytesIO(b'Service Unavailable'), status=503, preload_content=False)
+        return super(FlakySession, self).request(method, url, **kwargs)
+
+
+class TestDeadLetters:
+    """Tests for the dead-letter queue and the retry pass."""
+
+    song_urls = [url for url in lyricwiki_pages if LyricWiki()._parse_song_url(url)]
+
+    def crawl(self, session, dead_letters=None):
+        provider = offline_provider(LyricWiki, {})
+        provider.session = session
+        provider.retry_backoff = 0.01
+        if dead_letters is not None:
+            provider.dead_letters = dead_letters
+        return provider, provider.get_lyrics(real_singer['name'])
+
+    def layout(self, discography):
+        return [(album.title, [song.title for song in album]) for album in discography]
+
+    @pytest.mark.parametrize('flaky', [1, 'all'])
+    def test_failed_songs_are_retried(self, flaky):
+        expected = self.layout(self.crawl(FakeSession(lyricwiki_pages))[1])
+        flaky_urls = set(self.song_urls if flaky == 'all' else self.song_urls[:flaky])
+        provider, discography = self.crawl(FlakySession(lyricwiki_pages, flaky_urls))
+        assert self.layout(discography) == expected
+        assert len(provider.dead_letters) == 0
+        assert provider.metrics['dead_letters_recovered'] == len(flaky_urls)
+
+    def test_failures_are_kept(self, tmp_path):
+        failing_url = self.song_urls[0]
+        provider, discography = self.crawl(FlakySession(lyricwiki_pages, {failing_url}, failures=10))
+        entry = provider.dead_letters.get(failing_url)
+        assert entry['reason'] == 'Http status 503'
+        assert entry['attempts'] == 1 + provider.retry_attempts
+        assert entry['artist'] == real_singer['name']
+        assert provider.session.requested.count(failing_url) == 1 + provider.retry_attempts
+        path = str(tmp_path / 'failed.json')
+        provider.dead_letters.save(path)
+        # The next run downloads the song and forgets the failure.
+        dead_letters = DeadLetterQueue.load(path)
+        assert failing_url in dead_letters
+        provider, discography = self.crawl(FakeSession(lyricwiki_pages), dead_letters)
+        assert failing_url not in dead_letters
+
+    def test_retry_dead_letters(self):
+        dead_letters = DeadLetterQueue()
+        dead_letters.add(self.song_urls[0], 'LyricWiki', 'Song', real_singer['name'], 'Album', 'No response')
+        dead_letters.add(self.song_urls[1], 'Genius', 'Song', real_singer['name'], 'Album', 'No response')
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        provider.dead_letters = dead_letters
+        provider.retry_backoff = 0.01
+        recovered = provider.retry_dead_letters()
+        assert list(recovered) == [self.song_urls[0]]
+        assert recovered[self.song_urls[0]].album == 'Album'
+        assert list(dead_letters.entries) == [self.song_urls[1]]
+
+    def test_missing_pages_are_not_queued(self, tmp_path):
+        provider = offline_provider(LyricWiki, {})
+        provider.get_song(real_singer['name'], 'Unknown Song')
+        assert len(provider.dead_letters) == 0
+        assert len(DeadLetterQueue.load(str(tmp_path / 'missing.json'))) == 0
+
+
+class TestLibrary:
+    """Tests for the music library scanner."""
+
+    tracks = [('The Notorious B.I.G.', 'Ready to Die', '01 - Things Done Changed.mp3'),
+              ('The Notorious B.I.G.', 'Ready to Die', '02 - Gimme The Loot.mp3'),
+              ('The Notorious B.I.G.', 'Ready to Die', 'cover.jpg'),
+              ('The Notorious B.I.G.', 'Life After Death', '1-05. Hypnotize.flac'),
+              ('The Notorious B.I.G.', 'Life After Death', '1-06. Unknown Song.flac')]
+
+    @pytest.fixture
+    def library(self, tmp_path):
+        for artist, album, file_name in self.tracks:
+            folder = tmp_path / artist / album
+            folder.mkdir(parents=True, exist_ok=True)
+            (folder / file_name).write_bytes(b'')
+        return str(tmp_path)
+
+    def test_scan_library(self, library):
+        tracks = list(scan_library(library))
+        assert [(track.artist, track.album, track.title) for track in tracks] == [
+            ('The Notorious B.I.G.', 'Life After Death', 'Hypnotize'),
+            ('The Notorious B.I.G.', 'Life After Death', 'Unknown Song'),
+            ('The Notorious B.I.G.', 'Ready to Die', 'Things Done Changed'),
+            ('The Notorious B.I.G.', 'Ready to Die', 'Gimme The Loot')]
+        artists = group_tracks(tracks)
+        assert list(artists) == ['The Notorious B.I.G.']
+        assert list(artists['The Notorious B.I.G.']) == ['Life After Death', 'Ready to Die']
+
+    def test_fill_library(self, library):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        stats = fill_library(library, provider)
+        assert (stats['tracks'], stats['found'], stats['missing']) == (4, 3, 1)
+        lyrics_path = os.path.join(library, 'The Notorious B.I.G.', 'Ready to Die', '01 - Things Done Changed.txt')
+        with codecs.open(lyrics_path, 'r', encoding='utf-8') as file:
+            assert file.read()
+        # The artist page is fetched once for both albums, then only the songs of the library.
+        assert provider.session.requested.count(provider_strings['LyricWiki']['artist_url']) == 1
+        assert len(provider.session.requested) == 5
+        stats = fill_library(library, provider)
+        assert (stats['skipped'], stats['found'], stats['missing']) == (3, 0, 1)
+
+    def test_only_wanted_songs_are_downloaded(self):
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        found = provider.get_library_lyrics(real_singer['name'], {'Ready to Die': ['Things Done Changed']})
+        assert list(found) == [('Ready to Die', 'Things Done Changed')]
+        assert provider.session.requested == [provider_strings['LyricWiki']['artist_url'],
+                                              'http://lyrics.wikia.com/wiki/The_Notorious_B.I.G.:Things_Done_Changed']
+
+    def test_failed_artist(self, library, tmp_path):
+        (tmp_path / 'Broken Artist' / 'Album').mkdir(parents=True)
+        (tmp_path / 'Broken Artist' / 'Album' / '01 - Song.mp3').write_bytes(b'')
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        get_library_lyrics = provider.get_library_lyrics
+
+        def failing_lookup(artist, albums):
+            if artist == 'Broken Artist':
+                raise ValueError('Unexpected page layout')
+            return get_library_lyrics(artist, albums)
+
+        provider.get_library_lyrics = failing_lookup
+        stats = fill_library(library, provider)
+        assert (stats['tracks'], stats['found'], stats['missing'], stats['failed_artists']) == (5, 3, 2, 1)
+
+    def test_songs_without_album(self, tmp_path):
+        (tmp_path / 'The Notorious B.I.G.').mkdir()
+        (tmp_path / 'The Notorious B.I.G.' / 'Things Done Changed.mp3').write_bytes(b'')
+        provider = offline_provider(LyricWiki, lyricwiki_pages)
+        assert fill_library(str(tmp_path), provider)['found'] == 1
+        assert provider_strings['LyricWiki']['artist_url'] not in provider.session.requested
+
+
 class TestCli:
     """Tests for Command Line Interface."""
 